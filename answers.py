@@ -0,0 +1,51 @@
+"""Разбор команд ответа админа: /заявка, /жалоба, /покупка.
+
+Первая строка начинается с номеров заявок: "5", "#5", "5-8,12". Каждый
+следующий ответ в том же сообщении — отдельная строка с решёткой перед
+номером ("#3 текст"). Остальные строки продолжают текст предыдущего ответа,
+даже если начинаются с цифры ("3 сделки прошли без проблем").
+"""
+import re
+from typing import List, Tuple
+
+IDS = r"\d+(?:\s*-\s*\d+)?(?:\s*,\s*\d+(?:\s*-\s*\d+)?)*"
+FIRST_ANSWER_LINE = re.compile(rf"^#?({IDS})\s+(.+)$")
+NEXT_ANSWER_LINE = re.compile(rf"^#({IDS})\s+(.+)$")
+MAX_BULK_ANSWERS = 500
+
+
+def parse_ids(spec: str) -> List[int]:
+    ids = []
+    for part in spec.split(","):
+        if "-" in part:
+            first, last = (int(x) for x in part.split("-"))
+            if last < first or last - first >= MAX_BULK_ANSWERS:
+                raise ValueError(f"неверный диапазон {part.strip()}")
+            ids.extend(range(first, last + 1))
+        else:
+            ids.append(int(part))
+    return ids
+
+
+def parse_answers(body: str) -> List[Tuple[int, str]]:
+    """Разбирает ответы в [(номер, текст)]. Повторный номер получает первый ответ."""
+    groups = []
+    for line in body.splitlines():
+        match = (NEXT_ANSWER_LINE if groups else FIRST_ANSWER_LINE).match(line.strip())
+        if match:
+            groups.append((parse_ids(match.group(1)), [match.group(2)]))
+        elif groups:
+            groups[-1][1].append(line)
+        elif line.strip():
+            raise ValueError("первая строка должна начинаться с номера")
+
+    answers, seen = [], set()
+    for ids, lines in groups:
+        text = "\n".join(lines).strip()
+        for request_id in ids:
+            if request_id not in seen:
+                seen.add(request_id)
+                answers.append((request_id, text))
+    if len(answers) > MAX_BULK_ANSWERS:
+        raise ValueError(f"не больше {MAX_BULK_ANSWERS} заявок за раз")
+    return answers
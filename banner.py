@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
+
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+BANNER_FILE_ID_KEY = "banner_file_id"
+BANNER_FILE_UNIQUE_ID_KEY = "banner_file_unique_id"
+# Ошибки Telegram, после которых сохранённый file_id больше не годится. Остальные
+# BadRequest (чат не найден, сообщение не редактируется, кривая разметка подписи)
+# к баннеру не относятся и пробрасываются как есть
+FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file", "file_id")
+
+
+def is_file_id_error(error: TelegramBadRequest) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in FILE_ID_ERRORS)
+
+
+class BannerCache:
+    """Хранит file_id загруженного баннера, чтобы не заливать banner.jpg при каждом показе меню.
+
+    file_id сохраняется в таблицу settings и переживает перезапуск. Вместе с ним
+    хранится file_unique_id: file_id одного и того же фото в разных сообщениях
+    бывает разным, узнать баннер в сообщении можно только по file_unique_id.
+    Замена и удаление баннера идут под общей блокировкой, а счётчик поколений
+    не даёт запоздавшей загрузке записать file_id уже удалённого баннера.
+    """
+
+    def __init__(self, db: Database, path: str):
+        self.db = db
+        self.path = path
+        self.file_id: Optional[str] = None
+        self.file_unique_id: Optional[str] = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        self.file_id = await self.db.settings.get(BANNER_FILE_ID_KEY)
+        self.file_unique_id = await self.db.settings.get(BANNER_FILE_UNIQUE_ID_KEY)
+        if self.file_id and not self.exists():
+            await self.invalidate()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def available(self) -> bool:
+        """Баннер есть: уже загружен в Telegram или лежит файлом и загрузится при первом показе."""
+        return bool(self.file_id) or self.exists()
+
+    def is_banner(self, message: Message) -> bool:
+        """В сообщении уже стоит текущий баннер."""
+        return bool(message.photo and self.file_unique_id
+                    and message.photo[-1].file_unique_id == self.file_unique_id)
+
+    async def _set_ids(self, file_id: Optional[str], file_unique_id: Optional[str]) -> None:
+        self.file_id, self.file_unique_id = file_id, file_unique_id
+        for key, value in ((BANNER_FILE_ID_KEY, file_id), (BANNER_FILE_UNIQUE_ID_KEY, file_unique_id)):
+            if value:
+                await self.db.settings.set(key, value)
+            else:
+                await self.db.settings.delete(key)
+
+    async def invalidate(self, stale_file_id: Optional[str] = None) -> None:
+        async with self._lock:
+            if stale_file_id is not None and self.file_id != stale_file_id:
+                return
+            self._generation += 1
+            await self._set_ids(None, None)
+
+    async def _remember(self, message: Message, generation: int) -> None:
+        if not message.photo:
+            return
+        async with self._lock:
+            if generation != self._generation:
+                return
+            await self._set_ids(message.photo[-1].file_id, message.photo[-1].file_unique_id)
+
+    async def send(self, bot: Bot, chat_id: int, caption: str, **kwargs) -> Optional[Message]:
+        """Отправляет баннер с подписью. Возвращает None, если баннера нет."""
+        file_id = self.file_id
+        if file_id:
+            try:
+                return await bot.send_photo(chat_id, file_id, caption=caption, **kwargs)
+            except TelegramBadRequest as e:
+                if not is_file_id_error(e):
+                    raise
+                logger.warning("Telegram отклонил file_id баннера, загружаю заново: %s", e)
+                await self.invalidate(file_id)
+
+        if not self.exists():
+            return None
+
+        generation = self._generation
+        message = await bot.send_photo(chat_id, FSInputFile(self.path), caption=caption, **kwargs)
+        await self._remember(message, generation)
+        return message
+
+    async def edit(self, bot: Bot, chat_id: int, message_id: int, caption: str,
+                   parse_mode: Optional[str] = None, **kwargs) -> bool:
+        """Ставит баннер с подписью в сообщение с фото. False — если баннера нет."""
+        file_id = self.file_id
+        generation = self._generation
+        if file_id:
+            try:
+                message = await bot.edit_message_media(
+                    media=InputMediaPhoto(media=file_id, caption=caption, parse_mode=parse_mode),
+                    chat_id=chat_id, message_id=message_id, **kwargs,
+                )
+            except TelegramBadRequest as e:
+                if not is_file_id_error(e):
+                    raise
+                logger.warning("Telegram отклонил file_id баннера, загружаю заново: %s", e)
+                await self.invalidate(file_id)
+            else:
+                # Для баннера, сохранённого без file_unique_id, он запомнится здесь
+                if isinstance(message, Message) and not self.file_unique_id:
+                    await self._remember(message, generation)
+                return True
+
+        if not self.exists():
+            return False
+
+        generation = self._generation
+        message = await bot.edit_message_media(
+            media=InputMediaPhoto(media=FSInputFile(self.path), caption=caption, parse_mode=parse_mode),
+            chat_id=chat_id, message_id=message_id, **kwargs,
+        )
+        if isinstance(message, Message):
+            await self._remember(message, generation)
+        return True
+
+    async def replace(self, bot: Bot, photo) -> None:
+        """Скачивает новое фото баннера (PhotoSize) и сразу запоминает его file_id."""
+        async with self._lock:
+            self._generation += 1
+            file = await bot.get_file(photo.file_id)
+            tmp_path = self.path + ".tmp"
+            await bot.download_file(file.file_path, tmp_path)
+            os.replace(tmp_path, self.path)
+            await self._set_ids(photo.file_id, photo.file_unique_id)
+
+    async def remove(self) -> bool:
+        async with self._lock:
+            self._generation += 1
+            await self._set_ids(None, None)
+            if not self.exists():
+                return False
+            os.remove(self.path)
+            return True
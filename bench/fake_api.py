@@ -0,0 +1,149 @@
+"""Локальная замена Bot API для нагрузочных тестов.
+
+Отвечает на методы бота правдоподобными результатами, с настраиваемой
+задержкой и долей ответов 429, и считает вызовы по методам:
+
+    python bench/fake_api.py --port 8081 --latency 0.05 --jitter 0.02 --rate-429 0.01
+
+Бота можно направить на неё переменной TELEGRAM_API_URL=http://127.0.0.1:8081.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+# Методы, которые возвращают сообщение
+MESSAGE_METHODS = {
+    "sendmessage", "sendphoto", "senddocument", "editmessagetext",
+    "editmessagecaption", "editmessagemedia", "editmessagereplymarkup",
+}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_429: float = 0.0,
+                 retry_after: int = 1, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._message_ids = itertools.count(1_000_000)
+        self._file_ids = itertools.count(1)
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/file/bot{token}/{path:.*}", self.download)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.throttled = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = await self._params(request)
+
+        delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.rate_429 and self._random.random() < self.rate_429:
+            self.throttled += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        return web.json_response({"ok": True, "result": self._result(method.lower(), params)})
+
+    async def download(self, request: web.Request) -> web.Response:
+        return web.Response(body=b"\xff\xd8\xff\xd9", content_type="image/jpeg")
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": dict(self.calls), "throttled": self.throttled})
+
+    @staticmethod
+    async def _params(request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        return {key: value for key, value in form.items() if isinstance(value, str)}
+
+    def _result(self, method: str, params: dict):
+        if method in MESSAGE_METHODS:
+            return self._message(method, params)
+        if method == "getme":
+            return BOT_USER
+        if method == "getfile":
+            return {"file_id": params.get("file_id"), "file_unique_id": "u", "file_path": "photos/banner.jpg"}
+        if method == "getwebhookinfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        if method == "getupdates":
+            return []
+        return True
+
+    def _message(self, method: str, params: dict) -> dict:
+        chat_id = int(params.get("chat_id") or 0)
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if method in ("sendphoto", "editmessagemedia", "editmessagecaption"):
+            message["photo"] = [{"file_id": f"FAKE{next(self._file_ids)}", "file_unique_id": "p",
+                                 "width": 1, "height": 1}]
+            message["caption"] = params.get("caption") or ""
+        elif method == "senddocument":
+            message["document"] = {"file_id": f"FAKE{next(self._file_ids)}", "file_unique_id": "d"}
+        else:
+            message["text"] = params.get("text") or ""
+        if params.get("reply_markup"):
+            markup = params["reply_markup"]
+            message["reply_markup"] = json.loads(markup) if isinstance(markup, str) else markup
+        return message
+
+
+async def serve(api: FakeBotAPI, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(api.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки, с")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency, args.jitter, args.rate_429, args.retry_after)
+
+    async def run():
+        await serve(api, args.host, args.port)
+        print(f"Фейковый Bot API слушает http://{args.host}:{args.port}")
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Нагрузочный прогон bot.py против локального фейкового Bot API.
+
+Поднимает bench/fake_api.py, импортирует bot.py со своей временной базой
+и прогоняет через диспетчер сценарий из bench/updates.py. Сессии разных
+пользователей идут параллельно, обновления внутри сессии — по очереди.
+
+    python bench/run.py mixed --users 1000 --concurrency 100 --latency 0.03 --rate-429 0.01
+
+Печатает обновления/с, p50/p95/p99 времени обработки, время в БД и число
+вызовов Bot API на обновление; --json сохраняет те же числа для сравнения прогонов.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_api import FakeBotAPI, serve  # noqa: E402
+from updates import SCENARIOS  # noqa: E402
+
+ADMIN_ID = 1
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run(args) -> dict:
+    api = FakeBotAPI(args.latency, args.jitter, args.rate_429, args.retry_after, seed=args.seed)
+    runner = await serve(api, "127.0.0.1", args.port)
+    workdir = tempfile.mkdtemp(prefix="orgazm-bench-")
+
+    # Переменные окружения задаются до импорта bot.py: load_dotenv их не перезаписывает,
+    # так что настоящий токен из .env в прогон не попадает
+    os.environ.update(
+        BOT_TOKEN="42:BENCH",
+        ADMIN_ID=str(ADMIN_ID),
+        DB_PATH=os.path.join(workdir, "bench.db"),
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.port}",
+    )
+    os.chdir(workdir)
+    import bot
+    from aiogram.types import Update
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    sessions = [
+        [Update.model_validate(update) for update in session]
+        for session in SCENARIOS[args.scenario](args.users, random.Random(args.seed))
+    ]
+    total_updates = sum(len(session) for session in sessions)
+
+    await bot.dp.emit_startup(bot=bot.bot)
+    api.reset()
+    db_time, db_transactions = bot.db.busy_time, bot.db.transactions
+
+    latencies: List[float] = []
+    errors = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def play(session) -> None:
+        async with semaphore:
+            for update in session:
+                started = time.perf_counter()
+                try:
+                    await bot.dp.feed_update(bot.bot, update)
+                except Exception as e:
+                    errors[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(play(session) for session in sessions))
+    elapsed = time.perf_counter() - started
+
+    db_time = bot.db.busy_time - db_time
+    db_transactions = bot.db.transactions - db_transactions
+    api_calls = dict(api.calls)
+    throttled = api.throttled
+    outbox_backlog = await bot.db.run(
+        lambda conn: conn.execute("SELECT COUNT(*) FROM outbox WHERE status='pending'").fetchone()[0]
+    )
+
+    await bot.dp.emit_shutdown(bot=bot.bot)
+    await bot.bot.session.close()
+    await runner.cleanup()
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "scenario": args.scenario,
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "updates": total_updates,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(total_updates / elapsed, 1) if elapsed else 0,
+        "latency_ms": {
+            f"p{p}": round(percentile(latencies, p) * 1000, 2) for p in (50, 95, 99)
+        } | {"max": round(max(latencies, default=0) * 1000, 2)},
+        "db_ms_per_update": round(db_time * 1000 / total_updates, 3),
+        "db_transactions_per_update": round(db_transactions / total_updates, 2),
+        "api_calls_per_update": round(sum(api_calls.values()) / total_updates, 2),
+        "api_calls": api_calls,
+        "api_429": throttled,
+        "outbox_backlog": outbox_backlog,
+        "errors": dict(errors),
+    }
+
+
+def print_report(result: dict) -> None:
+    latency = result["latency_ms"]
+    print(f"Сценарий: {result['scenario']}, пользователей: {result['users']}, "
+          f"параллельно: {result['concurrency']}")
+    print(f"Обновлений: {result['updates']} за {result['seconds']} с — {result['updates_per_second']} в секунду")
+    print(f"Время обработки, мс: p50 {latency['p50']}, p95 {latency['p95']}, "
+          f"p99 {latency['p99']}, max {latency['max']}")
+    print(f"БД: {result['db_ms_per_update']} мс и {result['db_transactions_per_update']} транзакций на обновление")
+    print(f"Bot API: {result['api_calls_per_update']} вызовов на обновление, ответов 429: {result['api_429']}")
+    for method, count in sorted(result["api_calls"].items(), key=lambda item: -item[1]):
+        print(f"  {method}: {count}")
+    print(f"Осталось в очереди уведомлений: {result['outbox_backlog']}")
+    if result["errors"]:
+        print(f"Ошибки обработчиков: {result['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки, с")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--keep", action="store_true", help="не удалять временную базу")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Генераторы синтетических обновлений для нагрузочных тестов.
+
+Каждый сценарий возвращает список сессий: сессия — обновления одного
+пользователя, которые нужно обрабатывать строго по очереди (от них зависит
+состояние FSM). Разные сессии можно гнать параллельно.
+
+    python bench/updates.py vouch --users 500 > updates.jsonl
+
+Такой файл подходит для tools/post_updates.py (порядок внутри сессии там
+соблюдается только при --concurrency 1).
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+from typing import Callable, Dict, List
+
+Session = List[dict]
+
+FIRST_USER_ID = 10_000_000
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"}
+
+
+def message(user_id: int, text: str) -> dict:
+    payload = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        payload["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": payload}
+
+
+def callback(user_id: int, data: str) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "chat_instance": str(user_id),
+            "from": _user(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(_message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "menu",
+            },
+        },
+    }
+
+
+# ============ СЦЕНАРИИ ============
+def start_storm(users: int, rng: random.Random, first_user_id: int = FIRST_USER_ID) -> List[Session]:
+    """Все пользователи одновременно жмут /start."""
+    return [[message(first_user_id + i, "/start")] for i in range(users)]
+
+
+def vouch_flow(users: int, rng: random.Random, first_user_id: int = FIRST_USER_ID,
+               targets: int = 50) -> List[Session]:
+    """Полная проверка ручения; проверяемые повторяются, как популярные продавцы."""
+    sessions = []
+    for i in range(users):
+        user_id = first_user_id + i
+        sessions.append([
+            message(user_id, "/start"),
+            callback(user_id, "vouch_check"),
+            message(user_id, f"@seller{rng.randrange(targets)}"),
+            message(user_id, str(rng.choice([100, 500, 1000, 5000, 20000]))),
+            message(user_id, rng.choice(["RUB", "USD", "USDT", "TON"])),
+            callback(user_id, "back_to_menu"),
+        ])
+    return sessions
+
+
+def complaint_flood(users: int, rng: random.Random, first_user_id: int = FIRST_USER_ID,
+                    targets: int = 50) -> List[Session]:
+    """Поток жалоб с упоминаниями и ссылками."""
+    sessions = []
+    for i in range(users):
+        user_id = first_user_id + i
+        text = (
+            f"@seller{rng.randrange(targets)} не вернул {rng.randrange(100, 50_000)} руб, "
+            f"переписка t.me/proof{rng.randrange(1000)}"
+        )
+        sessions.append([
+            callback(user_id, "complaint"),
+            message(user_id, text),
+        ])
+    return sessions
+
+
+def buy_flow(users: int, rng: random.Random, first_user_id: int = FIRST_USER_ID) -> List[Session]:
+    sessions = []
+    for i in range(users):
+        user_id = first_user_id + i
+        sessions.append([
+            callback(user_id, "buy_vouch"),
+            message(user_id, str(rng.choice([100, 1000, 10_000]))),
+            message(user_id, rng.choice(["RUB", "USD"])),
+        ])
+    return sessions
+
+
+def mixed(users: int, rng: random.Random) -> List[Session]:
+    """Примерная смесь реального трафика."""
+    scenarios = [(start_storm, 0.4), (vouch_flow, 0.35), (complaint_flood, 0.15), (buy_flow, 0.1)]
+    sessions, first_user_id = [], FIRST_USER_ID
+    for scenario, share in scenarios:
+        count = max(1, int(users * share))
+        sessions += scenario(count, rng, first_user_id)
+        first_user_id += count
+    rng.shuffle(sessions)
+    return sessions
+
+
+SCENARIOS: Dict[str, Callable[[int, random.Random], List[Session]]] = {
+    "start": start_storm,
+    "vouch": vouch_flow,
+    "complaint": complaint_flood,
+    "buy": buy_flow,
+    "mixed": mixed,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for session in SCENARIOS[args.scenario](args.users, random.Random(args.seed)):
+        for update in session:
+            print(json.dumps(update, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
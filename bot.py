@@ -1,17 +1,40 @@
 import asyncio
+import html
 import logging
-import re
-from datetime import datetime
+from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-import sqlite3
 import os
+import time
+from aiohttp import web
 from dotenv import load_dotenv
 
+from answers import parse_answers
+from banner import BannerCache
+from broadcast import Broadcaster
+from currency import UNKNOWN_CURRENCY
+from dedup import Deduplicator
+from db import DATE_FORMAT, DAY_FORMAT, Database, extract_mentions, normalize_username, now_str
+from digest import AdminDigest
+from export import EXPORT_ALIASES, FORMATS, Exporter
+from fsm_storage import SQLiteStorage
+from maintenance import Maintenance
+from outbox import Outbox
+from perf import PerfMonitor, TimedStorage
+from registry import UserRegistry
+from throttle import Throttler, ThrottlingMiddleware, parse_limits
+from screens import BACK_KEYBOARD, build_screens, show_screen
+from supervisor import run_supervisor
+from verdicts import VerdictCache
+from webhook import run_webhook
+from workqueue import WorkQueue
+
 # ============ ЗАГРУЗКА .env ============
 load_dotenv()
 
@@ -27,57 +50,136 @@ BANK_NAME = os.getenv("BANK_NAME")
 BOT_USERNAME = "OrgazmDeals_Bot"
 SUPPORT_USERNAME = OWNER_USERNAME
 BANNER_PATH = "banner.jpg"
+DB_PATH = os.getenv("DB_PATH", "bot_database.db")
+
+# Уведомления о новых заявках: instant — каждая отдельно, digest — сводкой.
+# Заявки от DIGEST_URGENT_AMOUNT рублей (в пересчёте из валюты заявки) приходят сразу
+ADMIN_NOTIFY_MODE = os.getenv("ADMIN_NOTIFY_MODE", "instant")
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", "60"))
+DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", "20"))
+DIGEST_URGENT_AMOUNT = float(os.getenv("DIGEST_URGENT_AMOUNT", "10000"))
+
+# Режим работы: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# BOT_WORKERS > 1 — несколько процессов-воркеров за супервизором (supervisor.py).
+# BOT_WORKER_INDEX супервизор выставляет сам; воркер 0 обслуживает админа и фоновые задачи
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+WORKER_INDEX = int(os.getenv("BOT_WORKER_INDEX", "0"))
+PRIMARY_WORKER = WORKER_INDEX == 0
+BANNER_RELOAD_SECONDS = 60
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_DELETE_ON_SHUTDOWN = os.getenv("WEBHOOK_DELETE_ON_SHUTDOWN", "1") == "1"
+WEB_SERVER_HOST = os.getenv("WEB_SERVER_HOST", "0.0.0.0")
+WEB_SERVER_PORT = int(os.getenv("WEB_SERVER_PORT", "8080"))
+
+# Свой адрес Bot API: локальный telegram-bot-api или bench/fake_api.py для нагрузочных тестов
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Обслуживание базы: отвеченные заявки старше ARCHIVE_AFTER_DAYS уходят в архив
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "6"))
+
+# Замеры производительности: /perf у админа и, по желанию, метрики Prometheus
+PERF_ENABLED = os.getenv("PERF_ENABLED", "1") == "1"
+PERF_SLOW_MS = float(os.getenv("PERF_SLOW_MS", "500"))
+PERF_METRICS = os.getenv("PERF_METRICS", "0") == "1"
+PERF_METRICS_PATH = os.getenv("PERF_METRICS_PATH", "/metrics")
+
+# Очередь /next: каждые QUEUE_AGING_HOURS ожидания весят как сумма в 10 раз больше,
+# жалоба считается сделкой на QUEUE_COMPLAINT_AMOUNT рублей
+QUEUE_AGING_HOURS = float(os.getenv("QUEUE_AGING_HOURS", "12"))
+QUEUE_COMPLAINT_AMOUNT = float(os.getenv("QUEUE_COMPLAINT_AMOUNT", "10000"))
+
+# Одинаковая заявка от того же пользователя в течение DEDUP_WINDOW_MINUTES не создаётся
+# заново, пользователь получает номер первой. 0 — не проверять
+DEDUP_WINDOW_MINUTES = float(os.getenv("DEDUP_WINDOW_MINUTES", "10"))
+
+# Анти-флуд: класс=запросов/секунд через запятую. start — /start, submit — отправка
+# заявки или жалобы, navigation — кнопки меню, default — всё остальное
+THROTTLE_LIMITS = parse_limits(os.getenv(
+    "THROTTLE_LIMITS", "default=20/10,start=3/30,navigation=30/10,submit=3/600"
+))
 
 # ============ НАСТРОЙКИ ============
 logging.basicConfig(level=logging.INFO)
-storage = MemoryStorage()
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=storage)
+db = Database(DB_PATH)
+storage = SQLiteStorage(db)
+bot = Bot(
+    token=BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
+)
+perf = PerfMonitor(slow_threshold=PERF_SLOW_MS / 1000) if PERF_ENABLED else None
+dp = Dispatcher(storage=TimedStorage(storage, perf) if perf else storage)
+
+throttler = Throttler(THROTTLE_LIMITS, exempt=[ADMIN_ID])
+for observer in (dp.message, dp.callback_query):
+    observer.middleware(ThrottlingMiddleware(throttler))
+if perf:
+    perf.setup(dp, bot, db)
 
 # ============ БАЗА ДАННЫХ ============
-def init_db():
-    conn = sqlite3.connect('bot_database.db')
-    c = conn.cursor()
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (user_id INTEGER PRIMARY KEY, 
-                  username TEXT,
-                  first_name TEXT,
-                  reg_date TEXT,
-                  status TEXT DEFAULT 'user')''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS vouch_requests
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER,
-                  target_username TEXT,
-                  amount REAL,
-                  currency TEXT,
-                  status TEXT DEFAULT 'pending',
-                  request_date TEXT,
-                  admin_answer TEXT,
-                  admin_response_text TEXT)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS complaints
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER,
-                  complaint_text TEXT,
-                  status TEXT DEFAULT 'pending',
-                  complaint_date TEXT,
-                  admin_response_text TEXT)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS buy_requests
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER,
-                  amount REAL,
-                  currency TEXT,
-                  status TEXT DEFAULT 'pending',
-                  request_date TEXT,
-                  admin_response_text TEXT)''')
-    
-    conn.commit()
-    conn.close()
-
-init_db()
+banner = BannerCache(db, BANNER_PATH)
+# С несколькими воркерами очередь outbox отправляет только воркер 0, а сообщения
+# от остальных он видит лишь при опросе — поэтому опрос частый
+outbox = Outbox(db, bot, idle_wait=1.0 if BOT_WORKERS > 1 else 60.0)
+verdicts = VerdictCache(db)
+registry = UserRegistry(db)
+dedup = Deduplicator(DEDUP_WINDOW_MINUTES * 60)
+workqueue = WorkQueue(db, QUEUE_AGING_HOURS, QUEUE_COMPLAINT_AMOUNT)
+broadcaster = Broadcaster(db, bot, outbox.global_bucket)
+broadcaster.on_blocked = registry.mark_blocked
+exporter = Exporter(DB_PATH)
+maintenance = Maintenance(db, ARCHIVE_AFTER_DAYS, interval=MAINTENANCE_INTERVAL_HOURS * 3600)
+digest = AdminDigest(
+    outbox, db, ADMIN_ID,
+    enabled=ADMIN_NOTIFY_MODE == "digest",
+    window=DIGEST_WINDOW,
+    max_items=DIGEST_MAX_ITEMS,
+    urgent_amount=DIGEST_URGENT_AMOUNT,
+    poll=1.0 if BOT_WORKERS > 1 else 60.0,
+)
+
+background_tasks = set()
+
+async def reload_shared_state():
+    # Баннер и рассылки живут на воркере 0, остальные воркеры перечитывают из базы
+    # file_id баннера и тех, кто заблокировал бота
+    while True:
+        await asyncio.sleep(BANNER_RELOAD_SECONDS)
+        try:
+            await banner.load()
+            await registry.load_blocked()
+        except Exception as e:
+            logging.warning("Не удалось перечитать баннер и заблокировавших: %s", e)
+
+@dp.startup()
+async def on_startup():
+    await db.connect()
+    await banner.load()
+    await registry.load()
+    storage.start()
+    if PRIMARY_WORKER:
+        await workqueue.load()
+        outbox.start()
+        digest.start()
+        await broadcaster.resume()
+        maintenance.start()
+    else:
+        task = asyncio.create_task(reload_shared_state())
+        background_tasks.add(task)
+
+@dp.shutdown()
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await broadcaster.close()
+    await maintenance.close()
+    await registry.close()
+    await digest.close()
+    await outbox.close()
+    await db.close()
 
 # ============ СОСТОЯНИЯ ============
 class VouchStates(StatesGroup):
@@ -95,50 +197,29 @@ class BuyVouchStates(StatesGroup):
 # ============ ФУНКЦИЯ ОТПРАВКИ С БАННЕРОМ ============
 async def send_with_banner(chat_id: int, text: str, keyboard=None):
     try:
-        if os.path.exists(BANNER_PATH):
-            photo = FSInputFile(BANNER_PATH)
-            await bot.send_photo(chat_id, photo, caption=text, reply_markup=keyboard, parse_mode="HTML")
-        else:
+        sent = await banner.send(bot, chat_id, text, reply_markup=keyboard, parse_mode="HTML")
+        if sent is None:
             await bot.send_message(chat_id, text, reply_markup=keyboard, parse_mode="HTML")
     except Exception as e:
         print(f"Ошибка: {e}")
         await bot.send_message(chat_id, text, reply_markup=keyboard, parse_mode="HTML")
 
 # ============ ГЛАВНОЕ МЕНЮ ============
+SCREENS = build_screens(OWNER_USERNAME)
+
 async def show_main_menu(chat_id: int, user_id: int = None):
     """Показывает главное меню с полным описанием"""
-    menu_text = (
-        "👋 <b>Приветствую!</b>\n\n"
-        "Это <b>единственный официальный проект ручений</b>\n"
-        "от <b>@orgazm</b>\n\n"
-        "‼️ <b>НЕ ВЕДИТЕСЬ НА ФЕЙКОВ!</b>\n"
-        "✅ <b>Официальный бот — @OrgazmDeals_Bot</b>\n\n"
-        "👇 <b>Выберите действие:</b>"
-    )
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="❓ Уточнить ручение", callback_data="vouch_check")],
-        [InlineKeyboardButton(text="⚠️ Подать жалобу", callback_data="complaint")],
-        [InlineKeyboardButton(text="💼 Купить ручение", callback_data="buy_vouch")],
-        [InlineKeyboardButton(text="ℹ️ Информация", callback_data="info")],
-        [InlineKeyboardButton(text="📞 Мой ЛС", url=f"https://t.me/{OWNER_USERNAME}")]
-    ])
-    
-    await send_with_banner(chat_id, menu_text, keyboard)
+    menu = SCREENS["menu"]
+    await send_with_banner(chat_id, menu.text, menu.keyboard)
 
 # ============ КОМАНДЫ ============
-@dp.message(Command("start"))
+@dp.message(Command("start"), flags={"throttle": "start"})
 async def cmd_start(message: Message):
     user_id = message.from_user.id
     username = message.from_user.username or "нет юзернейма"
     first_name = message.from_user.first_name or "Пользователь"
     
-    conn = sqlite3.connect('bot_database.db')
-    c = conn.cursor()
-    c.execute("INSERT OR IGNORE INTO users (user_id, username, first_name, reg_date) VALUES (?, ?, ?, ?)",
-              (user_id, username, first_name, datetime.now().strftime("%d.%m.%Y %H:%M")))
-    conn.commit()
-    conn.close()
+    await registry.register(user_id, username, first_name)
     
     await show_main_menu(message.chat.id, user_id)
 
@@ -148,22 +229,11 @@ async def cmd_admin(message: Message):
         await message.answer("❌ <b>У тебя нет доступа к админке</b>", parse_mode="HTML")
         return
     
-    conn = sqlite3.connect('bot_database.db')
-    c = conn.cursor()
-    
-    c.execute("SELECT COUNT(*) FROM users")
-    users_count = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM vouch_requests WHERE status='pending'")
-    pending_vouches = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM complaints WHERE status='pending'")
-    pending_complaints = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM buy_requests WHERE status='pending'")
-    pending_buys = c.fetchone()[0]
-    
-    conn.close()
+    stats = await db.stats.get_all()
+    users_count = stats.get("users", 0)
+    pending_vouches = stats.get("pending_vouch_requests", 0)
+    pending_complaints = stats.get("pending_complaints", 0)
+    pending_buys = stats.get("pending_buy_requests", 0)
     
     admin_text = (
         "👑 <b>Админ-панель</b>\n\n"
@@ -174,137 +244,716 @@ async def cmd_admin(message: Message):
         f"💰 <b>Заявок на покупку:</b> {pending_buys}\n\n"
         f"📋 <b>Команды:</b>\n"
         f"<b>/pending</b> - все ожидающие заявки\n"
+        f"<b>/next</b> - самая срочная заявка с кнопками ответа\n"
         f"<b>/заявка № текст</b> - ответить на заявку\n"
+        f"<b>/жалоба № текст</b> - ответить на жалобу\n"
+        f"<b>/покупка № текст</b> - ответить на заявку на покупку\n"
         f"<b>/setbanner</b> - установить баннер\n"
-        f"<b>/removebanner</b> - удалить баннер\n\n"
+        f"<b>/removebanner</b> - удалить баннер\n"
+        f"<b>/search текст</b> - поиск по жалобам\n"
+        f"<b>/rep @юзернейм</b> - репутация человека\n"
+        f"<b>/recount</b> - пересчитать статистику\n"
+        f"<b>/maintenance</b> - архивировать старые заявки сейчас\n"
+        f"<b>/vacuum</b> - один раз включить возврат места (база недоступна на время VACUUM)\n"
+        f"<b>/export таблица [csv|jsonl] [с] [по]</b> - выгрузка базы\n"
+        f"<b>/report [vouches|buys] [с] [по]</b> - суммы заявок по валютам\n"
+        f"<b>/perf</b> - скорость обработчиков, БД и API\n"
+        f"<b>/throttle</b> - кто упёрся в анти-флуд\n"
+        f"<b>/broadcast текст</b> - рассылка всем пользователям\n"
+        f"<b>/broadcast_stop</b> - остановить рассылку\n\n"
         f"💡 <b>Пример ответа:</b>\n"
-        f"/заявка 5 ✅ Ручаюсь, человек надёжный!"
+        f"/заявка 5 ✅ Ручаюсь, человек надёжный!\n"
+        f"/заявка 5-8,12 ✅ Ручаюсь — сразу на несколько\n"
+        f"Разные ответы в одном сообщении — с новой строки через #:\n"
+        f"/заявка 5 ✅ Ручаюсь\n#6 ❌ Не ручаюсь"
     )
     
     await message.answer(admin_text, parse_mode="HTML")
 
+@dp.message(Command("recount"))
+async def cmd_recount(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    before, after = await db.stats.rebuild()
+    drift = [
+        f"<code>{name}: {before.get(name, 0)} → {value}</code>"
+        for name, value in after.items() if before.get(name) != value
+    ]
+    
+    if drift:
+        text = "🔧 <b>Счётчики пересчитаны, найдено расхождение:</b>\n" + "\n".join(drift)
+    else:
+        text = "✅ <b>Счётчики в порядке, расхождений нет</b>"
+    people = await db.reputation.rebuild()
+    text += f"\n📊 <b>Репутация пересчитана:</b> {people} чел."
+    rows = await db.amounts.rebuild()
+    text += f"\n💱 <b>Суточные суммы пересчитаны:</b> {rows} строк"
+    await message.answer(text, parse_mode="HTML")
+
+@dp.message(Command("maintenance"))
+async def cmd_maintenance(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    report = await maintenance.run_once()
+    await message.answer(
+        f"🧹 <b>Обслуживание базы выполнено</b>\n\n"
+        f"<code>┌─ В архив (старше {ARCHIVE_AFTER_DAYS:g} дн.):</code>\n"
+        f"<code>├─ Ручения: {report['vouch_requests']}</code>\n"
+        f"<code>├─ Жалобы: {report['complaints']}</code>\n"
+        f"<code>├─ Покупки: {report['buy_requests']}</code>\n"
+        f"<code>├─ Удалено старых отпечатков заявок: {report['fingerprints']}</code>\n"
+        f"<code>├─ Удалено недоставленных сообщений: {report['outbox_failed']}</code>\n"
+        f"<code>└─ Освобождено страниц: {report['freed_pages']}</code>",
+        parse_mode="HTML"
+    )
+
+@dp.message(Command("vacuum"))
+async def cmd_vacuum(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    await message.answer("⏳ <b>Перевожу базу в режим возврата места...</b>\nПока идёт VACUUM, бот не отвечает.",
+                         parse_mode="HTML")
+    started = time.monotonic()
+    if not await maintenance.enable_incremental_vacuum():
+        await message.answer("ℹ️ <b>База уже в режиме auto_vacuum=INCREMENTAL</b>", parse_mode="HTML")
+        return
+    await message.answer(
+        f"✅ <b>Готово за {time.monotonic() - started:.1f} с</b>\n"
+        f"Теперь /maintenance возвращает освободившееся место.",
+        parse_mode="HTML"
+    )
+
+# ============ ВЫГРУЗКА ============
+def parse_export_args(args: str):
+    """'complaints jsonl 01.09.2026 30.09.2026' -> (таблица, формат, с, по); даты включительно."""
+    words = args.split()
+    if not words:
+        raise ValueError("не указана таблица")
+    name, fmt, dates = words[0], "csv", []
+    for word in words[1:]:
+        if word.lower() in FORMATS:
+            fmt = word.lower()
+            continue
+        try:
+            dates.append(datetime.strptime(word, "%d.%m.%Y"))
+        except ValueError:
+            raise ValueError(f"не понял «{word}»: дата пишется как ДД.ММ.ГГГГ")
+    if len(dates) > 2:
+        raise ValueError("дат может быть не больше двух")
+    since = int(dates[0].timestamp()) if dates else None
+    until = int((dates[1] + timedelta(days=1)).timestamp()) if len(dates) > 1 else None
+    return name, fmt, since, until
+
+@dp.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    try:
+        name, fmt, since, until = parse_export_args(command.args or "")
+    except ValueError as e:
+        await message.answer(
+            f"❌ <b>Неверный формат!</b>\n{html.escape(str(e))}\n"
+            f"Используй: <code>/export ТАБЛИЦА [csv|jsonl] [С] [ПО]</code>\n"
+            f"Таблицы: <code>{', '.join(EXPORT_ALIASES)}</code> или имя любой таблицы базы\n"
+            f"Пример: <code>/export complaints jsonl 01.09.2026 30.09.2026</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    status = await message.answer("⏳ <b>Готовлю выгрузку...</b>", parse_mode="HTML")
+    try:
+        result = await exporter.export(name, fmt, since, until)
+    except ValueError as e:
+        await status.edit_text(f"❌ <b>Ошибка:</b> {html.escape(str(e))}", parse_mode="HTML")
+        return
+    
+    try:
+        if not result.rows:
+            await status.edit_text("ℹ️ <b>За этот период строк нет</b>", parse_mode="HTML")
+            return
+        for number, path in enumerate(result.files, 1):
+            caption = f"📦 {name}: {result.rows} строк"
+            if len(result.files) > 1:
+                caption += f", часть {number}/{len(result.files)}"
+            await bot.send_document(message.chat.id, FSInputFile(path), caption=caption)
+        await status.delete()
+    finally:
+        result.cleanup()
+
+# ============ ОТЧЁТ ПО СУММАМ ============
+REPORT_KINDS = {"vouches": ("vouch_requests", "ручения"), "buys": ("buy_requests", "покупки")}
+REPORT_PERIODS = (("Сегодня", 1), ("7 дней", 7), ("30 дней", 30))
+
+def parse_report_args(args: str):
+    """'buys 01.09.2026 30.09.2026' -> (тип, [(название, с, по)]) с днями ГГГГ-ММ-ДД включительно.
+
+    Без дат — три периода из REPORT_PERIODS, с одной датой — только этот день.
+    """
+    words = args.split()
+    kind = words.pop(0).lower() if words and words[0].lower() in REPORT_KINDS else "vouches"
+    dates = []
+    for word in words:
+        try:
+            dates.append(datetime.strptime(word, "%d.%m.%Y"))
+        except ValueError:
+            raise ValueError(f"не понял «{word}»: дата пишется как ДД.ММ.ГГГГ")
+    if len(dates) > 2:
+        raise ValueError("дат может быть не больше двух")
+    if dates:
+        title = " — ".join(dict.fromkeys(date.strftime("%d.%m.%Y") for date in dates))
+        return kind, [(title, dates[0].strftime(DAY_FORMAT), dates[-1].strftime(DAY_FORMAT))]
+    today = datetime.now()
+    return kind, [
+        (title, (today - timedelta(days=days - 1)).strftime(DAY_FORMAT), today.strftime(DAY_FORMAT))
+        for title, days in REPORT_PERIODS
+    ]
+
+@dp.message(Command("report"))
+async def cmd_report(message: Message, command: CommandObject):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    try:
+        kind, periods = parse_report_args(command.args or "")
+    except ValueError as e:
+        await message.answer(
+            f"❌ <b>Неверный формат!</b>\n{html.escape(str(e))}\n"
+            f"Используй: <code>/report [vouches|buys] [С] [ПО]</code>\n"
+            f"Пример: <code>/report buys 01.09.2026 30.09.2026</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    table, label = REPORT_KINDS[kind]
+    text = f"💱 <b>Суммы заявок: {label}</b>\n"
+    for title, since_day, until_day in periods:
+        text += f"\n<b>{title}</b>\n"
+        summaries = await db.amounts.report(table, since_day, until_day)
+        if not summaries:
+            text += "<code>└─ заявок нет</code>\n"
+            continue
+        for number, summary in enumerate(summaries):
+            branch = "└─" if number == len(summaries) - 1 else ("┌─" if number == 0 else "├─")
+            code = "не распознана" if summary.currency_code == UNKNOWN_CURRENCY else summary.currency_code
+            text += (
+                f"<code>{branch} {code}: {summary.requests} шт., всего {format_amount(summary.total)}, "
+                f"медиана ≈ {format_amount(summary.median)}</code>\n"
+            )
+    await message.answer(text, parse_mode="HTML")
+
+@dp.message(Command("perf"))
+async def cmd_perf(message: Message, command: CommandObject):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    if perf is None:
+        await message.answer("ℹ️ <b>Замеры выключены</b> (PERF_ENABLED=0)", parse_mode="HTML")
+        return
+    if (command.args or "").strip() == "reset":
+        perf.reset()
+        await message.answer("✅ <b>Замеры сброшены</b>", parse_mode="HTML")
+        return
+    await message.answer(perf.render(), parse_mode="HTML")
+
+@dp.message(Command("throttle"))
+async def cmd_throttle(message: Message, command: CommandObject):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    args = (command.args or "").split()
+    if args and args[0] == "clear":
+        if len(args) > 1 and not args[1].isdigit():
+            await message.answer("❌ <b>Используй:</b> <code>/throttle clear [ID]</code>", parse_mode="HTML")
+            return
+        cleared = throttler.clear(int(args[1]) if len(args) > 1 else None)
+        await message.answer(f"✅ <b>Сброшено лимитов:</b> {cleared}", parse_mode="HTML")
+        return
+    
+    rows = throttler.throttled()
+    if not rows:
+        await message.answer("✅ <b>Сейчас никто не упёрся в лимиты</b>", parse_mode="HTML")
+        return
+    text = "🚦 <b>АНТИ-ФЛУД</b> — отброшено обновлений:\n\n"
+    text += "".join(f"<code>{user_id} [{name}]: {dropped}</code>\n" for user_id, name, dropped in rows[:30])
+    text += "\n💡 <code>/throttle clear ID</code> — снять лимит с пользователя, <code>/throttle clear</code> — со всех"
+    await message.answer(text, parse_mode="HTML")
+
+# ============ РАССЫЛКА ============
+@dp.message(Command("broadcast"))
+async def cmd_broadcast(message: Message, command: CommandObject):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    if not command.args:
+        await message.answer(
+            "❌ <b>Неверный формат!</b>\n"
+            "Используй: <code>/broadcast ТЕКСТ</code>\n"
+            "Форматирование текста сохранится",
+            parse_mode="HTML"
+        )
+        return
+    
+    # html_text сохраняет жирный, ссылки и прочее оформление, которое админ набрал в сообщении
+    text = message.html_text.split(maxsplit=1)[1]
+    job_id = await broadcaster.start(text, message.chat.id)
+    if job_id is None:
+        await message.answer(
+            "⏳ <b>Уже идёт другая рассылка</b>\n"
+            "Дождись её окончания или останови: <code>/broadcast_stop</code>",
+            parse_mode="HTML"
+        )
+
+@dp.message(Command("broadcast_stop"))
+async def cmd_broadcast_stop(message: Message):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    job_id = await broadcaster.cancel()
+    if job_id is None:
+        await message.answer("ℹ️ <b>Сейчас нет активных рассылок</b>", parse_mode="HTML")
+    else:
+        await message.answer(f"⛔ <b>Рассылка #{job_id} остановлена</b>", parse_mode="HTML")
+
 # ============ КОМАНДА ДЛЯ ПРОСМОТРА ВСЕХ ЗАЯВОК ============
+# 10 карточек с обрезанными полями гарантированно влезают в лимит 4096 символов
+PENDING_PAGE_SIZE = 10
+
+PENDING_KINDS = {
+    "v": ("vouches", "pending_vouch_requests", "🔔 Ручения"),
+    "c": ("complaints", "pending_complaints", "⚠️ Жалобы"),
+    "b": ("buys", "pending_buy_requests", "💰 Покупки"),
+}
+PENDING_ANSWER_COMMANDS = {"v": "заявка", "c": "жалоба", "b": "покупка"}
+
+def short(value, limit: int = 50) -> str:
+    value = str(value)
+    value = value[:limit] + "..." if len(value) > limit else value
+    return html.escape(value)
+
+def render_pending_item(kind: str, item) -> str:
+    if kind == "v":
+        return (
+            f"<code>┌─ #ЗАЯВКА {item.id}</code>\n"
+            f"<code>├─ Проверить: {short(item.target_username)}</code>\n"
+            f"<code>├─ Сумма: {item.amount} {short(item.currency, 16)}</code>\n"
+            f"<code>└─ Дата: {item.request_date}</code>\n\n"
+        )
+    if kind == "c":
+        return (
+            f"<code>┌─ #ЖАЛОБА {item.id}</code>\n"
+            f"<code>├─ {short(item.complaint_text)}</code>\n"
+            f"<code>└─ Дата: {item.complaint_date}</code>\n\n"
+        )
+    return (
+        f"<code>┌─ #ЗАЯВКА {item.id}</code>\n"
+        f"<code>├─ Сумма: {item.amount} {short(item.currency, 16)}</code>\n"
+        f"<code>└─ Дата: {item.request_date}</code>\n\n"
+    )
+
+async def render_pending_page(kind: str, after_id: int = None, before_id: int = None):
+    repo_name, counter, title = PENDING_KINDS[kind]
+    repo = getattr(db, repo_name)
+    items, has_prev, has_next = await repo.page_pending(after_id, before_id, PENDING_PAGE_SIZE)
+    stats = await db.stats.get_all()
+    
+    text = f"📋 <b>ОЖИДАЮЩИЕ ЗАЯВКИ — {title}</b> ({stats.get(counter, 0)})\n"
+    text += "═══════════════════\n\n"
+    if items:
+        text += "".join(render_pending_item(kind, item) for item in items)
+    else:
+        text += "✅ <b>Здесь пусто</b>\n\n"
+    text += "═══════════════════\n"
+    text += "💡 <b>Как ответить:</b>\n"
+    text += f"<code>/{PENDING_ANSWER_COMMANDS[kind]} 5 ✅ Ручаюсь!</code>\n"
+    text += f"<code>/{PENDING_ANSWER_COMMANDS[kind]} 5-8,12 ТЕКСТ</code> — сразу на несколько"
+    
+    filters = [
+        InlineKeyboardButton(
+            text=f"{'• ' if key == kind else ''}{label} ({stats.get(key_counter, 0)})",
+            callback_data=f"pending:{key}:next:0",
+        )
+        for key, (_, key_counter, label) in PENDING_KINDS.items()
+    ]
+    navigation = []
+    if items and has_prev:
+        navigation.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"pending:{kind}:prev:{items[0].id}"))
+    if items and has_next:
+        navigation.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"pending:{kind}:next:{items[-1].id}"))
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[filters, navigation] if navigation else [filters])
+    return text, keyboard
+
 @dp.message(Command("pending"))
 async def cmd_pending(message: Message):
     if message.from_user.id != ADMIN_ID:
         return
     
-    conn = sqlite3.connect('bot_database.db')
-    c = conn.cursor()
+    stats = await db.stats.get_all()
+    if not any(stats.get(counter) for _, counter, _ in PENDING_KINDS.values()):
+        await message.answer("✅ <b>Нет ожидающих заявок</b>", parse_mode="HTML")
+        return
     
-    c.execute('''SELECT id, user_id, target_username, amount, currency, request_date 
-                 FROM vouch_requests WHERE status="pending" ORDER BY id''')
-    vouches = c.fetchall()
+    kind = next(key for key, (_, counter, _) in PENDING_KINDS.items() if stats.get(counter))
+    text, keyboard = await render_pending_page(kind)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+@dp.callback_query(F.data.startswith("pending:"))
+async def pending_page(call: CallbackQuery):
+    if call.from_user.id != ADMIN_ID:
+        await call.answer()
+        return
     
-    c.execute('''SELECT id, user_id, complaint_text, complaint_date 
-                 FROM complaints WHERE status="pending" ORDER BY id''')
-    complaints = c.fetchall()
+    _, kind, direction, cursor = call.data.split(":")
+    cursor = int(cursor)
+    if direction == "prev":
+        text, keyboard = await render_pending_page(kind, before_id=cursor)
+    else:
+        text, keyboard = await render_pending_page(kind, after_id=cursor or None)
     
-    c.execute('''SELECT id, user_id, amount, currency, request_date 
-                 FROM buy_requests WHERE status="pending" ORDER BY id''')
-    buys = c.fetchall()
+    try:
+        await call.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    await call.answer()
+
+# ============ ОЧЕРЕДЬ /next ============
+# Готовые ответы в одно нажатие: (кнопка, текст ответа)
+QUICK_ANSWERS = {
+    "v": [("✅ Ручаюсь", "✅ Ручаюсь, человек надёжный!"), ("❌ Не ручаюсь", "❌ Не ручаюсь за этого человека")],
+    "c": [("✅ Принять", "✅ Жалоба принята, разбираемся"),
+          ("❌ Отклонить", "❌ Жалоба отклонена: недостаточно доказательств")],
+    "b": [("✅ Одобрить", f"✅ Заявка одобрена, напишите @{OWNER_USERNAME}"), ("❌ Отклонить", "❌ Заявка отклонена")],
+}
+KIND_BY_TABLE = {getattr(db, repo_name).table: kind for kind, (repo_name, _, _) in PENDING_KINDS.items()}
+
+async def render_next(note: str = ""):
+    """Достаёт самую срочную заявку из очереди. Возвращает (текст, клавиатура или None)."""
+    while True:
+        item = await workqueue.pop()
+        if item is None:
+            return note + "✅ <b>Очередь пуста — все заявки отвечены</b>", None
+        kind = KIND_BY_TABLE[item.table]
+        request = await getattr(db, PENDING_KINDS[kind][0]).get(item.id)
+        if request is not None and request.status == "pending":
+            break
+        # Отвечена в обход очереди или ушла в архив
+        workqueue.discard(item.table, item.id)
     
-    conn.close()
+    text = note + f"🎯 <b>СЛЕДУЮЩАЯ ЗАЯВКА</b> (ещё в очереди: {len(workqueue) - 1})\n\n"
+    text += render_pending_item(kind, request)
+    if kind == "v":
+        text += await render_reputation(request.target_norm or normalize_username(request.target_username)) + "\n\n"
+    if kind != "c":
+        text += f"💱 <b>≈ {format_amount(item.amount_rub)} ₽</b>\n"
+    text += f"✏️ Свой ответ: <code>/{PENDING_ANSWER_COMMANDS[kind]} {request.id} ТЕКСТ</code>"
     
-    if not vouches and not complaints and not buys:
-        await message.answer("✅ <b>Нет ожидающих заявок</b>", parse_mode="HTML")
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=label, callback_data=f"next:{kind}:{request.id}:{index}")
+         for index, (label, _) in enumerate(QUICK_ANSWERS[kind])],
+        [InlineKeyboardButton(text="⏭ Пропустить", callback_data=f"next:{kind}:{request.id}:skip")],
+    ])
+    return text, keyboard
+
+@dp.message(Command("next"))
+async def cmd_next(message: Message):
+    if message.from_user.id != ADMIN_ID:
         return
     
-    text = "📋 <b>ОЖИДАЮЩИЕ ЗАЯВКИ</b>\n"
-    text += "═══════════════════\n\n"
+    text, keyboard = await render_next()
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+@dp.callback_query(F.data.startswith("next:"))
+async def next_answer(call: CallbackQuery):
+    if call.from_user.id != ADMIN_ID:
+        await call.answer()
+        return
     
-    if vouches:
-        text += "🔔 <b>Ручения:</b>\n"
-        for v in vouches:
-            text += f"<code>┌─ #ЗАЯВКА {v[0]}</code>\n"
-            text += f"<code>├─ От: @{v[2]}</code>\n"
-            text += f"<code>├─ Сумма: {v[3]} {v[4]}</code>\n"
-            text += f"<code>└─ Дата: {v[5]}</code>\n\n"
-    
-    if complaints:
-        text += "⚠️ <b>Жалобы:</b>\n"
-        for c in complaints:
-            short_text = c[2][:50] + "..." if len(c[2]) > 50 else c[2]
-            text += f"<code>┌─ #ЖАЛОБА {c[0]}</code>\n"
-            text += f"<code>├─ {short_text}</code>\n"
-            text += f"<code>└─ Дата: {c[3]}</code>\n\n"
-    
-    if buys:
-        text += "💰 <b>Покупки ручения:</b>\n"
-        for b in buys:
-            text += f"<code>┌─ #ЗАЯВКА {b[0]}</code>\n"
-            text += f"<code>├─ Сумма: {b[2]} {b[3]}</code>\n"
-            text += f"<code>└─ Дата: {b[4]}</code>\n\n"
+    _, kind, request_id, action = call.data.split(":")
+    request_id = int(request_id)
+    table = getattr(db, PENDING_KINDS[kind][0]).table
+    if action == "skip":
+        workqueue.snooze(table, request_id)
+        note = f"⏭ <b>#{request_id} отложена на {workqueue.lease // 60:.0f} мин</b>\n\n"
+    else:
+        response_text = QUICK_ANSWERS[kind][int(action)][1]
+        answered, _ = await send_answers(PENDING_ANSWER_COMMANDS[kind], [(request_id, response_text)])
+        if answered:
+            note = f"✅ <b>#{request_id}:</b> {response_text}\n\n"
+        else:
+            workqueue.discard(table, request_id)
+            note = f"ℹ️ <b>#{request_id} уже обработана</b>\n\n"
     
+    text, keyboard = await render_next(note)
+    await call.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    await call.answer()
+
+# ============ ПОИСК ПО ЖАЛОБАМ ============
+SEARCH_PAGE_SIZE = 5
+SEARCH_MAX_MENTIONS = 3
+COMPLAINT_STATUSES = {"pending": "ожидает", "answered": "отвечена"}
+
+def render_fragment(fragment: str) -> str:
+    # snippet() отмечает совпадения символами \x02 и \x03, разметку ставим после экранирования
+    return html.escape(fragment).replace("\x02", "<b>").replace("\x03", "</b>")
+
+def format_amount(value: float) -> str:
+    if value == int(value):
+        return f"{value:,.0f}".replace(",", " ")
+    # Доли биткоина и TON не округляем до копеек
+    return f"{value:,.2f}".replace(",", " ") if abs(value) >= 1 else f"{value:.6g}"
+
+async def render_mention_refs(username_norm: str) -> str:
+    rep = await db.reputation.get(username_norm)
+    if rep is None:
+        return f"👤 <b>@{html.escape(username_norm)}</b>: раньше не встречался\n"
+    text = (
+        f"👤 <b>@{html.escape(username_norm)}</b>: проверок {rep.checks} "
+        f"(✅ {rep.positive} / ❌ {rep.negative}), жалоб с упоминанием {rep.complaints}"
+    )
+    if rep.complaints:
+        _, complaint_ids = await db.complaints.mentioning(username_norm, limit=5)
+        text += " — " + ", ".join(f"#{complaint_id}" for complaint_id in complaint_ids)
+    return text + "\n"
+
+async def render_reputation(username_norm: str) -> str:
+    """Полная сводка по человеку: для уведомления о заявке и /rep."""
+    rep = await db.reputation.get(username_norm)
+    name = html.escape(username_norm)
+    if rep is None:
+        return f"📊 <b>Репутация @{name}:</b> раньше не встречался"
+    
+    last_activity = (
+        datetime.fromtimestamp(rep.last_activity_ts).strftime(DATE_FORMAT) if rep.last_activity_ts else "—"
+    )
+    text = (
+        f"📊 <b>Репутация @{name}:</b>\n"
+        f"<code>┌─ Проверок: {rep.checks} (✅ {rep.positive} / ❌ {rep.negative} / "
+        f"без ответа {rep.checks - rep.positive - rep.negative})</code>\n"
+        f"<code>├─ Жалоб с упоминанием: {rep.complaints}</code>\n"
+        f"<code>├─ Сумма проверок: ≈ {format_amount(round(rep.total_amount))} ₽</code>\n"
+        f"<code>└─ Активность: {last_activity}</code>"
+    )
+    if rep.complaints:
+        _, complaint_ids = await db.complaints.mentioning(username_norm, limit=5)
+        text += (
+            f"\n⚠️ <b>Жалобы:</b> {', '.join(f'#{complaint_id}' for complaint_id in complaint_ids)} — "
+            f"<code>/search @{name}</code>"
+        )
+    return text
+
+async def render_search_page(query: str, offset: int = 0):
+    results, total = await db.complaints.search(query, offset, SEARCH_PAGE_SIZE)
+    
+    text = f"🔎 <b>ПОИСК ПО ЖАЛОБАМ:</b> {short(query, 100)}\n"
     text += "═══════════════════\n"
-    text += "💡 <b>Как ответить:</b>\n"
-    text += "<code>/заявка 5 ✅ Ручаюсь!</code>"
+    for username_norm in extract_mentions(query)[:SEARCH_MAX_MENTIONS]:
+        text += await render_mention_refs(username_norm)
+    text += f"📄 <b>Найдено:</b> {total}\n\n"
+    for complaint, fragment in results:
+        text += (
+            f"<code>┌─ #ЖАЛОБА {complaint.id} ({COMPLAINT_STATUSES.get(complaint.status, complaint.status)})</code>\n"
+            f"<code>└─ Дата: {complaint.complaint_date}</code>\n"
+            f"{render_fragment(fragment)}\n\n"
+        )
+    
+    navigation = []
+    if offset > 0:
+        navigation.append(InlineKeyboardButton(
+            text="⬅️ Назад", callback_data=f"search:{max(0, offset - SEARCH_PAGE_SIZE)}"
+        ))
+    if offset + SEARCH_PAGE_SIZE < total:
+        navigation.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"search:{offset + SEARCH_PAGE_SIZE}"))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[navigation]) if navigation else None
+    return text, keyboard
+
+@dp.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject, state: FSMContext):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer(
+            "❌ <b>Неверный формат!</b>\n"
+            "Используй: <code>/search ТЕКСТ</code>\n"
+            "Пример: <code>/search @scammer</code> или <code>/search не отдал деньги</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    # Запрос не влезает в 64 байта callback_data, поэтому для листания он хранится в данных FSM
+    await state.update_data(search_query=query)
+    text, keyboard = await render_search_page(query)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+
+@dp.callback_query(F.data.startswith("search:"))
+async def search_page(call: CallbackQuery, state: FSMContext):
+    if call.from_user.id != ADMIN_ID:
+        await call.answer()
+        return
+    
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        await call.answer("Поиск устарел, повтори /search", show_alert=True)
+        return
     
+    text, keyboard = await render_search_page(query, int(call.data.split(":")[1]))
+    try:
+        await call.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    await call.answer()
+
+@dp.message(Command("rep"))
+async def cmd_rep(message: Message, command: CommandObject):
+    if message.from_user.id != ADMIN_ID:
+        return
+    
+    username_norm = normalize_username(command.args or "")
+    if not username_norm:
+        await message.answer(
+            "❌ <b>Неверный формат!</b>\n"
+            "Используй: <code>/rep @юзернейм</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    text = await render_reputation(username_norm)
+    verdict = await verdicts.get(username_norm)
+    if verdict:
+        text += f"\n\n📌 <b>Последний ответ</b> (#{verdict.request_id}, {verdict.date}):\n{verdict.text}"
     await message.answer(text, parse_mode="HTML")
 
 # ============ КОМАНДА ДЛЯ ОТВЕТА НА ЗАЯВКИ ============
-@dp.message(Command("заявка"))
-async def cmd_answer_vouch(message: Message):
+# Номера: одиночный (5), диапазон (5-10) или список (5,7,9-12)
+ANSWER_CONCURRENCY = 10
+
+ANSWER_KINDS = {
+    "заявка": ("vouches", "ЗАЯВКА"),
+    "жалоба": ("complaints", "ЖАЛОБА"),
+    "покупка": ("buys", "ЗАЯВКА"),
+}
+
+def answer_user_text(command: str, request, response_text: str) -> str:
+    if command == "заявка":
+        header = (
+            f"📬 <b>Ответ на ваш запрос о ручении</b>\n\n"
+            f"<code>┌─ ЗАЯВКА #{request.id}</code>\n"
+            f"<code>├─ Проверяли: {request.target_username}</code>\n"
+            f"<code>├─ Сумма: {request.amount} {request.currency}</code>\n"
+        )
+    elif command == "жалоба":
+        header = (
+            f"📬 <b>Ответ на вашу жалобу</b>\n\n"
+            f"<code>┌─ ЖАЛОБА #{request.id}</code>\n"
+        )
+    else:
+        header = (
+            f"📬 <b>Ответ на заявку на покупку ручения</b>\n\n"
+            f"<code>┌─ ЗАЯВКА #{request.id}</code>\n"
+            f"<code>├─ Сумма: {request.amount} {request.currency}</code>\n"
+        )
+    return (
+        header +
+        f"<code>└─ Время: {now_str()}</code>\n\n"
+        f"<b>Ответ от @{OWNER_USERNAME}:</b>\n"
+        f"{response_text}"
+    )
+
+async def send_answers(name: str, answers: list):
+    """Отмечает заявки отвеченными и доставляет ответы. Возвращает (отвеченные, статусы доставки)."""
+    repo = getattr(db, ANSWER_KINDS[name][0])
+    answered = await repo.answer_many(answers)
+    
+    texts = dict(answers)
+    for request in answered:
+        workqueue.discard(repo.table, request.id)
+        if name == "заявка":
+            verdicts.remember(request.target_username, request.id, texts[request.id], now_str())
+    
+    statuses = await outbox.deliver(
+        [(request.user_id, answer_user_text(name, request, texts[request.id])) for request in answered],
+        concurrency=ANSWER_CONCURRENCY,
+    )
+    return answered, statuses
+
+async def answer_requests(message: Message, command: CommandObject):
     if message.from_user.id != ADMIN_ID:
         return
     
+    name = command.command
+    label = ANSWER_KINDS[name][1]
     try:
-        text = message.text.replace("/заявка", "").strip()
-        match = re.match(r"^(\d+)\s+(.+)$", text)
-        
-        if not match:
-            await message.answer(
-                "❌ <b>Неверный формат!</b>\n"
-                "Используй: <code>/заявка НОМЕР ТЕКСТ</code>\n"
-                "Пример: <code>/заявка 5 ✅ Ручаюсь, человек надёжный!</code>",
-                parse_mode="HTML"
-            )
-            return
-        
-        request_id = int(match.group(1))
-        response_text = match.group(2)
-        
-        conn = sqlite3.connect('bot_database.db')
-        c = conn.cursor()
-        
-        c.execute('''SELECT user_id, target_username, amount, currency 
-                     FROM vouch_requests WHERE id=? AND status="pending"''', (request_id,))
-        request = c.fetchone()
-        
-        if not request:
+        answers = parse_answers(command.args or "")
+    except ValueError as e:
+        answers, error = [], str(e)
+    else:
+        error = None
+    
+    if not answers:
+        await message.answer(
+            "❌ <b>Неверный формат!</b>\n"
+            + (f"{html.escape(error)}\n" if error else "")
+            + f"Используй: <code>/{name} НОМЕР ТЕКСТ</code>\n"
+            f"Пример: <code>/{name} 5 ✅ Ручаюсь, человек надёжный!</code>\n"
+            f"Несколько сразу: <code>/{name} 5-8,12 ТЕКСТ</code>\n"
+            f"Разные ответы — каждый с новой строки с решёткой: <code>#6 ТЕКСТ</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    try:
+        answered, statuses = await send_answers(name, answers)
+    except Exception as e:
+        await message.answer(f"❌ <b>Ошибка:</b> {e}", parse_mode="HTML")
+        return
+    
+    if len(answers) == 1:
+        request_id, response_text = answers[0]
+        if not answered:
             await message.answer(f"❌ <b>Заявка #{request_id} не найдена или уже обработана</b>", parse_mode="HTML")
-            conn.close()
             return
-        
-        user_id, target, amount, currency = request
-        
-        c.execute('''UPDATE vouch_requests 
-                     SET status="answered", admin_response_text=?, admin_answer=?
-                     WHERE id=?''', 
-                  (response_text, response_text, request_id))
-        conn.commit()
-        conn.close()
-        
-        user_text = (
-            f"📬 <b>Ответ на ваш запрос о ручении</b>\n\n"
-            f"<code>┌─ ЗАЯВКА #{request_id}</code>\n"
-            f"<code>├─ Проверяли: {target}</code>\n"
-            f"<code>├─ Сумма: {amount} {currency}</code>\n"
-            f"<code>└─ Время: {datetime.now().strftime('%d.%m.%Y %H:%M')}</code>\n\n"
-            f"<b>Ответ от @{OWNER_USERNAME}:</b>\n"
-            f"{response_text}"
-        )
-        
-        await bot.send_message(user_id, user_text, parse_mode="HTML")
-        
         await message.answer(
             f"✅ <b>Ответ на заявку #{request_id} отправлен!</b>\n\n"
             f"<b>Текст ответа:</b>\n{response_text}",
             parse_mode="HTML"
         )
-        
-    except Exception as e:
-        await message.answer(f"❌ <b>Ошибка:</b> {e}", parse_mode="HTML")
+        return
+    
+    answered_ids = {request.id for request in answered}
+    missing = [request_id for request_id, _ in answers if request_id not in answered_ids]
+    failed = [request.id for request, status in zip(answered, statuses) if status == "failed"]
+    
+    summary = (
+        f"📋 <b>Итог ответов (#{label})</b>\n\n"
+        f"✅ <b>Отвечено:</b> {len(answered)}\n"
+        f"📨 <b>Доставлено:</b> {statuses.count('sent')}\n"
+        f"⏳ <b>В очереди на доставку:</b> {statuses.count('queued')}\n"
+    )
+    if failed:
+        summary += f"🚫 <b>Не доставлено:</b> {', '.join(f'#{i}' for i in failed)}\n"
+    if missing:
+        summary += f"❌ <b>Не найдены или уже обработаны:</b> {', '.join(f'#{i}' for i in missing[:50])}"
+        summary += " ..." if len(missing) > 50 else ""
+    await message.answer(summary, parse_mode="HTML")
+
+@dp.message(Command("заявка"))
+async def cmd_answer_vouch(message: Message, command: CommandObject):
+    await answer_requests(message, command)
+
+@dp.message(Command("жалоба"))
+async def cmd_answer_complaint(message: Message, command: CommandObject):
+    await answer_requests(message, command)
+
+@dp.message(Command("покупка"))
+async def cmd_answer_buy(message: Message, command: CommandObject):
+    await answer_requests(message, command)
 
 # ============ УПРАВЛЕНИЕ БАННЕРОМ ============
 @dp.message(Command("setbanner"))
@@ -319,9 +968,7 @@ async def save_banner(message: Message):
     if message.from_user.id != ADMIN_ID:
         return
     try:
-        file_id = message.photo[-1].file_id
-        file = await bot.get_file(file_id)
-        await bot.download_file(file.file_path, BANNER_PATH)
+        await banner.replace(bot, message.photo[-1])
         await message.answer("✅ <b>Баннер установлен!</b>", parse_mode="HTML")
     except Exception as e:
         await message.answer(f"❌ <b>Ошибка:</b> {e}", parse_mode="HTML")
@@ -332,30 +979,28 @@ async def remove_banner(message: Message):
         await message.answer("❌ <b>Нет доступа</b>", parse_mode="HTML")
         return
     try:
-        if os.path.exists(BANNER_PATH):
-            os.remove(BANNER_PATH)
+        if await banner.remove():
             await message.answer("✅ <b>Баннер удален</b>", parse_mode="HTML")
         else:
             await message.answer("❌ <b>Баннер не найден</b>", parse_mode="HTML")
     except Exception as e:
         await message.answer(f"❌ <b>Ошибка:</b> {e}", parse_mode="HTML")
 
+# ============ ПОВТОРНЫЕ ЗАЯВКИ ============
+async def answer_duplicate(message: Message, state: FSMContext, label: str, request_id: int):
+    await message.answer(
+        f"ℹ️ <b>Такая заявка уже отправлена</b>\n\n"
+        f"<code>┌─ {label} #{request_id}</code>\n"
+        f"<code>└─ Повторно отправлять не нужно</code>\n\n"
+        f"⏳ <b>Ответ от @{OWNER_USERNAME} придёт сюда</b>",
+        parse_mode="HTML"
+    )
+    await state.clear()
+
 # ============ УТОЧНИТЬ РУЧЕНИЕ ============
-@dp.callback_query(F.data == "vouch_check")
+@dp.callback_query(F.data == "vouch_check", flags={"throttle": "navigation"})
 async def vouch_check(call: CallbackQuery, state: FSMContext):
-    await call.message.delete()
-    
-    text = (
-        "❓ <b>Уточнение ручения</b>\n\n"
-        "<b>Введите @юзернейм человека:</b>\n"
-        "👉 Например: @durov"
-    )
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔙 Назад в меню", callback_data="back_to_menu")]
-    ])
-    
-    await bot.send_message(call.from_user.id, text, reply_markup=keyboard, parse_mode="HTML")
+    await show_screen(bot, call.message, call.from_user.id, SCREENS["vouch_check"], banner)
     await state.set_state(VouchStates.waiting_for_target)
     await call.answer()
 
@@ -372,11 +1017,15 @@ async def process_target(message: Message, state: FSMContext):
         "👉 <b>Только цифры</b>, например: 500"
     )
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔙 Назад в меню", callback_data="back_to_menu")]
-    ])
+    verdict = await verdicts.get(target)
+    if verdict:
+        text = (
+            f"📌 <b>По {html.escape(target)} уже есть ответ</b> ({verdict.date}):\n"
+            f"{verdict.text}\n\n"
+            f"Если нужна свежая проверка — продолжайте.\n\n"
+        ) + text
     
-    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+    await message.answer(text, reply_markup=BACK_KEYBOARD, parse_mode="HTML")
     await state.set_state(VouchStates.waiting_for_amount)
 
 @dp.message(VouchStates.waiting_for_amount)
@@ -390,16 +1039,12 @@ async def process_amount(message: Message, state: FSMContext):
             "👉 Например: <b>$, ₽, €, грн, тенге</b>"
         )
         
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔙 Назад в меню", callback_data="back_to_menu")]
-        ])
-        
-        await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+        await message.answer(text, reply_markup=BACK_KEYBOARD, parse_mode="HTML")
         await state.set_state(VouchStates.waiting_for_currency)
     except ValueError:
         await message.answer("❌ <b>Введите число (только цифры)</b>", parse_mode="HTML")
 
-@dp.message(VouchStates.waiting_for_currency)
+@dp.message(VouchStates.waiting_for_currency, flags={"throttle": "submit"})
 async def process_currency(message: Message, state: FSMContext):
     currency = message.text.strip()
     data = await state.get_data()
@@ -408,15 +1053,15 @@ async def process_currency(message: Message, state: FSMContext):
     user_id = message.from_user.id
     username = message.from_user.username or "нет юзернейма"
     
-    conn = sqlite3.connect('bot_database.db')
-    c = conn.cursor()
-    c.execute('''INSERT INTO vouch_requests 
-                 (user_id, target_username, amount, currency, request_date) 
-                 VALUES (?, ?, ?, ?, ?)''',
-              (user_id, target, amount, currency, datetime.now().strftime("%d.%m.%Y %H:%M")))
-    request_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    fingerprint = dedup.fingerprint("vouch", user_id, target=target, amount=amount, currency=currency)
+    request_id, created = await dedup.submit(
+        fingerprint, lambda fingerprint: db.vouches.create(user_id, target, amount, currency, fingerprint),
+        db.vouches.is_pending,
+    )
+    if not created:
+        await answer_duplicate(message, state, "ЗАЯВКА", request_id)
+        return
+    workqueue.push(db.vouches.table, request_id, amount, currency)
     
     admin_text = (
         f"🔔 <b>НОВАЯ ЗАЯВКА НА РУЧЕНИЕ</b>\n\n"
@@ -424,12 +1069,20 @@ async def process_currency(message: Message, state: FSMContext):
         f"<code>├─ От: @{username}</code>\n"
         f"<code>├─ Проверить: {target}</code>\n"
         f"<code>├─ Сумма: {amount} {currency}</code>\n"
-        f"<code>└─ Время: {datetime.now().strftime('%d.%m.%Y %H:%M')}</code>\n\n"
+        f"<code>└─ Время: {now_str()}</code>\n\n"
         f"<b>Чтобы ответить:</b>\n"
         f"<code>/заявка {request_id} ТЕКСТ ОТВЕТА</code>"
     )
+    verdict = await verdicts.get(target)
+    if verdict:
+        admin_text += (
+            f"\n\n📌 <b>Прошлый ответ</b> (#{verdict.request_id}, {verdict.date}):\n"
+            f"{verdict.text}"
+        )
+    admin_text += "\n\n" + await render_reputation(normalize_username(target))
+    summary = f"<code>#ЗАЯВКА {request_id}</code> {short(target)} — {amount} {short(currency, 16)} (от @{username})"
     
-    await bot.send_message(ADMIN_ID, admin_text, parse_mode="HTML")
+    await digest.notify("vouch", admin_text, summary, amount, currency)
     
     await message.answer(
         f"✅ <b>Запрос отправлен!</b>\n\n"
@@ -444,53 +1097,43 @@ async def process_currency(message: Message, state: FSMContext):
     await state.clear()
 
 # ============ ПОДАТЬ ЖАЛОБУ ============
-@dp.callback_query(F.data == "complaint")
+@dp.callback_query(F.data == "complaint", flags={"throttle": "navigation"})
 async def complaint(call: CallbackQuery, state: FSMContext):
-    await call.message.delete()
-    
-    text = (
-        "⚠️ <b>Подача жалобы</b>\n\n"
-        "📝 <b>Опишите ситуацию подробно:</b>\n"
-        "• <b>Кто обманул</b> (@юзернейм)\n"
-        "• <b>На какую сумму</b>\n"
-        "• <b>Что обещали и что получили</b>\n"
-        "• <b>Ссылки на скриншоты</b>\n\n"
-        "📨 <b>Я передам @orgazm для рассмотрения.</b>"
-    )
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔙 Назад в меню", callback_data="back_to_menu")]
-    ])
-    
-    await bot.send_message(call.from_user.id, text, reply_markup=keyboard, parse_mode="HTML")
+    await show_screen(bot, call.message, call.from_user.id, SCREENS["complaint"], banner)
     await state.set_state(ComplaintStates.waiting_for_complaint)
     await call.answer()
 
-@dp.message(ComplaintStates.waiting_for_complaint)
+@dp.message(ComplaintStates.waiting_for_complaint, flags={"throttle": "submit"})
 async def process_complaint(message: Message, state: FSMContext):
     complaint_text = message.text
     user_id = message.from_user.id
     username = message.from_user.username or "нет юзернейма"
     
-    conn = sqlite3.connect('bot_database.db')
-    c = conn.cursor()
-    c.execute('''INSERT INTO complaints 
-                 (user_id, complaint_text, complaint_date) 
-                 VALUES (?, ?, ?)''',
-              (user_id, complaint_text, datetime.now().strftime("%d.%m.%Y %H:%M")))
-    complaint_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    fingerprint = dedup.fingerprint("complaint", user_id, text=complaint_text)
+    complaint_id, created = await dedup.submit(
+        fingerprint, lambda fingerprint: db.complaints.create(user_id, complaint_text, fingerprint),
+        db.complaints.is_pending,
+    )
+    if not created:
+        await answer_duplicate(message, state, "ЖАЛОБА", complaint_id)
+        return
+    workqueue.push(db.complaints.table, complaint_id)
     
     admin_text = (
         f"⚠️ <b>НОВАЯ ЖАЛОБА</b>\n\n"
         f"<code>┌─ #ЖАЛОБА {complaint_id}</code>\n"
         f"<code>├─ От: @{username}</code>\n"
         f"<code>├─ Текст: {complaint_text[:100]}...</code>\n"
-        f"<code>└─ Время: {datetime.now().strftime('%d.%m.%Y %H:%M')}</code>"
+        f"<code>└─ Время: {now_str()}</code>"
     )
+    mentions = extract_mentions(complaint_text)[:SEARCH_MAX_MENTIONS]
+    if mentions:
+        admin_text += "\n\n🔗 <b>Упомянутые:</b>\n"
+        for username_norm in mentions:
+            admin_text += await render_mention_refs(username_norm)
+    summary = f"<code>#ЖАЛОБА {complaint_id}</code> {short(complaint_text, 80)} (от @{username})"
     
-    await bot.send_message(ADMIN_ID, admin_text, parse_mode="HTML")
+    await digest.notify("complaint", admin_text, summary)
     
     await message.answer(
         f"✅ <b>Жалоба отправлена!</b>\n\n"
@@ -503,21 +1146,9 @@ async def process_complaint(message: Message, state: FSMContext):
     await state.clear()
 
 # ============ КУПИТЬ РУЧЕНИЕ ============
-@dp.callback_query(F.data == "buy_vouch")
+@dp.callback_query(F.data == "buy_vouch", flags={"throttle": "navigation"})
 async def buy_vouch(call: CallbackQuery, state: FSMContext):
-    await call.message.delete()
-    
-    text = (
-        "💼 <b>Покупка ручения</b>\n\n"
-        "💰 <b>Введите сумму</b>, которую хотите внести:\n"
-        "👉 <b>Только цифры</b>, например: 1000"
-    )
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔙 Назад в меню", callback_data="back_to_menu")]
-    ])
-    
-    await bot.send_message(call.from_user.id, text, reply_markup=keyboard, parse_mode="HTML")
+    await show_screen(bot, call.message, call.from_user.id, SCREENS["buy_vouch"], banner)
     await state.set_state(BuyVouchStates.waiting_for_amount)
     await call.answer()
 
@@ -536,16 +1167,12 @@ async def buy_amount(message: Message, state: FSMContext):
             "👉 Например: <b>$, ₽, €, грн, тенге, TON</b>"
         )
         
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔙 Назад в меню", callback_data="back_to_menu")]
-        ])
-        
-        await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+        await message.answer(text, reply_markup=BACK_KEYBOARD, parse_mode="HTML")
         await state.set_state(BuyVouchStates.waiting_for_currency)
     except ValueError:
         await message.answer("❌ <b>Введите число (только цифры)</b>", parse_mode="HTML")
 
-@dp.message(BuyVouchStates.waiting_for_currency)
+@dp.message(BuyVouchStates.waiting_for_currency, flags={"throttle": "submit"})
 async def buy_currency(message: Message, state: FSMContext):
     currency = message.text.strip()
     data = await state.get_data()
@@ -553,25 +1180,26 @@ async def buy_currency(message: Message, state: FSMContext):
     user_id = message.from_user.id
     username = message.from_user.username or "нет юзернейма"
     
-    conn = sqlite3.connect('bot_database.db')
-    c = conn.cursor()
-    c.execute('''INSERT INTO buy_requests 
-                 (user_id, amount, currency, request_date) 
-                 VALUES (?, ?, ?, ?)''',
-              (user_id, amount, currency, datetime.now().strftime("%d.%m.%Y %H:%M")))
-    request_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    fingerprint = dedup.fingerprint("buy", user_id, amount=amount, currency=currency)
+    request_id, created = await dedup.submit(
+        fingerprint, lambda fingerprint: db.buys.create(user_id, amount, currency, fingerprint),
+        db.buys.is_pending,
+    )
+    if not created:
+        await answer_duplicate(message, state, "ЗАЯВКА", request_id)
+        return
+    workqueue.push(db.buys.table, request_id, amount, currency)
     
     admin_text = (
         f"💰 <b>НОВАЯ ЗАЯВКА НА ПОКУПКУ РУЧЕНИЯ</b>\n\n"
         f"<code>┌─ #ЗАЯВКА {request_id}</code>\n"
         f"<code>├─ От: @{username}</code>\n"
         f"<code>├─ Сумма: {amount} {currency}</code>\n"
-        f"<code>└─ Время: {datetime.now().strftime('%d.%m.%Y %H:%M')}</code>"
+        f"<code>└─ Время: {now_str()}</code>"
     )
+    summary = f"<code>#ЗАЯВКА {request_id}</code> покупка — {amount} {short(currency, 16)} (от @{username})"
     
-    await bot.send_message(ADMIN_ID, admin_text, parse_mode="HTML")
+    await digest.notify("buy", admin_text, summary, amount, currency)
     
     await message.answer(
         f"✅ <b>Заявка принята!</b>\n\n"
@@ -585,44 +1213,17 @@ async def buy_currency(message: Message, state: FSMContext):
     await state.clear()
 
 # ============ ИНФОРМАЦИЯ ============
-@dp.callback_query(F.data == "info")
+@dp.callback_query(F.data == "info", flags={"throttle": "navigation"})
 async def info(call: CallbackQuery):
-    await call.message.delete()
-    
-    info_text = (
-        "ℹ️ <b>О боте</b>\n\n"
-        "🤝 <b>Это единственный официальный проект ручений</b>\n"
-        "от <b>@orgazm</b>\n\n"
-        "❓ <b>Как уточнить ручение?</b>\n"
-        "1️⃣ <b>Нажмите кнопку «Уточнить ручение»</b>\n"
-        "2️⃣ <b>Введите @юзернейм человека</b>\n"
-        "3️⃣ <b>Введите сумму сделки</b>\n"
-        "4️⃣ <b>Введите валюту</b>\n"
-        "5️⃣ <b>Ожидайте ответа от @orgazm</b>\n\n"
-        "✅ <b>Если я РУЧНУСЬ</b> — человек надёжный, можете смело проводить сделку!\n\n"
-        "❌ <b>Если обманули:</b>\n"
-        "• <b>Напишите мне в ЛС @orgazm</b>\n"
-        "• <b>Приложите ВСЕ доказательства</b>\n"
-        "• <b>Я сниму ручение с мошенника</b>\n"
-        "• <b>ВОЗМЕЩУ вам полную сумму!</b>\n\n"
-        "‼️ <b>Остерегайтесь фейков!</b>\n"
-        "✅ <b>Официальный бот — @OrgazmDeals_Bot</b>"
-    )
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔙 Назад в меню", callback_data="back_to_menu")],
-        [InlineKeyboardButton(text="📞 Мой ЛС", url=f"https://t.me/{OWNER_USERNAME}")]
-    ])
-    
-    await bot.send_message(call.from_user.id, info_text, reply_markup=keyboard, parse_mode="HTML")
+    await show_screen(bot, call.message, call.from_user.id, SCREENS["info"], banner)
     await call.answer()
 
 # ============ НАЗАД В МЕНЮ ============
-@dp.callback_query(F.data == "back_to_menu")
+@dp.callback_query(F.data == "back_to_menu", flags={"throttle": "navigation"})
 async def back_to_menu(call: CallbackQuery, state: FSMContext):
     await state.clear()
-    await call.message.delete()
-    await show_main_menu(call.from_user.id, call.from_user.id)
+    await show_screen(bot, call.message, call.from_user.id, SCREENS["menu"], banner)
+    await call.answer()
 
 # ============ ЗАПУСК ============
 async def main():
@@ -633,7 +1234,42 @@ async def main():
     print("\n📋 Доступные команды:")
     print("/pending - все ожидающие заявки")
     print("/заявка НОМЕР ТЕКСТ - ответ на ручение")
-    await dp.start_polling(bot)
+    
+    if BOT_WORKERS > 1:
+        # Сам процесс обновления не обрабатывает, только раздаёт их воркерам
+        print(f"⚙️ Воркеров: {BOT_WORKERS}")
+        if PERF_METRICS:
+            # У воркеров нет своего веб-сервера, а супервизор метрики не собирает
+            logging.warning("PERF_METRICS не работает при BOT_WORKERS > 1: %s не обслуживается, "
+                            "/perf показывает только воркер 0", PERF_METRICS_PATH)
+        webhook = None
+        if BOT_MODE == "webhook":
+            webhook = dict(url=WEBHOOK_URL, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET, host=WEB_SERVER_HOST,
+                           port=WEB_SERVER_PORT, delete_on_shutdown=WEBHOOK_DELETE_ON_SHUTDOWN)
+        await run_supervisor(bot, dp.resolve_used_update_types(), BOT_WORKERS, ADMIN_ID, DB_PATH, webhook)
+        return
+    
+    metrics_app = perf.metrics_app(PERF_METRICS_PATH) if perf and PERF_METRICS else None
+    
+    if BOT_MODE == "webhook":
+        print(f"🌐 Вебхук: {WEB_SERVER_HOST}:{WEB_SERVER_PORT}{WEBHOOK_PATH}")
+        await run_webhook(
+            dp, bot,
+            url=WEBHOOK_URL,
+            path=WEBHOOK_PATH,
+            secret=WEBHOOK_SECRET,
+            host=WEB_SERVER_HOST,
+            port=WEB_SERVER_PORT,
+            delete_on_shutdown=WEBHOOK_DELETE_ON_SHUTDOWN,
+            app=metrics_app,
+        )
+    else:
+        if metrics_app is not None:
+            runner = web.AppRunner(metrics_app)
+            await runner.setup()
+            await web.TCPSite(runner, WEB_SERVER_HOST, WEB_SERVER_PORT).start()
+            print(f"📈 Метрики: {WEB_SERVER_HOST}:{WEB_SERVER_PORT}{PERF_METRICS_PATH}")
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from db import Database
+from outbox import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class Broadcaster:
+    """Массовая рассылка по таблице users с продолжением после перезапуска.
+
+    Получатели читаются из базы порциями по chunk_size в порядке user_id, так что
+    в памяти никогда не лежит весь список. После каждой порции в broadcast_jobs
+    сохраняется последний обработанный user_id: после падения рассылка
+    продолжится с этого места. Скорость ограничена общим ведром токенов бота,
+    TelegramRetryAfter приостанавливает всё ведро, а не одного отправителя.
+    Пользователи, заблокировавшие бота, помечаются status='blocked' и не
+    получают рассылок, пока снова не нажмут /start. Рассылка, упавшая с
+    ошибкой, получает status='failed'.
+    """
+
+    def __init__(self, db: Database, bot: Bot, bucket: TokenBucket, concurrency: int = 20,
+                 chunk_size: int = 100, progress_interval: float = 3.0):
+        self.db = db
+        self.bot = bot
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self._tasks: Dict[int, asyncio.Task] = {}
+        # on_blocked(user_ids) вызывается после пометки status='blocked' — сюда подключается registry.py
+        self.on_blocked: Optional[Callable[[List[int]], None]] = None
+
+    # ============ УПРАВЛЕНИЕ ============
+    async def start(self, text: str, status_chat_id: int) -> Optional[int]:
+        """Создаёт и запускает рассылку. None — если другая рассылка ещё идёт."""
+        if self._tasks:
+            return None
+
+        # Задачи нет, значит строки 'running' остались от рассылки, которую
+        # некому продолжить, — закрываем их, чтобы не мешали новой
+        for job_id in await self._orphaned():
+            logger.warning("Рассылка #%s числилась идущей без задачи, помечаю прерванной", job_id)
+            await self._finish(job_id, "failed")
+
+        def query(conn):
+            if conn.execute("SELECT 1 FROM broadcast_jobs WHERE status='running'").fetchone():
+                return None
+            total = conn.execute("SELECT COUNT(*) FROM users WHERE status IS NOT 'blocked'").fetchone()[0]
+            return conn.execute(
+                "INSERT INTO broadcast_jobs (text, total, status_chat_id, created_ts) VALUES (?, ?, ?, ?)",
+                (text, total, status_chat_id, int(time.time())),
+            ).lastrowid
+        job_id = await self.db.run(query)
+        if job_id is None:
+            return None
+
+        job = await self._load(job_id)
+        status = await self.bot.send_message(status_chat_id, self._progress_text(job), parse_mode="HTML")
+        await self.db.run(lambda conn: conn.execute(
+            "UPDATE broadcast_jobs SET status_message_id=? WHERE id=?", (status.message_id, job_id)
+        ))
+        self._spawn(job_id)
+        return job_id
+
+    async def resume(self) -> None:
+        """Продолжает рассылки, прерванные остановкой бота."""
+        def query(conn):
+            return [row[0] for row in conn.execute("SELECT id FROM broadcast_jobs WHERE status='running'")]
+        for job_id in await self.db.run(query):
+            logger.info("Продолжаю рассылку #%s", job_id)
+            self._spawn(job_id)
+
+    async def cancel(self) -> Optional[int]:
+        """Останавливает текущую рассылку насовсем. Возвращает её номер.
+
+        Строка 'running' без живой задачи тоже останавливается.
+        """
+        for job_id, task in list(self._tasks.items()):
+            task.cancel()
+            await self._finish(job_id, "cancelled")
+            return job_id
+        for job_id in await self._orphaned():
+            await self._finish(job_id, "cancelled")
+            return job_id
+        return None
+
+    async def close(self) -> None:
+        """Останавливает задачи при выключении бота; рассылки продолжатся после запуска."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _orphaned(self) -> List[int]:
+        """Рассылки со status='running', у которых в этом процессе нет задачи."""
+        def query(conn):
+            return [row[0] for row in conn.execute("SELECT id FROM broadcast_jobs WHERE status='running'")]
+        return [job_id for job_id in await self.db.run(query) if job_id not in self._tasks]
+
+    async def _finish(self, job_id: int, status: str) -> None:
+        await self.db.run(lambda conn: conn.execute(
+            "UPDATE broadcast_jobs SET status=?, finished_ts=? WHERE id=? AND status='running'",
+            (status, int(time.time()), job_id),
+        ))
+        await self._report(job_id)
+
+    def _spawn(self, job_id: int) -> None:
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    # ============ РАССЫЛКА ============
+    async def _load(self, job_id: int):
+        return await self.db.run(lambda conn: conn.execute(
+            "SELECT * FROM broadcast_jobs WHERE id=?", (job_id,)
+        ).fetchone())
+
+    async def _run(self, job_id: int) -> None:
+        job = await self._load(job_id)
+        text = job["text"]
+        cursor = job["last_user_id"]
+        counters = {"sent": job["sent"], "failed": job["failed"], "blocked": job["blocked"]}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        last_progress = 0.0
+
+        async def send(user_id: int) -> str:
+            async with semaphore:
+                while True:
+                    while not self.bucket.try_take():
+                        await asyncio.sleep(self.bucket.delay())
+                    try:
+                        await self.bot.send_message(user_id, text, parse_mode="HTML")
+                        return "sent"
+                    except TelegramRetryAfter as e:
+                        # Лимит общий для бота: ждут все отправители, а не только получивший ошибку
+                        self.bucket.pause(e.retry_after)
+                    except TelegramForbiddenError:
+                        return "blocked"
+                    except TelegramBadRequest:
+                        return "failed"
+                    except Exception as e:
+                        logger.warning("Рассылка #%s: ошибка отправки %s: %s", job_id, user_id, e)
+                        return "failed"
+
+        try:
+            while True:
+                chunk = await self.db.run(lambda conn: [row[0] for row in conn.execute(
+                    "SELECT user_id FROM users WHERE user_id > ? AND status IS NOT 'blocked' "
+                    "ORDER BY user_id LIMIT ?", (cursor, self.chunk_size)
+                )])
+                if not chunk:
+                    break
+
+                results = await asyncio.gather(*(send(user_id) for user_id in chunk))
+                blocked = [user_id for user_id, result in zip(chunk, results) if result == "blocked"]
+                for result in results:
+                    counters[result] += 1
+                cursor = chunk[-1]
+                await self.db.run(self._save_progress, job_id, cursor, counters, blocked)
+                if blocked and self.on_blocked is not None:
+                    self.on_blocked(blocked)
+
+                if time.monotonic() - last_progress >= self.progress_interval:
+                    last_progress = time.monotonic()
+                    await self._report(job_id)
+
+            await self._finish(job_id, "done")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Рассылка #%s прервана ошибкой", job_id)
+            await self._finish(job_id, "failed")
+
+    @staticmethod
+    def _save_progress(conn, job_id: int, cursor: int, counters: dict, blocked: list) -> None:
+        conn.execute(
+            "UPDATE broadcast_jobs SET last_user_id=?, sent=?, failed=?, blocked=? WHERE id=?",
+            (cursor, counters["sent"], counters["failed"], counters["blocked"], job_id),
+        )
+        conn.executemany("UPDATE users SET status='blocked' WHERE user_id=?", [(u,) for u in blocked])
+
+    # ============ ПРОГРЕСС ============
+    @staticmethod
+    def _progress_text(job) -> str:
+        done = job["sent"] + job["failed"] + job["blocked"]
+        total = job["total"] or 0
+        percent = min(100, done * 100 // total) if total else 100
+        titles = {
+            "running": "📣 <b>Рассылка идёт</b>",
+            "done": "✅ <b>Рассылка завершена</b>",
+            "cancelled": "⛔ <b>Рассылка остановлена</b>",
+            "failed": "⚠️ <b>Рассылка прервана ошибкой</b>",
+        }
+        return (
+            f"{titles.get(job['status'], job['status'])} #{job['id']}\n\n"
+            f"<code>┌─ Прогресс: {done}/{total} ({percent}%)</code>\n"
+            f"<code>├─ Доставлено: {job['sent']}</code>\n"
+            f"<code>├─ Заблокировали бота: {job['blocked']}</code>\n"
+            f"<code>└─ Ошибки: {job['failed']}</code>"
+        )
+
+    async def _report(self, job_id: int) -> None:
+        job = await self._load(job_id)
+        if not job["status_message_id"]:
+            return
+        try:
+            await self.bot.edit_message_text(
+                self._progress_text(job), chat_id=job["status_chat_id"],
+                message_id=job["status_message_id"], parse_mode="HTML",
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.warning("Не удалось обновить прогресс рассылки #%s: %s", job_id, e)
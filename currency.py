@@ -0,0 +1,83 @@
+"""Валюты, которые пользователи вводят как попало: "$", "usd", "₽", "руб", "TON".
+
+Курсы к рублю грубые и нужны только чтобы сравнивать суммы между собой
+(очередь заявок, срочные уведомления). Бухгалтерии на них не построить.
+
+В базе сумма хранится целым числом в минимальных единицах валюты (копейки,
+центы, сатоши) рядом с кодом валюты — см. to_minor(). Справочник живёт
+только здесь: после правки псевдонимов /recount заново распознаёт валюты.
+"""
+import re
+from typing import Dict, Optional
+
+# Код валюты -> примерная стоимость одной единицы в рублях
+RUB_RATES: Dict[str, float] = {
+    "RUB": 1.0,
+    "USD": 90.0,
+    "USDT": 90.0,
+    "EUR": 98.0,
+    "GBP": 115.0,
+    "UAH": 2.2,
+    "KZT": 0.18,
+    "BYN": 28.0,
+    "UZS": 0.007,
+    "TON": 300.0,
+    "BTC": 6_000_000.0,
+}
+
+# Знаков после запятой у минимальной единицы валюты. У уже используемой валюты
+# число знаков менять нельзя: суммы в базе хранятся в её минимальных единицах
+MINOR_UNITS: Dict[str, int] = {
+    "RUB": 2, "USD": 2, "USDT": 2, "EUR": 2, "GBP": 2, "UAH": 2, "KZT": 2, "BYN": 2, "UZS": 2,
+    "TON": 9,
+    "BTC": 8,
+}
+
+# Код для валюты, которую не удалось узнать (по ISO 4217 — «без валюты»)
+UNKNOWN_CURRENCY = "XXX"
+
+CURRENCY_ALIASES: Dict[str, str] = {
+    "₽": "RUB", "р": "RUB", "руб": "RUB", "рубль": "RUB", "рубля": "RUB", "рублей": "RUB", "rub": "RUB", "rur": "RUB",
+    "$": "USD", "usd": "USD", "доллар": "USD", "доллара": "USD", "долларов": "USD", "долл": "USD", "бакс": "USD",
+    "баксов": "USD",
+    "usdt": "USDT", "tether": "USDT", "юсдт": "USDT",
+    "€": "EUR", "eur": "EUR", "евро": "EUR",
+    "£": "GBP", "gbp": "GBP", "фунт": "GBP",
+    "₴": "UAH", "грн": "UAH", "гривна": "UAH", "гривен": "UAH", "гривны": "UAH", "uah": "UAH",
+    "₸": "KZT", "тенге": "KZT", "тг": "KZT", "kzt": "KZT",
+    "byn": "BYN", "бел": "BYN", "белруб": "BYN",
+    "uzs": "UZS", "сум": "UZS", "сумов": "UZS",
+    "ton": "TON", "тон": "TON", "тонов": "TON",
+    "btc": "BTC", "биткоин": "BTC", "бтц": "BTC",
+}
+
+
+def resolve_currency(text: Optional[str]) -> Optional[str]:
+    """Код валюты по вводу пользователя или None, если валюту не узнать."""
+    value = re.sub(r"[\s.]+", "", (text or "").casefold())
+    if not value:
+        return None
+    if value.upper() in RUB_RATES:
+        return value.upper()
+    return CURRENCY_ALIASES.get(value)
+
+
+def to_rub(amount: Optional[float], currency: Optional[str]) -> float:
+    """Примерная сумма в рублях. Неизвестная валюта считается рублями."""
+    rate = RUB_RATES.get(resolve_currency(currency), 1.0)
+    return (amount or 0.0) * rate
+
+
+def currency_code(text: Optional[str]) -> str:
+    """Код валюты для хранения: нераспознанная валюта получает UNKNOWN_CURRENCY."""
+    return resolve_currency(text) or UNKNOWN_CURRENCY
+
+
+def to_minor(amount: Optional[float], code: str) -> int:
+    """Сумма в минимальных единицах валюты: 12.5 USD -> 1250."""
+    return round((amount or 0.0) * 10 ** MINOR_UNITS.get(code, 2))
+
+
+def from_minor(amount_minor: int, code: str) -> float:
+    """Обратно к to_minor(): 1250 USD -> 12.5."""
+    return amount_minor / 10 ** MINOR_UNITS.get(code, 2)
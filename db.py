@@ -0,0 +1,872 @@
+import asyncio
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from currency import RUB_RATES, UNKNOWN_CURRENCY, currency_code, from_minor, to_minor, to_rub
+
+T = TypeVar("T")
+
+DATE_FORMAT = "%d.%m.%Y %H:%M"
+# Ключ суточных агрегатов: строки ГГГГ-ММ-ДД сравниваются как даты
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def now_str() -> str:
+    return datetime.now().strftime(DATE_FORMAT)
+
+
+def stamp() -> Tuple[str, int]:
+    """Текущее время в двух видах: строка для показа и epoch-секунды для сортировки и индексов."""
+    now = datetime.now()
+    return now.strftime(DATE_FORMAT), int(now.timestamp())
+
+
+def parse_date(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        return int(datetime.strptime(value, DATE_FORMAT).timestamp())
+    except ValueError:
+        return None
+
+
+def normalize_username(username: str) -> str:
+    """Приводит @юзернейм или ссылку t.me к ключу для поиска: без @ и в нижнем регистре."""
+    value = username.strip()
+    for prefix in ("https://", "http://"):
+        if value.lower().startswith(prefix):
+            value = value[len(prefix):]
+    if value.lower().startswith("t.me/"):
+        value = value[len("t.me/"):]
+    return value.lstrip("@").strip().casefold()
+
+
+MENTION_RE = re.compile(r"(?:@|t\.me/)([A-Za-z0-9_]{3,32})", re.IGNORECASE)
+
+
+def extract_mentions(text: str) -> List[str]:
+    """Все @юзернеймы и ссылки t.me из текста в виде ключей normalize_username."""
+    return sorted({normalize_username(name) for name in MENTION_RE.findall(text or "")})
+
+
+def fts_query(text: str, max_terms: int = 8) -> Optional[str]:
+    """Превращает ввод админа в безопасный запрос FTS5.
+
+    Синтаксис FTS5 (кавычки, NEAR, OR, звёздочки) из ввода не пропускается:
+    каждое слово берётся в кавычки, все слова обязательны, последнее ищется
+    по префиксу. None — если в запросе нет ни одного слова.
+    """
+    words = re.findall(r"\w+", text)[:max_terms]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+# Маркеры вердикта в ответе админа. Отрицательные проверяются первыми:
+# «не ручаюсь» содержит «ручаюсь»
+NEGATIVE_MARKERS = ("❌", "⛔", "🚫", "не руча", "скам", "кидал", "кидок", "мошен", "фейк", "обман")
+POSITIVE_MARKERS = ("✅", "👍", "ручаюсь", "надёжн", "надежн", "проверен")
+
+
+def classify_verdict(text: Optional[str]) -> int:
+    """1 — админ ручается, -1 — не ручается, 0 — по тексту не понять."""
+    value = (text or "").casefold()
+    if any(marker in value for marker in NEGATIVE_MARKERS):
+        return -1
+    if any(marker in value for marker in POSITIVE_MARKERS):
+        return 1
+    return 0
+
+
+# ============ МОДЕЛИ ============
+@dataclass
+class User:
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    reg_date: Optional[str]
+    status: str
+    reg_ts: Optional[int]
+
+
+@dataclass
+class VouchRequest:
+    id: int
+    user_id: int
+    target_username: str
+    amount: float
+    currency: str
+    status: str
+    request_date: Optional[str]
+    admin_answer: Optional[str]
+    admin_response_text: Optional[str]
+    target_norm: Optional[str]
+    answer_date: Optional[str]
+    request_ts: Optional[int]
+    answer_ts: Optional[int]
+    currency_code: Optional[str]
+    amount_minor: Optional[int]
+
+
+@dataclass
+class Complaint:
+    id: int
+    user_id: int
+    complaint_text: str
+    status: str
+    complaint_date: Optional[str]
+    admin_response_text: Optional[str]
+    complaint_ts: Optional[int]
+
+
+@dataclass
+class BuyRequest:
+    id: int
+    user_id: int
+    amount: float
+    currency: str
+    status: str
+    request_date: Optional[str]
+    admin_response_text: Optional[str]
+    request_ts: Optional[int]
+    currency_code: Optional[str]
+    amount_minor: Optional[int]
+
+
+@dataclass
+class Reputation:
+    username_norm: str
+    checks: int
+    positive: int
+    negative: int
+    complaints: int
+    total_amount: float  # в рублях, см. currency.to_rub
+    last_activity_ts: Optional[int]
+
+
+@dataclass
+class AmountSummary:
+    """Итог по одной валюте за период: суммы в минимальных единицах, медиана по гистограмме."""
+    currency_code: str
+    requests: int
+    total_minor: int
+    median_minor: int
+
+    @property
+    def total(self) -> float:
+        return from_minor(self.total_minor, self.currency_code)
+
+    @property
+    def median(self) -> float:
+        return from_minor(self.median_minor, self.currency_code)
+
+
+# ============ СЧЁТЧИКИ ============
+# Счётчики для админки поддерживаются триггерами при вставке и смене статуса
+# (см. migrations.py), поэтому /admin читает готовые числа вместо COUNT(*).
+REQUEST_TABLES = ("vouch_requests", "complaints", "buy_requests")
+
+# Колонка с временем создания заявки (epoch) в каждой таблице
+CREATED_COLUMNS = {
+    "vouch_requests": "request_ts",
+    "complaints": "complaint_ts",
+    "buy_requests": "request_ts",
+}
+
+STATS_QUERIES = {
+    "users": "SELECT COUNT(*) FROM users",
+    **{f"pending_{table}": f"SELECT COUNT(*) FROM {table} WHERE status='pending'" for table in REQUEST_TABLES},
+}
+
+
+def rebuild_counters(conn) -> dict:
+    counters = {name: conn.execute(sql).fetchone()[0] for name, sql in STATS_QUERIES.items()}
+    conn.executemany(
+        "INSERT INTO stats_counters (name, value) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET value=excluded.value",
+        counters.items(),
+    )
+    return counters
+
+
+# ============ РЕПУТАЦИЯ ============
+# Сводка по проверяемому человеку обновляется приращениями в той же транзакции,
+# что и вставка заявки, ответ на неё или новая жалоба с упоминанием.
+# Перенос в архив её не трогает. Суммы переводятся в рубли по грубому курсу
+# из currency.py: складывать рубли с долларами как есть бессмысленно.
+REPUTATION_UPSERT = (
+    "INSERT INTO reputation "
+    "(username_norm, checks, positive, negative, complaints, total_amount, last_activity_ts) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(username_norm) DO UPDATE SET "
+    "checks = checks + excluded.checks, positive = positive + excluded.positive, "
+    "negative = negative + excluded.negative, complaints = complaints + excluded.complaints, "
+    "total_amount = total_amount + excluded.total_amount, "
+    "last_activity_ts = MAX(COALESCE(last_activity_ts, 0), COALESCE(excluded.last_activity_ts, 0))"
+)
+
+
+def bump_reputation(conn, username_norm: str, ts: Optional[int], checks: int = 0, verdict: int = 0,
+                    complaints: int = 0, amount: float = 0.0) -> None:
+    conn.execute(REPUTATION_UPSERT, (
+        username_norm, checks, int(verdict > 0), int(verdict < 0), complaints, amount or 0.0, ts,
+    ))
+
+
+def rebuild_reputation(conn) -> int:
+    """Пересчитывает таблицу reputation с нуля по заявкам и жалобам, включая архив."""
+    totals = {}
+
+    def bump(name, ts, checks=0, verdict=0, complaints=0, amount=0.0):
+        row = totals.setdefault(name, [0, 0, 0, 0, 0.0, None])
+        row[0] += checks
+        row[1] += verdict > 0
+        row[2] += verdict < 0
+        row[3] += complaints
+        row[4] += amount or 0.0
+        row[5] = max(row[5] or 0, ts or 0) or None
+
+    for name, amount, currency, status, text, request_ts, answer_ts in conn.execute(
+        "SELECT target_norm, amount, currency, status, admin_response_text, request_ts, answer_ts "
+        "FROM vouch_requests_all WHERE target_norm IS NOT NULL"
+    ):
+        bump(name, request_ts, checks=1, amount=to_rub(amount, currency))
+        if status == "answered":
+            bump(name, answer_ts, verdict=classify_verdict(text))
+    for name, ts in conn.execute(
+        "SELECT m.username_norm, c.complaint_ts FROM complaint_mentions m "
+        "JOIN complaints_all c ON c.id = m.complaint_id"
+    ):
+        bump(name, ts, complaints=1)
+
+    conn.execute("DELETE FROM reputation")
+    conn.executemany(
+        "INSERT INTO reputation "
+        "(username_norm, checks, positive, negative, complaints, total_amount, last_activity_ts) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(name, *row) for name, row in totals.items()],
+    )
+    return len(totals)
+
+
+# ============ СУММЫ ============
+# Рядом с amount/currency в том виде, как их ввёл пользователь, хранятся код
+# валюты и сумма целым числом в минимальных единицах (см. currency.py).
+# Каждая новая заявка добавляется в суточный агрегат amount_daily в той же
+# транзакции: по строке на (тип заявки, день, валюта, корзина гистограммы).
+AMOUNT_TABLES = ("vouch_requests", "buy_requests")
+
+# Корзина гистограммы — сумма, округлённая вниз до стольких значащих цифр
+HISTOGRAM_DIGITS = 2
+
+
+def day_key(ts: int) -> str:
+    return datetime.fromtimestamp(ts).strftime(DAY_FORMAT)
+
+
+def amount_bucket(amount_minor: int) -> int:
+    """Корзина гистограммы для суммы. Медиана по корзинам ошибается меньше чем на 10%,
+    а круглые суммы, которые вводят чаще всего, попадают в корзину точно."""
+    if amount_minor <= 0:
+        return 0
+    scale = 10 ** max(len(str(amount_minor)) - HISTOGRAM_DIGITS, 0)
+    return amount_minor // scale * scale
+
+
+AMOUNT_DAILY_UPSERT = (
+    "INSERT INTO amount_daily (kind, day, currency_code, bucket, requests, total_minor) "
+    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(kind, day, currency_code, bucket) DO UPDATE SET "
+    "requests = requests + excluded.requests, total_minor = total_minor + excluded.total_minor"
+)
+
+
+def bump_amount_daily(conn, kind: str, code: str, ts: int, amount_minor: int) -> None:
+    conn.execute(AMOUNT_DAILY_UPSERT, (kind, day_key(ts), code, amount_bucket(amount_minor), 1, amount_minor))
+
+
+def rebuild_amounts(conn) -> int:
+    """Заново распознаёт валюты без кода или с кодом XXX и пересчитывает amount_daily
+    с нуля, включая архив. Возвращает число строк агрегатов."""
+    conn.create_function("currency_code", 1, currency_code, deterministic=True)
+    conn.create_function("to_minor", 2, to_minor, deterministic=True)
+    for table in AMOUNT_TABLES:
+        for part in (table, f"{table}_archive"):
+            conn.execute(
+                f"UPDATE {part} SET currency_code = currency_code(currency), "
+                f"amount_minor = to_minor(amount, currency_code(currency)) "
+                f"WHERE currency_code IS NULL OR currency_code = ?", (UNKNOWN_CURRENCY,)
+            )
+
+    totals: Dict[tuple, List[int]] = {}
+    for table in AMOUNT_TABLES:
+        for code, ts, amount_minor in conn.execute(
+            f"SELECT currency_code, request_ts, amount_minor FROM {table}_all WHERE request_ts IS NOT NULL"
+        ):
+            row = totals.setdefault((table, day_key(ts), code, amount_bucket(amount_minor)), [0, 0])
+            row[0] += 1
+            row[1] += amount_minor
+
+    conn.execute("DELETE FROM amount_daily")
+    conn.executemany(
+        "INSERT INTO amount_daily (kind, day, currency_code, bucket, requests, total_minor) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(*key, *row) for key, row in totals.items()],
+    )
+    return len(totals)
+
+
+# ============ ПОВТОРНЫЕ ЗАЯВКИ ============
+@dataclass
+class Fingerprint:
+    """Отпечаток заявки (см. dedup.py) и момент, до которого такая же заявка считается повтором."""
+    key: str
+    expires_ts: int
+
+
+class DuplicateRequest(Exception):
+    """Такая же заявка уже принята, request_id — её номер."""
+
+    def __init__(self, request_id: int):
+        super().__init__(request_id)
+        self.request_id = request_id
+
+
+def claim_fingerprint(conn, fingerprint: Optional[Fingerprint], kind: str) -> None:
+    """Занимает отпечаток в транзакции создания заявки или бросает DuplicateRequest.
+
+    Отпечаток перезаписывается, если он просрочен или его заявка уже не ожидает
+    ответа: повтор отвеченной заявки — это новая заявка, ответ на старую уже
+    пришёл. kind — таблица заявки. Уникальность держит первичный ключ,
+    так что повтор не пройдёт и из другого процесса: запись отпечатка идёт
+    первой и берёт блокировку на запись до конца транзакции.
+    """
+    if fingerprint is None:
+        return
+    now = int(time.time())
+    cursor = conn.execute(
+        "INSERT INTO submission_fingerprints (fingerprint, kind, request_id, expires_ts) VALUES (?, ?, NULL, ?) "
+        "ON CONFLICT(fingerprint) DO UPDATE SET kind=excluded.kind, request_id=NULL, expires_ts=excluded.expires_ts "
+        f"WHERE submission_fingerprints.expires_ts <= ? OR NOT EXISTS (SELECT 1 FROM {kind} "
+        f"WHERE id = submission_fingerprints.request_id AND status = 'pending')",
+        (fingerprint.key, kind, fingerprint.expires_ts, now),
+    )
+    if cursor.rowcount == 0:
+        row = conn.execute(
+            "SELECT request_id FROM submission_fingerprints WHERE fingerprint=?", (fingerprint.key,)
+        ).fetchone()
+        raise DuplicateRequest(row[0])
+
+
+def bind_fingerprint(conn, fingerprint: Optional[Fingerprint], request_id: int) -> None:
+    if fingerprint is not None:
+        conn.execute(
+            "UPDATE submission_fingerprints SET request_id=? WHERE fingerprint=?", (request_id, fingerprint.key)
+        )
+
+
+# ============ ПОДКЛЮЧЕНИЕ ============
+class Database:
+    """Одно долгоживущее WAL-соединение, все запросы идут в отдельном потоке.
+
+    Поток у executor'а ровно один, поэтому запросы выполняются строго по очереди
+    и соединение никогда не используется из двух потоков одновременно,
+    а event loop не блокируется на открытии файла и fsync.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Суммарное время транзакций в потоке БД и их число — для bench/ и статистики
+        self.busy_time = 0.0
+        self.transactions = 0
+        # observer(fn, секунды) вызывается после каждого run() — сюда подключается perf.py
+        self.observer: Optional[Callable[[Callable, float], None]] = None
+
+        self.users = UsersRepository(self)
+        self.vouches = VouchRepository(self)
+        self.complaints = ComplaintsRepository(self)
+        self.buys = BuyRepository(self)
+        self.settings = SettingsRepository(self)
+        self.stats = StatsRepository(self)
+        self.reputation = ReputationRepository(self)
+        self.amounts = AmountsRepository(self)
+
+    async def connect(self) -> None:
+        if self._conn is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        await self._submit(self._open)
+
+    def _open(self) -> None:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        # Новая база сразу получает auto_vacuum=INCREMENTAL: потом, в том числе после
+        # перехода в WAL, режим меняется только полным VACUUM (см. migrations.py)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        from migrations import migrate
+        migrate(conn)
+        self._conn = conn
+
+    async def close(self) -> None:
+        if self._conn is None:
+            return
+        await self._submit(self._conn.close)
+        self._executor.shutdown(wait=True)
+        self._conn = None
+        self._executor = None
+
+    async def _submit(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Выполняет fn(conn, *args) в потоке БД одной транзакцией."""
+        if self._conn is None:
+            raise RuntimeError("База данных не подключена")
+        if self.observer is None:
+            return await self._submit(self._transaction, fn, args)
+        started = time.perf_counter()
+        try:
+            return await self._submit(self._transaction, fn, args)
+        finally:
+            self.observer(fn, time.perf_counter() - started)
+
+    def _transaction(self, fn: Callable[..., T], args: tuple) -> T:
+        conn = self._conn
+        started = time.perf_counter()
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self.busy_time += time.perf_counter() - started
+            self.transactions += 1
+
+
+# ============ РЕПОЗИТОРИИ ============
+def _columns(model) -> str:
+    return ", ".join(f.name for f in fields(model))
+
+
+class _Repository:
+    table = ""
+    model: Any = None
+
+    def __init__(self, db: Database):
+        self._db = db
+
+    def _row(self, row: Optional[sqlite3.Row]):
+        return self.model(**dict(row)) if row is not None else None
+
+    async def get(self, item_id: int):
+        def query(conn):
+            return conn.execute(
+                f"SELECT {_columns(self.model)} FROM {self.table} WHERE id=?", (item_id,)
+            ).fetchone()
+        return self._row(await self._db.run(query))
+
+    async def page_pending(self, after_id: Optional[int] = None, before_id: Optional[int] = None,
+                           limit: int = 10) -> tuple:
+        """Одна страница ожидающих заявок по ключу (status, id).
+
+        Возвращает (заявки, есть_предыдущая, есть_следующая). Читается не больше
+        limit + 1 строк, сколько бы заявок ни накопилось.
+        """
+        columns = _columns(self.model)
+
+        def query(conn):
+            if before_id is not None:
+                rows = conn.execute(
+                    f"SELECT {columns} FROM {self.table} WHERE status='pending' AND id < ? "
+                    f"ORDER BY id DESC LIMIT ?", (before_id, limit + 1)
+                ).fetchall()
+                has_prev = len(rows) > limit
+                rows = rows[:limit][::-1]
+                has_next = True
+            else:
+                rows = conn.execute(
+                    f"SELECT {columns} FROM {self.table} WHERE status='pending' AND id > ? "
+                    f"ORDER BY id LIMIT ?", (after_id or 0, limit + 1)
+                ).fetchall()
+                has_next = len(rows) > limit
+                rows = rows[:limit]
+                has_prev = after_id is not None and conn.execute(
+                    f"SELECT EXISTS (SELECT 1 FROM {self.table} WHERE status='pending' AND id <= ?)",
+                    (after_id,)
+                ).fetchone()[0] == 1
+            return rows, has_prev, has_next
+
+        rows, has_prev, has_next = await self._db.run(query)
+        return [self._row(row) for row in rows], has_prev, has_next
+
+    async def is_pending(self, item_id: int) -> bool:
+        def query(conn):
+            return conn.execute(
+                f"SELECT 1 FROM {self.table} WHERE id=? AND status='pending'", (item_id,)
+            ).fetchone() is not None
+        return await self._db.run(query)
+
+    async def count_pending(self) -> int:
+        return await self._db.stats.get(f"pending_{self.table}")
+
+    async def answer(self, item_id: int, text: str):
+        """Помечает заявку отвеченной. Возвращает её или None, если она уже обработана."""
+        answered = await self.answer_many([(item_id, text)])
+        return answered[0] if answered else None
+
+    async def answer_many(self, answers: List[Tuple[int, str]]) -> list:
+        """Отвечает на несколько заявок одной транзакцией.
+
+        Возвращает заявки, которые действительно были ожидающими, в порядке answers;
+        уже обработанные и несуществующие номера пропускаются.
+        """
+        def query(conn):
+            rows = []
+            for item_id, text in answers:
+                row = conn.execute(
+                    f"SELECT {_columns(self.model)} FROM {self.table} "
+                    f"WHERE id=? AND status='pending'", (item_id,)
+                ).fetchone()
+                if row is None:
+                    continue
+                conn.execute(
+                    f"UPDATE {self.table} SET {self._answer_assignments()} WHERE id=?",
+                    (*self._answer_values(text), item_id),
+                )
+                self._after_answer(conn, row, text)
+                rows.append(row)
+            return rows
+        return [self._row(row) for row in await self._db.run(query)]
+
+    def _answer_assignments(self) -> str:
+        return "status='answered', admin_response_text=?"
+
+    def _answer_values(self, text: str) -> tuple:
+        return (text,)
+
+    def _after_answer(self, conn, row: sqlite3.Row, text: str) -> None:
+        """Вызывается в транзакции ответа для каждой отвеченной заявки."""
+
+
+class UsersRepository(_Repository):
+    table = "users"
+    model = User
+
+    async def add(self, user_id: int, username: str, first_name: str) -> None:
+        await self.add_many([(user_id, username, first_name, *stamp())])
+
+    async def add_many(self, users: List[Tuple[int, str, str, str, int]]) -> None:
+        """Регистрирует пачку пользователей одной транзакцией: (user_id, username, first_name, reg_date, reg_ts)."""
+        def query(conn):
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (user_id, username, first_name, reg_date, reg_ts) "
+                "VALUES (?, ?, ?, ?, ?)",
+                users,
+            )
+        await self._db.run(query)
+
+    async def unblock(self, user_id: int) -> None:
+        """Пользователь снова написал боту — он опять получает рассылки."""
+        def query(conn):
+            conn.execute("UPDATE users SET status='user' WHERE user_id=? AND status='blocked'", (user_id,))
+        await self._db.run(query)
+
+    async def blocked_ids(self) -> List[int]:
+        def query(conn):
+            return [row[0] for row in conn.execute("SELECT user_id FROM users WHERE status='blocked'")]
+        return await self._db.run(query)
+
+    async def all_ids(self) -> List[int]:
+        """Все user_id по возрастанию — ключ таблицы, читается без сортировки."""
+        def query(conn):
+            return [row[0] for row in conn.execute("SELECT user_id FROM users ORDER BY user_id")]
+        return await self._db.run(query)
+
+    async def count(self) -> int:
+        return await self._db.stats.get("users")
+
+
+class VouchRepository(_Repository):
+    table = "vouch_requests"
+    model = VouchRequest
+
+    async def create(self, user_id: int, target_username: str, amount: float, currency: str,
+                     fingerprint: Optional[Fingerprint] = None) -> int:
+        """Создаёт заявку. С fingerprint повтор в пределах окна бросает DuplicateRequest."""
+        request_date, request_ts = stamp()
+        target_norm = normalize_username(target_username)
+        code = currency_code(currency)
+        amount_minor = to_minor(amount, code)
+
+        def query(conn):
+            claim_fingerprint(conn, fingerprint, self.table)
+            cursor = conn.execute(
+                "INSERT INTO vouch_requests "
+                "(user_id, target_username, amount, currency, request_date, request_ts, target_norm, "
+                "currency_code, amount_minor) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, target_username, amount, currency, request_date, request_ts, target_norm,
+                 code, amount_minor),
+            )
+            bump_reputation(conn, target_norm, request_ts, checks=1, amount=to_rub(amount, currency))
+            bump_amount_daily(conn, self.table, code, request_ts, amount_minor)
+            bind_fingerprint(conn, fingerprint, cursor.lastrowid)
+            return cursor.lastrowid
+        return await self._db.run(query)
+
+    async def latest_verdict(self, target_norm: str) -> Optional[VouchRequest]:
+        """Последняя отвеченная проверка этого человека (по индексу target_norm).
+
+        Архив читается, только если в горячей таблице ответов нет: туда уходят
+        заявки старше порога, так что свежий ответ лежит в горячей таблице.
+        """
+        def query(conn):
+            for table in ("vouch_requests", "vouch_requests_archive"):
+                row = conn.execute(
+                    f"SELECT {_columns(self.model)} FROM {table} "
+                    f"WHERE target_norm=? AND status='answered' ORDER BY id DESC LIMIT 1",
+                    (target_norm,),
+                ).fetchone()
+                if row is not None:
+                    return row
+            return None
+        return self._row(await self._db.run(query))
+
+    def _answer_assignments(self) -> str:
+        return "status='answered', admin_response_text=?, admin_answer=?, answer_date=?, answer_ts=?"
+
+    def _answer_values(self, text: str) -> tuple:
+        return (text, text, *stamp())
+
+    def _after_answer(self, conn, row: sqlite3.Row, text: str) -> None:
+        if row["target_norm"]:
+            bump_reputation(conn, row["target_norm"], int(time.time()), verdict=classify_verdict(text))
+
+
+class ComplaintsRepository(_Repository):
+    table = "complaints"
+    model = Complaint
+
+    async def create(self, user_id: int, complaint_text: str, fingerprint: Optional[Fingerprint] = None) -> int:
+        complaint_date, complaint_ts = stamp()
+
+        def query(conn):
+            claim_fingerprint(conn, fingerprint, self.table)
+            cursor = conn.execute(
+                "INSERT INTO complaints (user_id, complaint_text, complaint_date, complaint_ts) "
+                "VALUES (?, ?, ?, ?)",
+                (user_id, complaint_text, complaint_date, complaint_ts),
+            )
+            mentions = extract_mentions(complaint_text)
+            conn.executemany(
+                "INSERT OR IGNORE INTO complaint_mentions (username_norm, complaint_id) VALUES (?, ?)",
+                [(name, cursor.lastrowid) for name in mentions],
+            )
+            for name in mentions:
+                bump_reputation(conn, name, complaint_ts, complaints=1)
+            bind_fingerprint(conn, fingerprint, cursor.lastrowid)
+            return cursor.lastrowid
+        return await self._db.run(query)
+
+    async def search(self, text: str, offset: int = 0, limit: int = 10) -> Tuple[List[Tuple[Complaint, str]], int]:
+        """Полнотекстовый поиск по жалобам, лучшие совпадения первыми (bm25).
+
+        Возвращает ([(жалоба, фрагмент)], всего_найдено). Во фрагменте совпавшие
+        слова обрамлены символами \\x02 и \\x03 — их заменяют на разметку
+        уже после экранирования текста.
+        """
+        match = fts_query(text)
+        if match is None:
+            return [], 0
+
+        columns = _columns(self.model)
+
+        def query(conn):
+            total = conn.execute(
+                "SELECT COUNT(*) FROM complaints_fts WHERE complaints_fts MATCH ?", (match,)
+            ).fetchone()[0]
+            hits = conn.execute(
+                "SELECT rowid, snippet(complaints_fts, 0, char(2), char(3), '…', 16) "
+                "FROM complaints_fts WHERE complaints_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                (match, limit, offset),
+            ).fetchall()
+            # Жалоба может лежать как в горячей таблице, так и в архиве — ищем по первичному ключу в обеих
+            placeholders = ", ".join("?" * len(hits))
+            ids = [hit[0] for hit in hits]
+            rows = conn.execute(
+                f"SELECT {columns} FROM complaints WHERE id IN ({placeholders}) "
+                f"UNION ALL SELECT {columns} FROM complaints_archive WHERE id IN ({placeholders})",
+                ids + ids,
+            ).fetchall() if hits else []
+            by_id = {row["id"]: row for row in rows}
+            return [(by_id[rowid], fragment) for rowid, fragment in hits if rowid in by_id], total
+
+        rows, total = await self._db.run(query)
+        return [(self._row(row), fragment) for row, fragment in rows], total
+
+    async def mentioning(self, username_norm: str, limit: int = 10) -> Tuple[int, List[int]]:
+        """Жалобы, где упомянут этот человек: (сколько всего, номера последних)."""
+        def query(conn):
+            total = conn.execute(
+                "SELECT COUNT(*) FROM complaint_mentions WHERE username_norm=?", (username_norm,)
+            ).fetchone()[0]
+            ids = [row[0] for row in conn.execute(
+                "SELECT complaint_id FROM complaint_mentions WHERE username_norm=? "
+                "ORDER BY complaint_id DESC LIMIT ?", (username_norm, limit)
+            )]
+            return total, ids
+        return await self._db.run(query)
+
+
+class BuyRepository(_Repository):
+    table = "buy_requests"
+    model = BuyRequest
+
+    async def create(self, user_id: int, amount: float, currency: str,
+                     fingerprint: Optional[Fingerprint] = None) -> int:
+        request_date, request_ts = stamp()
+        code = currency_code(currency)
+        amount_minor = to_minor(amount, code)
+
+        def query(conn):
+            claim_fingerprint(conn, fingerprint, self.table)
+            cursor = conn.execute(
+                "INSERT INTO buy_requests "
+                "(user_id, amount, currency, request_date, request_ts, currency_code, amount_minor) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, amount, currency, request_date, request_ts, code, amount_minor),
+            )
+            bump_amount_daily(conn, self.table, code, request_ts, amount_minor)
+            bind_fingerprint(conn, fingerprint, cursor.lastrowid)
+            return cursor.lastrowid
+        return await self._db.run(query)
+
+
+class SettingsRepository:
+    """Простое хранилище ключ-значение для служебных данных бота."""
+
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def get(self, key: str) -> Optional[str]:
+        def query(conn):
+            row = conn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
+            return row[0] if row else None
+        return await self._db.run(query)
+
+    async def set(self, key: str, value: str) -> None:
+        def query(conn):
+            conn.execute(
+                "INSERT INTO settings (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (key, value),
+            )
+        await self._db.run(query)
+
+    async def delete(self, key: str) -> None:
+        def query(conn):
+            conn.execute("DELETE FROM settings WHERE key=?", (key,))
+        await self._db.run(query)
+
+
+class StatsRepository:
+    """Счётчики для админки, которые поддерживают триггеры."""
+
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def get(self, name: str) -> int:
+        def query(conn):
+            row = conn.execute("SELECT value FROM stats_counters WHERE name=?", (name,)).fetchone()
+            return row[0] if row else 0
+        return await self._db.run(query)
+
+    async def get_all(self) -> dict:
+        def query(conn):
+            return dict(conn.execute("SELECT name, value FROM stats_counters").fetchall())
+        return await self._db.run(query)
+
+    async def rebuild(self) -> tuple:
+        """Пересчитывает счётчики с нуля. Возвращает значения до и после."""
+        def query(conn):
+            before = dict(conn.execute("SELECT name, value FROM stats_counters").fetchall())
+            return before, rebuild_counters(conn)
+        return await self._db.run(query)
+
+
+class ReputationRepository:
+    """Готовые сводки по проверяемым людям (см. bump_reputation)."""
+
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def get(self, username_norm: str) -> Optional[Reputation]:
+        def query(conn):
+            return conn.execute(
+                f"SELECT {_columns(Reputation)} FROM reputation WHERE username_norm=?", (username_norm,)
+            ).fetchone()
+        row = await self._db.run(query)
+        return Reputation(**dict(row)) if row is not None else None
+
+    async def rebuild(self) -> int:
+        """Пересчитывает все сводки с нуля. Возвращает число людей."""
+        return await self._db.run(rebuild_reputation)
+
+
+class AmountsRepository:
+    """Отчёты по суммам заявок. Читает только суточные агрегаты amount_daily, сами заявки не сканирует."""
+
+    def __init__(self, db: Database):
+        self._db = db
+
+    async def report(self, kind: str, since_day: Optional[str] = None,
+                     until_day: Optional[str] = None) -> List[AmountSummary]:
+        """Итоги по валютам для заявок kind за дни [since_day, until_day] (ГГГГ-ММ-ДД, включительно).
+
+        Валюты идут по убыванию примерной суммы в рублях.
+        """
+        def query(conn):
+            return conn.execute(
+                "SELECT currency_code, bucket, SUM(requests), SUM(total_minor) FROM amount_daily "
+                "WHERE kind = ? AND day BETWEEN ? AND ? "
+                "GROUP BY currency_code, bucket ORDER BY currency_code, bucket",
+                (kind, since_day or "0000-00-00", until_day or "9999-12-31"),
+            ).fetchall()
+
+        histograms: Dict[str, List[Tuple[int, int]]] = {}
+        summaries: Dict[str, AmountSummary] = {}
+        for code, bucket, requests, total_minor in await self._db.run(query):
+            summary = summaries.setdefault(code, AmountSummary(code, 0, 0, 0))
+            summary.requests += requests
+            summary.total_minor += total_minor
+            histograms.setdefault(code, []).append((bucket, requests))
+
+        for code, summary in summaries.items():
+            # Нижняя медиана: корзина, в которой накопленное число заявок доходит до середины
+            middle, seen = (summary.requests + 1) // 2, 0
+            for bucket, requests in histograms[code]:
+                seen += requests
+                if seen >= middle:
+                    summary.median_minor = bucket
+                    break
+        return sorted(
+            summaries.values(),
+            key=lambda summary: summary.total * RUB_RATES.get(summary.currency_code, 0.0),
+            reverse=True,
+        )
+
+    async def rebuild(self) -> int:
+        """Пересчитывает агрегаты с нуля. Возвращает число строк."""
+        return await self._db.run(rebuild_amounts)
@@ -0,0 +1,80 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from currency import resolve_currency
+from db import DuplicateRequest, Fingerprint, normalize_username
+
+
+def _normalize_text(text: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", (text or "").casefold()).strip()
+
+
+class Deduplicator:
+    """Отсекает повторную отправку одной и той же заявки.
+
+    Отпечаток — хэш от пользователя, типа заявки, проверяемого, суммы, валюты
+    и текста, приведённых к одному виду. В пределах window секунд повтор не
+    создаёт новую заявку, а возвращает номер первой — пока та ждёт ответа.
+    Если на первую уже ответили, повтор создаёт новую. Свежие отпечатки лежат
+    в памяти (OrderedDict в порядке истечения, окно у всех одинаковое),
+    источник истины — первичный ключ в submission_fingerprints: он ловит
+    повторы после перезапуска и из других процессов. window=0 отключает проверку.
+    """
+
+    def __init__(self, window: float = 600, max_entries: int = 100_000):
+        self.window = window
+        self.max_entries = max_entries
+        self._recent: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+    def fingerprint(self, kind: str, user_id: int, target: str = "", amount: Optional[float] = None,
+                    currency: str = "", text: str = "") -> Optional[Fingerprint]:
+        if self.window <= 0:
+            return None
+        text_hash = hashlib.sha256(_normalize_text(text).encode()).hexdigest()
+        parts = (
+            kind, str(user_id), normalize_username(target) if target else "",
+            "" if amount is None else repr(float(amount)),
+            resolve_currency(currency) or _normalize_text(currency), text_hash,
+        )
+        key = hashlib.sha256("\x1f".join(parts).encode()).hexdigest()[:32]
+        return Fingerprint(key, int(time.time() + self.window))
+
+    def _evict(self, now: float) -> None:
+        while self._recent:
+            _, expires = next(iter(self._recent.values()))
+            if expires > now and len(self._recent) <= self.max_entries:
+                break
+            self._recent.popitem(last=False)
+
+    def _remember(self, fingerprint: Fingerprint, request_id: int) -> None:
+        self._recent[fingerprint.key] = (request_id, fingerprint.expires_ts)
+        self._recent.move_to_end(fingerprint.key)
+        self._evict(time.time())
+
+    async def submit(self, fingerprint: Optional[Fingerprint],
+                     create: Callable[[Optional[Fingerprint]], Awaitable[int]],
+                     is_pending: Callable[[int], Awaitable[bool]]) -> Tuple[int, bool]:
+        """Создаёт заявку через create(fingerprint). Возвращает (номер, создана_ли_новая).
+
+        is_pending(номер) проверяет, что заявка из памяти ещё ждёт ответа. Для отпечатка
+        из базы это делает claim_fingerprint в той же транзакции.
+        """
+        if fingerprint is None:
+            return await create(None), True
+
+        self._evict(time.time())
+        recent = self._recent.get(fingerprint.key)
+        if recent is not None:
+            if await is_pending(recent[0]):
+                return recent[0], False
+            del self._recent[fingerprint.key]
+        try:
+            request_id = await create(fingerprint)
+        except DuplicateRequest as e:
+            self._remember(fingerprint, e.request_id)
+            return e.request_id, False
+        self._remember(fingerprint, request_id)
+        return request_id, True
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional, Tuple
+
+from currency import to_rub
+from db import Database
+from outbox import Outbox
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины одного сообщения Telegram, с запасом на заголовок
+MESSAGE_LIMIT = 4000
+
+DIGEST_GROUPS = {
+    "vouch": "🔔 <b>Ручения:</b>",
+    "complaint": "⚠️ <b>Жалобы:</b>",
+    "buy": "💰 <b>Покупки ручения:</b>",
+}
+
+
+class AdminDigest:
+    """Собирает уведомления о новых заявках в сводку вместо отдельного сообщения на каждую.
+
+    Сводка уходит через window секунд после первой заявки или сразу, как только
+    накопилось max_items заявок. Заявки на сумму от urgent_amount рублей и выше
+    (по грубому курсу из currency.py) отправляются немедленно. При enabled=False каждая заявка уходит сразу.
+
+    Заявки для сводки копятся в таблице digest_entries: с несколькими воркерами
+    (supervisor.py) уведомления создают все процессы, а сводку по времени
+    отправляет один — тот, где вызван start(). Остальные его видят при опросе
+    раз в poll секунд. Строки забираются и превращаются в сообщения outbox
+    одной транзакцией, поэтому две сводки с одной заявкой не уйдут.
+    """
+
+    def __init__(self, outbox: Outbox, db: Database, chat_id: int, enabled: bool = False, window: float = 60,
+                 max_items: int = 20, urgent_amount: Optional[float] = None, poll: float = 60.0):
+        self.outbox = outbox
+        self.db = db
+        self.chat_id = chat_id
+        self.enabled = enabled
+        self.window = window
+        self.max_items = max_items
+        self.urgent_amount = urgent_amount
+        self.poll = poll
+
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    async def notify(self, kind: str, text: str, summary: str, amount: Optional[float] = None,
+                     currency: Optional[str] = None) -> None:
+        """text — полное уведомление, summary — строка для сводки, amount и currency — как ввёл пользователь."""
+        urgent = (self.urgent_amount is not None and amount is not None
+                  and to_rub(amount, currency) >= self.urgent_amount)
+        if not self.enabled or urgent:
+            await self.outbox.enqueue(self.chat_id, text)
+            return
+
+        def query(conn):
+            conn.execute(
+                "INSERT INTO digest_entries (kind, summary, created_ts) VALUES (?, ?, ?)",
+                (kind, summary, time.time()),
+            )
+            return conn.execute("SELECT COUNT(*) FROM digest_entries").fetchone()[0]
+        if await self.db.run(query) >= self.max_items:
+            await self.flush()
+        else:
+            self._wakeup.set()
+
+    # ============ ЖИЗНЕННЫЙ ЦИКЛ ============
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Отправляет накопленное, если сводку ведёт этот процесс."""
+        if self._task is None:
+            return
+        # wait_for до Python 3.12 теряет отмену, если событие пришло одновременно с ней
+        while not self._task.done():
+            self._task.cancel()
+            await asyncio.wait([self._task], timeout=1)
+        self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                oldest = await self.db.run(
+                    lambda conn: conn.execute("SELECT MIN(created_ts) FROM digest_entries").fetchone()[0]
+                )
+                wait = self.poll if oldest is None else oldest + self.window - time.time()
+                if wait <= 0:
+                    await self.flush()
+                    continue
+            except Exception:
+                logger.exception("Не удалось отправить сводку заявок")
+                wait = 5.0
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), min(wait, self.poll))
+            except asyncio.TimeoutError:
+                pass
+
+    async def flush(self) -> None:
+        def query(conn):
+            rows = conn.execute("SELECT id, kind, summary FROM digest_entries ORDER BY id").fetchall()
+            if not rows:
+                return 0
+            conn.execute("DELETE FROM digest_entries WHERE id <= ?", (rows[-1][0],))
+            messages = self._render([(kind, summary) for _, kind, summary in rows])
+            for text in messages:
+                Outbox.insert(conn, self.chat_id, text)
+            return len(messages)
+        if await self.db.run(query):
+            self.outbox.wake()
+
+    @staticmethod
+    def _render(entries: List[Tuple[str, str]]) -> List[str]:
+        header = f"📥 <b>НОВЫЕ ЗАЯВКИ: {len(entries)}</b>\n\n"
+        lines = []
+        for kind, title in DIGEST_GROUPS.items():
+            group = [summary for entry_kind, summary in entries if entry_kind == kind]
+            if group:
+                lines.append(title)
+                lines.extend(group)
+                lines.append("")
+
+        messages, current = [], header
+        for line in lines:
+            if len(current) + len(line) + 1 > MESSAGE_LIMIT:
+                messages.append(current)
+                current = ""
+            current += line + "\n"
+        if current.strip():
+            messages.append(current)
+        return messages
@@ -0,0 +1,153 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# Короткие имена для админа: выгружается вся история, включая архив
+EXPORT_ALIASES = {
+    "users": "users",
+    "vouches": "vouch_requests_all",
+    "complaints": "complaints_all",
+    "buys": "buy_requests_all",
+}
+
+# Колонки с временем создания, по которым фильтруется диапазон дат
+TIME_COLUMNS = ("reg_ts", "request_ts", "complaint_ts", "created_ts", "created_at")
+
+# Служебные таблицы, которые не выгружаются
+HIDDEN_PREFIXES = ("sqlite_", "complaints_fts", "fsm_states")
+
+FORMATS = ("csv", "jsonl")
+
+
+@dataclass
+class ExportResult:
+    files: List[str]
+    rows: int
+    directory: str
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class Exporter:
+    """Потоковая выгрузка таблиц в сжатые CSV/JSONL.
+
+    Работает в отдельном потоке через собственное соединение только на чтение:
+    в режиме WAL оно не мешает основному соединению бота. Строки идут из курсора
+    порциями и сразу пишутся в gzip, весь результат в памяти не держится.
+    Когда сжатый файл дорастает до part_size, начинается следующая часть,
+    чтобы каждая влезла в лимит загрузки Telegram.
+    """
+
+    def __init__(self, db_path: str, part_size: int = 45 * 1024 * 1024, batch_size: int = 1_000):
+        self.db_path = db_path
+        self.part_size = part_size
+        self.batch_size = batch_size
+        self._lock = asyncio.Lock()
+
+    async def export(self, name: str, fmt: str = "csv", since: Optional[int] = None,
+                     until: Optional[int] = None) -> ExportResult:
+        """Выгружает таблицу name за [since, until). Одновременно идёт только одна выгрузка."""
+        if fmt not in FORMATS:
+            raise ValueError(f"неизвестный формат {fmt}, доступны: {', '.join(FORMATS)}")
+        async with self._lock:
+            return await asyncio.to_thread(self._export, name, fmt, since, until)
+
+    def _connect(self) -> sqlite3.Connection:
+        uri = f"file:{os.path.abspath(self.db_path)}?mode=ro"
+        return sqlite3.connect(uri, uri=True, timeout=30)
+
+    @staticmethod
+    def tables(conn: sqlite3.Connection) -> List[str]:
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') ORDER BY name")
+        return [row[0] for row in rows if not row[0].startswith(HIDDEN_PREFIXES)]
+
+    def _resolve(self, conn: sqlite3.Connection, name: str) -> Tuple[str, Optional[str]]:
+        source = EXPORT_ALIASES.get(name, name)
+        if source not in self.tables(conn):
+            raise ValueError(
+                f"таблица {name} не найдена, доступны: {', '.join(EXPORT_ALIASES)} "
+                f"или {', '.join(self.tables(conn))}"
+            )
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{source}")')]
+        time_column = next((column for column in TIME_COLUMNS if column in columns), None)
+        return source, time_column
+
+    def _export(self, name: str, fmt: str, since: Optional[int], until: Optional[int]) -> ExportResult:
+        conn = self._connect()
+        directory = tempfile.mkdtemp(prefix="export-")
+        try:
+            source, time_column = self._resolve(conn, name)
+            sql, params = f'SELECT * FROM "{source}"', []
+            if since is not None or until is not None:
+                if time_column is None:
+                    raise ValueError(f"в таблице {name} нет колонки с датой, диапазон не поддерживается")
+                sql += f" WHERE {time_column} >= ? AND {time_column} < ?"
+                params = [since if since is not None else 0, until if until is not None else 2 ** 62]
+                sql += f" ORDER BY {time_column}"
+
+            cursor = conn.execute(sql, params)
+            cursor.arraysize = self.batch_size
+            columns = [description[0] for description in cursor.description]
+            base = os.path.join(directory, f"{name}_{time.strftime('%Y%m%d-%H%M')}")
+            files, rows = self._write(cursor, columns, fmt, base)
+            return ExportResult(files, rows, directory)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        finally:
+            conn.close()
+
+    def _write(self, cursor: sqlite3.Cursor, columns: List[str], fmt: str, base: str) -> Tuple[List[str], int]:
+        files: List[str] = []
+        rows = 0
+        raw = archive = text = writer = None
+
+        def open_part():
+            nonlocal raw, archive, text, writer
+            path = f"{base}.part{len(files) + 1}.{fmt}.gz"
+            files.append(path)
+            raw = open(path, "wb")
+            archive = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+            text = io.TextIOWrapper(archive, encoding="utf-8", newline="")
+            if fmt == "csv":
+                writer = csv.writer(text)
+                writer.writerow(columns)
+
+        def close_part():
+            text.close()
+            raw.close()
+
+        open_part()
+        try:
+            while True:
+                batch = cursor.fetchmany()
+                if not batch:
+                    break
+                # raw.tell() отстаёт от итогового размера на буфер сжатия, part_size берётся с запасом
+                if raw.tell() >= self.part_size:
+                    close_part()
+                    open_part()
+                for row in batch:
+                    if fmt == "csv":
+                        writer.writerow(row)
+                    else:
+                        text.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+                rows += len(batch)
+        finally:
+            close_part()
+
+        if len(files) == 1:
+            single = f"{base}.{fmt}.gz"
+            os.replace(files[0], single)
+            files = [single]
+        return files, rows
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], updated_at: float):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states с горячим кэшем в памяти.
+
+    Чтения обслуживаются из LRU-кэша и идут в базу только при промахе.
+    Записи копятся в памяти и сбрасываются одной транзакцией раз в flush_interval
+    секунд, поэтому серия set_state/update_data внутри одного шага диалога
+    превращается в одну запись. Состояния, которые не менялись дольше state_ttl,
+    считаются брошенными и удаляются.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        cache_size: int = 10_000,
+        cache_ttl: float = 600,
+        state_ttl: float = 24 * 3600,
+        flush_interval: float = 1.0,
+    ):
+        self.db = db
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.state_ttl = state_ttl
+        self.flush_interval = flush_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._dirty: Dict[str, _Record] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_cleanup = 0.0
+
+    # ============ ЖИЗНЕННЫЙ ЦИКЛ ============
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.time() - self._last_cleanup > self.state_ttl / 24:
+                    await self.cleanup()
+            except Exception:
+                logger.exception("Не удалось сохранить FSM-состояния")
+
+    # ============ КЭШ ============
+    def _remember(self, key: str, record: _Record) -> None:
+        self._cache[key] = (record, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, storage_key: StorageKey) -> _Record:
+        key = self.key_builder.build(storage_key)
+        record = self._dirty.get(key)
+        if record is None:
+            cached = self._cache.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.cache_ttl:
+                record = cached[0]
+                self._cache.move_to_end(key)
+            else:
+                record = await self.db.run(self._select, key)
+                self._remember(key, record)
+        if not record.is_empty() and time.time() - record.updated_at > self.state_ttl:
+            record = _Record(None, {}, time.time())
+            self._write(key, record)
+        return record
+
+    def _write(self, key: str, record: _Record) -> None:
+        record.updated_at = time.time()
+        self._dirty[key] = record
+        self._remember(key, record)
+
+    # ============ BaseStorage ============
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._load(key)
+        value = state.state if isinstance(state, State) else state
+        self._write(self.key_builder.build(key), _Record(value, record.data, record.updated_at))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise ValueError(f"Data must be a dict, got {type(data).__name__}")
+        record = await self._load(key)
+        self._write(self.key_builder.build(key), _Record(record.state, data.copy(), record.updated_at))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._load(key)).data.copy()
+
+    # ============ БАЗА ============
+    @staticmethod
+    def _select(conn, key: str) -> _Record:
+        row = conn.execute(
+            "SELECT state, data, updated_at FROM fsm_states WHERE key=?", (key,)
+        ).fetchone()
+        if row is None:
+            return _Record(None, {}, time.time())
+        return _Record(row[0], json.loads(row[1]) if row[1] else {}, row[2])
+
+    async def flush(self) -> None:
+        """Сбрасывает накопленные изменения в базу одной транзакцией."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            try:
+                await self.db.run(self._save, dirty)
+            except BaseException:
+                for key, record in dirty.items():
+                    self._dirty.setdefault(key, record)
+                raise
+
+    @staticmethod
+    def _save(conn, dirty: Dict[str, _Record]) -> None:
+        conn.executemany(
+            "DELETE FROM fsm_states WHERE key=?",
+            [(key,) for key, record in dirty.items() if record.is_empty()],
+        )
+        conn.executemany(
+            "INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state=excluded.state, data=excluded.data, "
+            "updated_at=excluded.updated_at",
+            [
+                (key, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at)
+                for key, record in dirty.items()
+                if not record.is_empty()
+            ],
+        )
+
+    async def cleanup(self) -> int:
+        """Удаляет брошенные состояния, которые не менялись дольше state_ttl."""
+        self._last_cleanup = time.time()
+        deadline = self._last_cleanup - self.state_ttl
+
+        def query(conn):
+            return conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (deadline,)).rowcount
+        removed = await self.db.run(query)
+        if removed:
+            logger.info("Удалено брошенных FSM-состояний: %s", removed)
+        return removed
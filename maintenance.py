@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from db import CREATED_COLUMNS, REQUEST_TABLES, Database
+from migrations import ensure_incremental_vacuum
+
+logger = logging.getLogger(__name__)
+
+
+class Maintenance:
+    """Фоновое обслуживание базы: архив решённых заявок и возврат места.
+
+    Раз в interval секунд отвеченные заявки старше archive_after_days дней
+    переносятся в {table}_archive порциями по batch_size строк. Каждая порция —
+    отдельная короткая транзакция, между порциями делается пауза, так что
+    запросы обработчиков успевают пройти через поток БД. Потом освобождённые
+    страницы возвращаются через PRAGMA incremental_vacuum (тоже порциями)
+    и выполняется PRAGMA optimize. Заодно удаляются просроченные отпечатки заявок
+    и недоставленные сообщения outbox (status='failed') старше того же срока.
+    """
+
+    def __init__(self, db: Database, archive_after_days: float = 30, interval: float = 6 * 3600,
+                 batch_size: int = 500, vacuum_pages: int = 2_000, pause: float = 0.05):
+        self.db = db
+        self.archive_after_days = archive_after_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Обслуживание базы завершилось ошибкой")
+
+    async def run_once(self) -> Dict[str, int]:
+        """Один проход обслуживания. Возвращает перенесённые строки по таблицам, fingerprints,
+        outbox_failed и freed_pages."""
+        async with self._lock:
+            started = time.monotonic()
+            cutoff = int(time.time() - self.archive_after_days * 86400)
+            report = {table: await self._archive(table, cutoff) for table in REQUEST_TABLES}
+            report["fingerprints"] = await self.db.run(self._purge_fingerprints)
+            report["outbox_failed"] = await self.db.run(self._purge_failed_outbox, cutoff)
+            report["freed_pages"] = await self._vacuum()
+            await self.db.run(lambda conn: conn.execute("PRAGMA optimize"))
+            logger.info("Обслуживание базы за %.1f с: %s", time.monotonic() - started, report)
+            return report
+
+    async def _archive(self, table: str, cutoff: int) -> int:
+        moved = 0
+        while True:
+            count = await self.db.run(self._archive_batch, table, cutoff)
+            moved += count
+            if count < self.batch_size:
+                return moved
+            await asyncio.sleep(self.pause)
+
+    def _archive_batch(self, conn, table: str, cutoff: int) -> int:
+        columns = ", ".join(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+        ids = [row[0] for row in conn.execute(
+            f"SELECT id FROM {table} WHERE {CREATED_COLUMNS[table]} < ? AND status != 'pending' "
+            f"ORDER BY {CREATED_COLUMNS[table]} LIMIT ?", (cutoff, self.batch_size)
+        )]
+        if not ids:
+            return 0
+        placeholders = ", ".join("?" * len(ids))
+        conn.execute(
+            f"INSERT OR REPLACE INTO {table}_archive ({columns}, archived_ts) "
+            f"SELECT {columns}, ? FROM {table} WHERE id IN ({placeholders})",
+            (int(time.time()), *ids),
+        )
+        conn.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+        return len(ids)
+
+    @staticmethod
+    def _purge_fingerprints(conn) -> int:
+        return conn.execute(
+            "DELETE FROM submission_fingerprints WHERE expires_ts < ?", (int(time.time()),)
+        ).rowcount
+
+    @staticmethod
+    def _purge_failed_outbox(conn, cutoff: int) -> int:
+        return conn.execute(
+            "DELETE FROM outbox WHERE status='failed' AND created_at < ?", (cutoff,)
+        ).rowcount
+
+    async def enable_incremental_vacuum(self) -> bool:
+        """Однократный перевод старой базы в auto_vacuum=INCREMENTAL (полный VACUUM).
+        Пока он идёт, остальные запросы к базе ждут. False — база уже в этом режиме."""
+        async with self._lock:
+            return await self.db.run(ensure_incremental_vacuum)
+
+    async def _vacuum(self) -> int:
+        def step(conn) -> int:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                logger.warning("База не в режиме auto_vacuum=INCREMENTAL, место не возвращается — выполни /vacuum")
+                return 0
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # Без fetchall() incremental_vacuum выполнит только первый шаг
+            conn.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages})").fetchall()
+            return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        freed = 0
+        while True:
+            pages = await self.db.run(step)
+            freed += pages
+            if pages < self.vacuum_pages:
+                return freed
+            await asyncio.sleep(self.pause)
@@ -0,0 +1,417 @@
+"""Версионные миграции схемы базы.
+
+Номер версии хранится в PRAGMA user_version. При запуске migrate() применяет
+по порядку только те миграции, которых в базе ещё нет, каждую в своей
+транзакции вместе с новым номером версии. Если схема актуальна, запуск
+ограничивается чтением одного PRAGMA.
+
+Новая миграция добавляется в конец MIGRATIONS; уже выпущенные не меняются.
+"""
+import logging
+import time
+from typing import Callable, List, Tuple
+
+from db import (AMOUNT_TABLES, REQUEST_TABLES, STATS_QUERIES, extract_mentions, normalize_username, parse_date,
+                rebuild_amounts, rebuild_counters, rebuild_reputation)
+
+logger = logging.getLogger(__name__)
+
+
+# ============ 1. ИСХОДНАЯ СХЕМА ============
+# Базы, созданные до появления миграций, имеют user_version = 0 и могут быть
+# любой из ранних версий, поэтому первая миграция целиком идемпотентна.
+BASELINE_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS users
+       (user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        reg_date TEXT,
+        status TEXT DEFAULT 'user')''',
+    '''CREATE TABLE IF NOT EXISTS vouch_requests
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        target_username TEXT,
+        amount REAL,
+        currency TEXT,
+        status TEXT DEFAULT 'pending',
+        request_date TEXT,
+        admin_answer TEXT,
+        admin_response_text TEXT,
+        target_norm TEXT,
+        answer_date TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS complaints
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        complaint_text TEXT,
+        status TEXT DEFAULT 'pending',
+        complaint_date TEXT,
+        admin_response_text TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS buy_requests
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        amount REAL,
+        currency TEXT,
+        status TEXT DEFAULT 'pending',
+        request_date TEXT,
+        admin_response_text TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS settings
+       (key TEXT PRIMARY KEY,
+        value TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS fsm_states
+       (key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT,
+        updated_at REAL)''',
+    "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)",
+    '''CREATE TABLE IF NOT EXISTS stats_counters
+       (name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0)''',
+    '''CREATE TABLE IF NOT EXISTS outbox
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        parse_mode TEXT,
+        reply_markup TEXT,
+        status TEXT DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at REAL DEFAULT 0,
+        created_at REAL,
+        last_error TEXT)''',
+    "CREATE INDEX IF NOT EXISTS idx_outbox_status_chat ON outbox (status, chat_id, id)",
+]
+
+# Колонки, которые ранние версии досоздавали в уже существующих таблицах
+BASELINE_ADDED_COLUMNS = [
+    ("vouch_requests", "target_norm", "TEXT"),
+    ("vouch_requests", "answer_date", "TEXT"),
+]
+
+
+def _columns(conn, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _counter_triggers() -> List[str]:
+    bump = "UPDATE stats_counters SET value = value {sign} 1 WHERE name = '{name}';"
+    triggers = [
+        f'''CREATE TRIGGER IF NOT EXISTS trg_users_count_insert AFTER INSERT ON users
+            BEGIN {bump.format(sign="+", name="users")} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_users_count_delete AFTER DELETE ON users
+            BEGIN {bump.format(sign="-", name="users")} END''',
+    ]
+    for table in REQUEST_TABLES:
+        name = f"pending_{table}"
+        triggers += [
+            f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_pending_insert AFTER INSERT ON {table}
+                WHEN NEW.status = 'pending'
+                BEGIN {bump.format(sign="+", name=name)} END''',
+            f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_pending_leave AFTER UPDATE OF status ON {table}
+                WHEN OLD.status = 'pending' AND NEW.status IS NOT 'pending'
+                BEGIN {bump.format(sign="-", name=name)} END''',
+            f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_pending_enter AFTER UPDATE OF status ON {table}
+                WHEN OLD.status IS NOT 'pending' AND NEW.status = 'pending'
+                BEGIN {bump.format(sign="+", name=name)} END''',
+            f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_pending_delete AFTER DELETE ON {table}
+                WHEN OLD.status = 'pending'
+                BEGIN {bump.format(sign="-", name=name)} END''',
+        ]
+    return triggers
+
+
+def migration_baseline(conn) -> None:
+    for table, column, column_type in BASELINE_ADDED_COLUMNS:
+        existing = _columns(conn, table)
+        if existing and column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            if column == "target_norm":
+                rows = conn.execute("SELECT id, target_username FROM vouch_requests").fetchall()
+                conn.executemany(
+                    "UPDATE vouch_requests SET target_norm=? WHERE id=?",
+                    [(normalize_username(row[1] or ""), row[0]) for row in rows],
+                )
+
+    for statement in BASELINE_SCHEMA + _counter_triggers():
+        conn.execute(statement)
+    for table in REQUEST_TABLES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_status_id ON {table} (status, id)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_vouch_requests_target_answered "
+        "ON vouch_requests (target_norm, id) WHERE status = 'answered'"
+    )
+
+    if conn.execute("SELECT COUNT(*) FROM stats_counters").fetchone()[0] < len(STATS_QUERIES):
+        rebuild_counters(conn)
+
+
+# ============ 2. ДАТЫ В EPOCH ============
+# Строки "%d.%m.%Y %H:%M" нельзя ни сортировать, ни сканировать по диапазону.
+# Рядом с каждой такой колонкой появляется INTEGER-колонка с epoch-секундами.
+EPOCH_COLUMNS = [
+    ("users", "reg_date", "reg_ts"),
+    ("vouch_requests", "request_date", "request_ts"),
+    ("vouch_requests", "answer_date", "answer_ts"),
+    ("complaints", "complaint_date", "complaint_ts"),
+    ("buy_requests", "request_date", "request_ts"),
+]
+
+
+def migration_epoch_timestamps(conn) -> None:
+    conn.create_function("parse_date", 1, parse_date, deterministic=True)
+    for table, text_column, ts_column in EPOCH_COLUMNS:
+        if ts_column not in _columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {ts_column} INTEGER")
+        conn.execute(
+            f"UPDATE {table} SET {ts_column} = parse_date({text_column}) "
+            f"WHERE {ts_column} IS NULL AND {text_column} IS NOT NULL"
+        )
+
+
+# ============ 3. ИНДЕКСЫ ============
+def migration_indexes(conn) -> None:
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_reg_ts ON users (reg_ts)")
+    for table, _, ts_column in EPOCH_COLUMNS:
+        if table in REQUEST_TABLES and ts_column != "answer_ts":
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table} (user_id, id)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{ts_column} ON {table} ({ts_column})")
+
+
+# ============ 4. РАССЫЛКИ ============
+def migration_broadcasts(conn) -> None:
+    conn.execute('''CREATE TABLE IF NOT EXISTS broadcast_jobs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     text TEXT NOT NULL,
+                     status TEXT DEFAULT 'running',
+                     last_user_id INTEGER DEFAULT 0,
+                     total INTEGER,
+                     sent INTEGER DEFAULT 0,
+                     failed INTEGER DEFAULT 0,
+                     blocked INTEGER DEFAULT 0,
+                     status_chat_id INTEGER,
+                     status_message_id INTEGER,
+                     created_ts INTEGER,
+                     finished_ts INTEGER)''')
+
+
+# ============ 5. ПОИСК ПО ЖАЛОБАМ ============
+# Отдельная FTS5-таблица с rowid = id жалобы, синхронизируется триггерами.
+# Упоминания (@юзернеймы и ссылки t.me) извлекаются в Python при создании
+# жалобы, в SQL регулярных выражений нет.
+COMPLAINTS_SEARCH_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS complaints_fts
+       USING fts5(complaint_text, tokenize = 'unicode61 remove_diacritics 2')''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_complaints_fts_insert AFTER INSERT ON complaints
+       BEGIN INSERT INTO complaints_fts (rowid, complaint_text) VALUES (NEW.id, NEW.complaint_text); END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_complaints_fts_update AFTER UPDATE OF complaint_text ON complaints
+       BEGIN
+           DELETE FROM complaints_fts WHERE rowid = OLD.id;
+           INSERT INTO complaints_fts (rowid, complaint_text) VALUES (NEW.id, NEW.complaint_text);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_complaints_fts_delete AFTER DELETE ON complaints
+       BEGIN DELETE FROM complaints_fts WHERE rowid = OLD.id; END''',
+    '''CREATE TABLE IF NOT EXISTS complaint_mentions
+       (username_norm TEXT NOT NULL,
+        complaint_id INTEGER NOT NULL,
+        PRIMARY KEY (username_norm, complaint_id)) WITHOUT ROWID''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_complaint_mentions_delete AFTER DELETE ON complaints
+       BEGIN DELETE FROM complaint_mentions WHERE complaint_id = OLD.id; END''',
+    "CREATE INDEX IF NOT EXISTS idx_complaint_mentions_complaint ON complaint_mentions (complaint_id)",
+    "CREATE INDEX IF NOT EXISTS idx_vouch_requests_target ON vouch_requests (target_norm, id)",
+]
+
+
+def migration_complaints_search(conn) -> None:
+    for statement in COMPLAINTS_SEARCH_SCHEMA:
+        conn.execute(statement)
+    conn.execute("DELETE FROM complaints_fts")
+    conn.execute("INSERT INTO complaints_fts (rowid, complaint_text) SELECT id, complaint_text FROM complaints")
+    rows = conn.execute("SELECT id, complaint_text FROM complaints").fetchall()
+    conn.executemany(
+        "INSERT OR IGNORE INTO complaint_mentions (username_norm, complaint_id) VALUES (?, ?)",
+        [(name, row[0]) for row in rows for name in extract_mentions(row[1])],
+    )
+
+
+# ============ 6. АРХИВ ============
+# Решённые заявки переносятся из горячих таблиц в {table}_archive с теми же
+# колонками (см. maintenance.py). Представления {table}_all объединяют обе
+# части для поиска по истории. Новые колонки горячих таблиц нужно
+# добавлять и в архив.
+ARCHIVE_INDEXES = {
+    "vouch_requests": [
+        "CREATE INDEX IF NOT EXISTS idx_vouch_requests_archive_target ON vouch_requests_archive (target_norm, id)",
+    ],
+}
+
+
+def migration_archive(conn) -> None:
+    for table in REQUEST_TABLES:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        definitions = ", ".join(
+            "id INTEGER PRIMARY KEY" if row[1] == "id" else f"{row[1]} {row[2]}"
+            for row in conn.execute(f"PRAGMA table_info({table})")
+        )
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table}_archive ({definitions}, archived_ts INTEGER)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_archive_user ON {table}_archive (user_id, id)")
+        for statement in ARCHIVE_INDEXES.get(table, []):
+            conn.execute(statement)
+        column_list = ", ".join(columns)
+        conn.execute(
+            f"CREATE VIEW IF NOT EXISTS {table}_all AS "
+            f"SELECT {column_list} FROM {table} UNION ALL SELECT {column_list} FROM {table}_archive"
+        )
+
+    # Перенос в архив — это DELETE из complaints: поисковый индекс и упоминания
+    # при этом должны остаться, поэтому триггеры пропускают уже заархивированные строки
+    conn.execute("DROP TRIGGER IF EXISTS trg_complaints_fts_delete")
+    conn.execute("DROP TRIGGER IF EXISTS trg_complaint_mentions_delete")
+    conn.execute('''CREATE TRIGGER trg_complaints_fts_delete AFTER DELETE ON complaints
+                    WHEN NOT EXISTS (SELECT 1 FROM complaints_archive WHERE id = OLD.id)
+                    BEGIN DELETE FROM complaints_fts WHERE rowid = OLD.id; END''')
+    conn.execute('''CREATE TRIGGER trg_complaint_mentions_delete AFTER DELETE ON complaints
+                    WHEN NOT EXISTS (SELECT 1 FROM complaints_archive WHERE id = OLD.id)
+                    BEGIN DELETE FROM complaint_mentions WHERE complaint_id = OLD.id; END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_complaints_archive_delete AFTER DELETE ON complaints_archive
+                    BEGIN
+                        DELETE FROM complaints_fts WHERE rowid = OLD.id;
+                        DELETE FROM complaint_mentions WHERE complaint_id = OLD.id;
+                    END''')
+
+
+# ============ 7. РЕПУТАЦИЯ ============
+# Сводка по проверяемому человеку. Обновляется в коде репозиториев, а не
+# триггерами: вердикт определяется по тексту ответа в Python (см. classify_verdict).
+def migration_reputation(conn) -> None:
+    conn.execute('''CREATE TABLE IF NOT EXISTS reputation
+                    (username_norm TEXT PRIMARY KEY,
+                     checks INTEGER NOT NULL DEFAULT 0,
+                     positive INTEGER NOT NULL DEFAULT 0,
+                     negative INTEGER NOT NULL DEFAULT 0,
+                     complaints INTEGER NOT NULL DEFAULT 0,
+                     total_amount REAL NOT NULL DEFAULT 0,
+                     last_activity_ts INTEGER) WITHOUT ROWID''')
+    rebuild_reputation(conn)
+
+
+# ============ 8. ОТПЕЧАТКИ ЗАЯВОК ============
+# Защита от повторной отправки: первичный ключ по отпечатку (см. dedup.py),
+# просроченные строки удаляет maintenance.py по индексу expires_ts
+def migration_submission_fingerprints(conn) -> None:
+    conn.execute('''CREATE TABLE IF NOT EXISTS submission_fingerprints
+                    (fingerprint TEXT PRIMARY KEY,
+                     kind TEXT NOT NULL,
+                     request_id INTEGER,
+                     expires_ts INTEGER NOT NULL) WITHOUT ROWID''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_submission_fingerprints_expires "
+                 "ON submission_fingerprints (expires_ts)")
+
+
+# ============ 9. СУММЫ И ВАЛЮТЫ ============
+# Код валюты (справочник — currency.py) и сумма в минимальных единицах в
+# заявках, покрывающий индекс для выборок по валюте и периоду и суточные
+# агрегаты с гистограммой сумм для /report.
+AMOUNT_COLUMNS = [("currency_code", "TEXT"), ("amount_minor", "INTEGER")]
+
+
+def migration_amounts(conn) -> None:
+    conn.execute('''CREATE TABLE IF NOT EXISTS amount_daily
+                    (kind TEXT NOT NULL,
+                     day TEXT NOT NULL,
+                     currency_code TEXT NOT NULL,
+                     bucket INTEGER NOT NULL,
+                     requests INTEGER NOT NULL DEFAULT 0,
+                     total_minor INTEGER NOT NULL DEFAULT 0,
+                     PRIMARY KEY (kind, day, currency_code, bucket)) WITHOUT ROWID''')
+
+    for table in AMOUNT_TABLES:
+        for part in (table, f"{table}_archive"):
+            existing = _columns(conn, part)
+            for column, column_type in AMOUNT_COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {part} ADD COLUMN {column} {column_type}")
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{part}_currency_ts ON {part} (currency_code, request_ts, amount_minor)"
+            )
+        # Представление перечисляет колонки явно, его нужно пересоздать с новыми
+        column_list = ", ".join(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+        conn.execute(f"DROP VIEW IF EXISTS {table}_all")
+        conn.execute(
+            f"CREATE VIEW {table}_all AS "
+            f"SELECT {column_list} FROM {table} UNION ALL SELECT {column_list} FROM {table}_archive"
+        )
+
+    rebuild_amounts(conn)
+
+
+# ============ 10. РЕПУТАЦИЯ В РУБЛЯХ ============
+# total_amount раньше складывал суммы в разных валютах как есть; теперь — в рублях
+def migration_reputation_rub(conn) -> None:
+    rebuild_reputation(conn)
+
+
+# ============ 11. СВОДКА ЗАЯВОК ============
+# Заявки, ждущие сводки для админа (digest.py), общие для всех воркеров
+def migration_digest_entries(conn) -> None:
+    conn.execute('''CREATE TABLE IF NOT EXISTS digest_entries
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     kind TEXT NOT NULL,
+                     summary TEXT NOT NULL,
+                     created_ts REAL NOT NULL)''')
+
+
+MIGRATIONS: List[Tuple[str, Callable]] = [
+    ("baseline", migration_baseline),
+    ("epoch_timestamps", migration_epoch_timestamps),
+    ("indexes", migration_indexes),
+    ("broadcasts", migration_broadcasts),
+    ("complaints_search", migration_complaints_search),
+    ("archive", migration_archive),
+    ("reputation", migration_reputation),
+    ("submission_fingerprints", migration_submission_fingerprints),
+    ("amounts", migration_amounts),
+    ("reputation_rub", migration_reputation_rub),
+    ("digest_entries", migration_digest_entries),
+]
+
+
+def migrate(conn) -> int:
+    """Доводит схему до последней версии. Возвращает итоговый номер версии."""
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    if current >= len(MIGRATIONS):
+        return current
+
+    for version in range(current + 1, len(MIGRATIONS) + 1):
+        name, migration = MIGRATIONS[version - 1]
+        # IMMEDIATE сразу берёт блокировку на запись: если миграцию уже применил
+        # другой процесс, это видно по user_version внутри транзакции
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+            conn.rollback()
+            continue
+        logger.info("Применяю миграцию %s: %s", version, name)
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return len(MIGRATIONS)
+
+
+def ensure_incremental_vacuum(conn) -> bool:
+    """Переводит базу в auto_vacuum=INCREMENTAL, чтобы место после архивации можно было
+    возвращать порциями через PRAGMA incremental_vacuum. False — база уже в этом режиме.
+
+    Новая база создаётся сразу в этом режиме (см. Database._open), а для существующего файла
+    режим меняется только полным VACUUM: на большой базе это долго, и всё это время
+    поток БД занят. Поэтому запуск не делает этого сам — шаг выполняется один раз
+    командой /vacuum.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    logger.info("Перевожу базу в режим auto_vacuum=INCREMENTAL (однократный VACUUM)")
+    started = time.monotonic()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    logger.info("VACUUM завершён за %.1f с", time.monotonic() - started)
+    return True
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramUnauthorizedError,
+)
+from aiogram.types import InlineKeyboardMarkup
+
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых повторять отправку бессмысленно
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramUnauthorizedError)
+
+
+class TokenBucket:
+    """Классическое ведро токенов: rate токенов в секунду, не больше capacity в запасе."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до следующего токена."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать токены seconds секунд. Одновременные паузы не складываются."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class Outbox:
+    """Надёжная очередь исходящих сообщений.
+
+    Обработчик кладёт сообщение в таблицу outbox и сразу возвращается, а фоновая
+    задача отправляет его. В каждый чат сообщения уходят строго по порядку,
+    скорость ограничена ведром токенов на чат и общим ведром на бота.
+    TelegramRetryAfter выдерживается, временные ошибки повторяются с растущей
+    паузой, а неотправленное переживает перезапуск.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        bot: Bot,
+        global_rate: float = 25,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        max_attempts: int = 8,
+        batch_size: int = 50,
+        idle_wait: float = 60.0,
+    ):
+        self.db = db
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        # Пауза опроса пустой очереди. В одном процессе enqueue() будит отправку сразу,
+        # а сообщения от других процессов (supervisor.py) видны только при опросе
+        self.idle_wait = idle_wait
+
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def enqueue(self, chat_id: int, text: str, parse_mode: Optional[str] = "HTML",
+                      reply_markup: Optional[InlineKeyboardMarkup] = None) -> int:
+        message_id = await self.db.run(self.insert, chat_id, text, parse_mode, reply_markup)
+        self.wake()
+        return message_id
+
+    @staticmethod
+    def insert(conn, chat_id: int, text: str, parse_mode: Optional[str] = "HTML",
+               reply_markup: Optional[InlineKeyboardMarkup] = None) -> int:
+        """Кладёт сообщение в очередь внутри уже идущей транзакции. После неё нужен wake()."""
+        markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else None
+        return conn.execute(
+            "INSERT INTO outbox (chat_id, text, parse_mode, reply_markup, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (chat_id, text, parse_mode, markup, time.time()),
+        ).lastrowid
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def deliver(self, messages: List[Tuple[int, str]], concurrency: int = 10) -> List[str]:
+        """Отправляет пачку сообщений сразу, не больше concurrency одновременно.
+
+        Порядок в чате не нарушается: если в очереди для чата уже что-то лежит,
+        сообщение встаёт за ним, а сообщения одного чата из пачки уходят по очереди.
+        То, что упёрлось в лимит чата, флуд-лимит или временную ошибку, ставится
+        в очередь и будет доставлено позже. Возвращает статус каждого сообщения:
+        "sent", "queued" или "failed".
+        """
+        by_chat: Dict[int, List[int]] = {}
+        for index, (chat_id, _) in enumerate(messages):
+            by_chat.setdefault(chat_id, []).append(index)
+
+        def query(conn):
+            placeholders = ", ".join("?" * len(by_chat))
+            return {row[0] for row in conn.execute(
+                f"SELECT DISTINCT chat_id FROM outbox WHERE status='pending' AND chat_id IN ({placeholders})",
+                list(by_chat),
+            )}
+        busy = await self.db.run(query) if by_chat else set()
+
+        statuses = ["queued"] * len(messages)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(chat_id: int, text: str) -> str:
+            if not self._chat_bucket(chat_id).try_take():
+                return "queued"
+            while not self.global_bucket.try_take():
+                await asyncio.sleep(self.global_bucket.delay())
+            try:
+                await self.bot.send_message(chat_id, text, parse_mode="HTML")
+                return "sent"
+            except TelegramRetryAfter as e:
+                # Лимит общий для бота: ждут все отправители, а не только получивший ошибку
+                self.global_bucket.pause(e.retry_after)
+                self._chat_bucket(chat_id).pause(e.retry_after)
+                return "queued"
+            except PERMANENT_ERRORS as e:
+                logger.warning("Сообщение в чат %s не будет доставлено: %s", chat_id, e)
+                return "failed"
+            except Exception:
+                return "queued"
+
+        async def send_chat(chat_id: int, indexes: List[int]) -> None:
+            queued = chat_id in busy
+            async with semaphore:
+                for index in indexes:
+                    if not queued:
+                        statuses[index] = await send(chat_id, messages[index][1])
+                        queued = statuses[index] == "queued"
+            # Всё, что не ушло, встаёт в очередь одной транзакцией и по порядку
+            rest = [messages[index][1] for index in indexes if statuses[index] == "queued"]
+            if rest:
+                def insert_rest(conn):
+                    for text in rest:
+                        self.insert(conn, chat_id, text)
+                await self.db.run(insert_rest)
+                self.wake()
+
+        await asyncio.gather(*(send_chat(chat_id, indexes) for chat_id, indexes in by_chat.items()))
+        return statuses
+
+    # ============ ЖИЗНЕННЫЙ ЦИКЛ ============
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        # wait_for до Python 3.12 теряет отмену, если событие пришло одновременно с ней
+        while not self._task.done():
+            self._task.cancel()
+            await asyncio.wait([self._task], timeout=1)
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                timeout = await self._dispatch()
+            except Exception:
+                logger.exception("Ошибка диспетчера исходящих сообщений")
+                timeout = 5.0
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    # ============ ОТПРАВКА ============
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10_000:
+                self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.is_full()}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _dispatch(self) -> float:
+        """Один проход: отправляет головные сообщения чатов. Возвращает паузу до следующего."""
+        now = time.time()
+
+        def query(conn):
+            # Берём только первое неотправленное сообщение каждого чата, чтобы не нарушить порядок
+            return conn.execute(
+                "SELECT id, chat_id, text, parse_mode, reply_markup, attempts, next_attempt_at "
+                "FROM outbox WHERE id IN "
+                "(SELECT MIN(id) FROM outbox WHERE status='pending' GROUP BY chat_id) "
+                "ORDER BY id"
+            ).fetchall()
+        heads = await self.db.run(query)
+        if not heads:
+            return self.idle_wait
+
+        batch, wait = [], self.idle_wait
+        for row in heads:
+            if row["next_attempt_at"] > now:
+                wait = min(wait, row["next_attempt_at"] - now)
+                continue
+            bucket = self._chat_bucket(row["chat_id"])
+            if not bucket.try_take():
+                wait = min(wait, bucket.delay())
+                continue
+            if not self.global_bucket.try_take():
+                bucket.tokens += 1
+                wait = min(wait, self.global_bucket.delay())
+                break
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                break
+
+        if not batch:
+            return max(wait, 0.01)
+        await asyncio.gather(*(self._send(row) for row in batch))
+        return 0.0
+
+    async def _send(self, row) -> None:
+        markup = InlineKeyboardMarkup.model_validate_json(row["reply_markup"]) if row["reply_markup"] else None
+        try:
+            await self.bot.send_message(row["chat_id"], row["text"], parse_mode=row["parse_mode"],
+                                        reply_markup=markup)
+        except TelegramRetryAfter as e:
+            self._chat_bucket(row["chat_id"]).pause(e.retry_after)
+            await self._reschedule(row["id"], time.time() + e.retry_after, row["attempts"], str(e))
+        except PERMANENT_ERRORS as e:
+            logger.warning("Сообщение %s в чат %s не будет доставлено: %s", row["id"], row["chat_id"], e)
+            await self._fail(row["id"], str(e))
+        except Exception as e:
+            attempts = row["attempts"] + 1
+            if attempts >= self.max_attempts:
+                logger.error("Сообщение %s в чат %s не отправлено за %s попыток: %s",
+                             row["id"], row["chat_id"], attempts, e)
+                await self._fail(row["id"], str(e))
+                return
+            backoff = min(2 ** attempts, 300) * random.uniform(0.8, 1.2)
+            await self._reschedule(row["id"], time.time() + backoff, attempts, str(e))
+        else:
+            await self.db.run(lambda conn: conn.execute("DELETE FROM outbox WHERE id=?", (row["id"],)))
+
+    async def _reschedule(self, message_id: int, when: float, attempts: int, error: str) -> None:
+        def query(conn):
+            conn.execute(
+                "UPDATE outbox SET next_attempt_at=?, attempts=?, last_error=? WHERE id=?",
+                (when, attempts, error, message_id),
+            )
+        await self.db.run(query)
+
+    async def _fail(self, message_id: int, error: str) -> None:
+        def query(conn):
+            conn.execute(
+                "UPDATE outbox SET status='failed', last_error=? WHERE id=?", (error, message_id)
+            )
+        await self.db.run(query)
@@ -0,0 +1,344 @@
+"""Замеры производительности: обработчики, БД, Bot API и FSM.
+
+PerfMonitor собирает гистограммы с фиксированными корзинами — запись
+в гистограмму стоит один bisect и пару сложений, поэтому замеры можно
+держать включёнными постоянно. Время БД и вызовы API привязываются к
+текущему обновлению через contextvar; обновления дольше slow_threshold
+попадают в кольцевой буфер медленных трасс.
+
+Результаты видны админу в /perf и, по желанию, в текстовом формате
+Prometheus по адресу /metrics.
+"""
+import bisect
+import html
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+from db import Database
+
+# Границы корзин в секундах, как у стандартных гистограмм Prometheus
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p: float) -> float:
+        """Верхняя граница корзины, в которую попадает p-й перцентиль, но не больше максимума."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+        return self.max
+
+
+class _Trace:
+    __slots__ = ("started", "event", "user_id", "handler", "db_time", "db_calls", "api_time", "api_calls",
+                 "fsm_time")
+
+    def __init__(self, event: str, user_id: Optional[int]):
+        self.started = time.perf_counter()
+        self.event = event
+        self.user_id = user_id
+        self.handler = None
+        self.db_time = 0.0
+        self.db_calls = 0
+        self.api_time = 0.0
+        self.api_calls = 0
+        self.fsm_time = 0.0
+
+
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar("perf_trace", default=None)
+
+
+class PerfMonitor:
+    def __init__(self, slow_threshold: float = 0.5, slow_traces: int = 50):
+        self.slow_threshold = slow_threshold
+        self.slow = deque(maxlen=slow_traces)
+        self._query_names: Dict[Any, str] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        self.started_at = time.time()
+        self.updates = Histogram()
+        self.handlers: Dict[str, Histogram] = {}
+        self.handler_errors = Counter()
+        self.db: Dict[str, Histogram] = {}
+        self.api: Dict[str, Histogram] = {}
+        self.api_errors = Counter()
+        self.fsm = Histogram()
+        self.slow.clear()
+
+    # ============ ПОДКЛЮЧЕНИЕ ============
+    def setup(self, dp: Dispatcher, bot: Bot, db: Database) -> None:
+        dp.update.outer_middleware(UpdateTimingMiddleware(self))
+        for observer in (dp.message, dp.callback_query):
+            observer.middleware(HandlerTimingMiddleware(self))
+        bot.session.middleware(RequestTimingMiddleware(self))
+        db.observer = self.observe_db
+
+    # ============ ЗАПИСЬ ============
+    def observe_db(self, fn: Callable, seconds: float) -> None:
+        # Имя запроса берётся из __qualname__ функции; вложенные функции создаются
+        # заново при каждом вызове, но code-объект у них общий — по нему и кэшируем
+        name = self._query_names.get(fn.__code__)
+        if name is None:
+            name = fn.__qualname__.replace(".<locals>", "")
+            for suffix in (".query", ".<lambda>"):
+                if name.endswith(suffix) and name != suffix[1:]:
+                    name = name[: -len(suffix)]
+            self._query_names[fn.__code__] = name
+        self._histogram(self.db, name).observe(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.db_time += seconds
+            trace.db_calls += 1
+
+    def observe_api(self, method: str, seconds: float, failed: bool) -> None:
+        self._histogram(self.api, method).observe(seconds)
+        if failed:
+            self.api_errors[method] += 1
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.api_time += seconds
+            trace.api_calls += 1
+
+    def observe_fsm(self, seconds: float) -> None:
+        self.fsm.observe(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.fsm_time += seconds
+
+    def _finish(self, trace: _Trace) -> None:
+        elapsed = time.perf_counter() - trace.started
+        self.updates.observe(elapsed)
+        if elapsed >= self.slow_threshold:
+            self.slow.append({
+                "at": time.time(),
+                "event": trace.event,
+                "handler": trace.handler or "—",
+                "user_id": trace.user_id,
+                "total": elapsed,
+                "db": trace.db_time,
+                "db_calls": trace.db_calls,
+                "api": trace.api_time,
+                "api_calls": trace.api_calls,
+                "fsm": trace.fsm_time,
+            })
+
+    @staticmethod
+    def _histogram(histograms: Dict[str, Histogram], name: str) -> Histogram:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        return histogram
+
+    # ============ ОТЧЁТЫ ============
+    def render(self, top: int = 8, slow: int = 5) -> str:
+        """Сводка для /perf в HTML-разметке Telegram."""
+        def ms(seconds: float) -> str:
+            return f"{seconds * 1000:.0f}" if seconds >= 0.01 else f"{seconds * 1000:.1f}"
+
+        def line(name: str, histogram: Histogram, errors: int = 0) -> str:
+            text = (
+                f"<code>{html.escape(f'{name[:28]:<28}')} {histogram.count:>6} "
+                f"{ms(histogram.percentile(50)):>5} {ms(histogram.percentile(95)):>5} "
+                f"{ms(histogram.percentile(99)):>5} {ms(histogram.max):>6}</code>"
+            )
+            return text + (f" ❗{errors}" if errors else "")
+
+        def section(title: str, histograms: Dict[str, Histogram], errors: Counter) -> List[str]:
+            lines = [f"\n<b>{title}</b>"]
+            ordered = sorted(histograms.items(), key=lambda item: -item[1].total)[:top]
+            lines += [line(name, histogram, errors.get(name, 0)) for name, histogram in ordered]
+            if not ordered:
+                lines.append("<code>нет данных</code>")
+            return lines
+
+        uptime = int(time.time() - self.started_at)
+        header = f"<code>{'':<28} {'вызовы':>6} {'p50':>5} {'p95':>5} {'p99':>5} {'max':>6}</code>"
+        lines = [
+            f"📈 <b>ПРОИЗВОДИТЕЛЬНОСТЬ</b> за {uptime // 3600} ч {uptime % 3600 // 60} мин, мс\n",
+            header,
+            line("все обновления", self.updates),
+            line("FSM-хранилище", self.fsm),
+        ]
+        lines += section("Обработчики:", self.handlers, self.handler_errors)
+        lines += section("Запросы к БД:", self.db, Counter())
+        lines += section("Bot API:", self.api, self.api_errors)
+
+        traces = list(self.slow)[-slow:]
+        if traces:
+            lines.append(f"\n<b>Медленные обновления (≥ {ms(self.slow_threshold)} мс):</b>")
+            for trace in reversed(traces):
+                lines.append(
+                    f"<code>{time.strftime('%H:%M:%S', time.localtime(trace['at']))} {html.escape(trace['handler'])} "
+                    f"({trace['event']}, {trace['user_id']}): {ms(trace['total'])} мс — "
+                    f"БД {ms(trace['db'])}/{trace['db_calls']}, API {ms(trace['api'])}/{trace['api_calls']}, "
+                    f"FSM {ms(trace['fsm'])}</code>"
+                )
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        """Метрики в текстовом формате Prometheus."""
+        lines: List[str] = []
+
+        def label(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def histogram(name: str, help_text: str, series: Dict[str, Histogram], label_name: Optional[str]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, values in series.items():
+                labels = f'{label_name}="{label(key)}",' if label_name else ""
+                cumulative = 0
+                for bound, count in zip(BUCKETS, values.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {values.count}')
+                suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+                lines.append(f"{name}_sum{suffix} {values.total}")
+                lines.append(f"{name}_count{suffix} {values.count}")
+
+        def counter(name: str, help_text: str, series: Counter, label_name: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f'{name}{{{label_name}="{label(key)}"}} {value}')
+
+        histogram("bot_update_seconds", "Update processing time", {"": self.updates}, None)
+        histogram("bot_handler_seconds", "Handler time", self.handlers, "handler")
+        counter("bot_handler_errors_total", "Handler exceptions", self.handler_errors, "handler")
+        histogram("bot_db_seconds", "Database call time including queueing", self.db, "query")
+        histogram("bot_api_seconds", "Bot API request time", self.api, "method")
+        counter("bot_api_errors_total", "Failed Bot API requests", self.api_errors, "method")
+        histogram("bot_fsm_seconds", "FSM storage call time", {"": self.fsm}, None)
+        return "\n".join(lines) + "\n"
+
+    async def metrics_handler(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.prometheus(), content_type="text/plain", charset="utf-8")
+
+    def metrics_app(self, path: str = "/metrics") -> web.Application:
+        app = web.Application()
+        app.router.add_get(path, self.metrics_handler)
+        return app
+
+
+# ============ MIDDLEWARE ============
+class UpdateTimingMiddleware(BaseMiddleware):
+    """Внешний middleware: открывает трассу на время всего обновления."""
+
+    def __init__(self, monitor: PerfMonitor):
+        self.monitor = monitor
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        trace = _Trace(event.event_type, user.id if user else None)
+        token = _current_trace.set(trace)
+        try:
+            return await handler(event, data)
+        finally:
+            _current_trace.reset(token)
+            self.monitor._finish(trace)
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Внутренний middleware: к этому моменту известно, какой обработчик выбран."""
+
+    def __init__(self, monitor: PerfMonitor):
+        self.monitor = monitor
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        name = data["handler"].callback.__name__
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.handler = name
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.monitor.handler_errors[name] += 1
+            raise
+        finally:
+            self.monitor._histogram(self.monitor.handlers, name).observe(time.perf_counter() - started)
+
+
+class RequestTimingMiddleware(BaseRequestMiddleware):
+    def __init__(self, monitor: PerfMonitor):
+        self.monitor = monitor
+
+    async def __call__(self, make_request, bot: Bot, method):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = await make_request(bot, method)
+            failed = False
+            return response
+        finally:
+            self.monitor.observe_api(method.__api_method__, time.perf_counter() - started, failed)
+
+
+class TimedStorage(BaseStorage):
+    """Обёртка над FSM-хранилищем, замеряющая каждый вызов."""
+
+    def __init__(self, storage: BaseStorage, monitor: PerfMonitor):
+        self.storage = storage
+        self.monitor = monitor
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        started = time.perf_counter()
+        try:
+            await self.storage.set_state(key, state)
+        finally:
+            self.monitor.observe_fsm(time.perf_counter() - started)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            return await self.storage.get_state(key)
+        finally:
+            self.monitor.observe_fsm(time.perf_counter() - started)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        started = time.perf_counter()
+        try:
+            await self.storage.set_data(key, data)
+        finally:
+            self.monitor.observe_fsm(time.perf_counter() - started)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            return await self.storage.get_data(key)
+        finally:
+            self.monitor.observe_fsm(time.perf_counter() - started)
+
+    async def close(self) -> None:
+        await self.storage.close()
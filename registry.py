@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+from typing import Dict, Optional, Tuple
+
+from db import Database, stamp
+
+logger = logging.getLogger(__name__)
+
+
+class UserRegistry:
+    """Кто уже зарегистрирован, без похода в базу на каждый /start.
+
+    При запуске все user_id загружаются в отсортированный array('q') — 8 байт
+    на пользователя против ~70 у set — и проверяются бинарным поиском.
+    Новые пользователи с момента запуска попадают в set и в буфер, который пишется
+    в базу одной транзакцией executemany через flush_interval секунд после
+    первой записи или сразу при batch_size записях. При остановке буфер
+    сбрасывается, так что регистрации не теряются.
+
+    Отдельно в памяти держатся те, кто заблокировал бота (status='blocked'):
+    повторный /start от них снимает пометку, от остальных в базу не ходит.
+    """
+
+    def __init__(self, db: Database, flush_interval: float = 1.0, batch_size: int = 500):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._known = array("q")
+        self._added = set()
+        self._blocked = set()
+        self._pending: Dict[int, Tuple[int, str, str, str, int]] = {}
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        self._known = array("q", await self.db.users.all_ids())
+        self._added.clear()
+        await self.load_blocked()
+        logger.info("Загружено зарегистрированных пользователей: %s", len(self._known))
+
+    async def load_blocked(self) -> None:
+        self._blocked = set(await self.db.users.blocked_ids())
+
+    def mark_blocked(self, user_ids) -> None:
+        self._blocked.update(user_ids)
+
+    def __contains__(self, user_id: int) -> bool:
+        if user_id in self._added:
+            return True
+        index = bisect_left(self._known, user_id)
+        return index < len(self._known) and self._known[index] == user_id
+
+    def __len__(self) -> int:
+        return len(self._known) + len(self._added)
+
+    async def register(self, user_id: int, username: str, first_name: str) -> bool:
+        """Ставит пользователя в очередь на запись. False — он уже был известен."""
+        if user_id in self:
+            if user_id in self._blocked:
+                # Снова написал боту — опять получает рассылки
+                self._blocked.discard(user_id)
+                await self.db.users.unblock(user_id)
+            return False
+        self._added.add(user_id)
+        self._pending[user_id] = (user_id, username, first_name, *stamp())
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return True
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Не удалось записать новых пользователей")
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                await self.db.users.add_many(list(pending.values()))
+            except BaseException:
+                # Вернуть в буфер, чтобы записать следующей порцией
+                self._pending = {**pending, **self._pending}
+                raise
+
+    async def close(self) -> None:
+        await self.flush()
@@ -0,0 +1,167 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
+
+from banner import BannerCache
+
+logger = logging.getLogger(__name__)
+
+# Подпись к фото в Telegram ограничена 1024 символами
+CAPTION_LIMIT = 1024
+
+
+@dataclass(frozen=True)
+class Screen:
+    text: str
+    keyboard: InlineKeyboardMarkup
+    with_banner: bool = False
+
+
+BACK_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🔙 Назад в меню", callback_data="back_to_menu")]
+])
+
+
+def build_screens(owner_username: str) -> Dict[str, Screen]:
+    """Собирает тексты и клавиатуры экранов один раз при запуске."""
+    owner_button = InlineKeyboardButton(text="📞 Мой ЛС", url=f"https://t.me/{owner_username}")
+
+    menu = Screen(
+        text=(
+            "👋 <b>Приветствую!</b>\n\n"
+            "Это <b>единственный официальный проект ручений</b>\n"
+            "от <b>@orgazm</b>\n\n"
+            "‼️ <b>НЕ ВЕДИТЕСЬ НА ФЕЙКОВ!</b>\n"
+            "✅ <b>Официальный бот — @OrgazmDeals_Bot</b>\n\n"
+            "👇 <b>Выберите действие:</b>"
+        ),
+        keyboard=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="❓ Уточнить ручение", callback_data="vouch_check")],
+            [InlineKeyboardButton(text="⚠️ Подать жалобу", callback_data="complaint")],
+            [InlineKeyboardButton(text="💼 Купить ручение", callback_data="buy_vouch")],
+            [InlineKeyboardButton(text="ℹ️ Информация", callback_data="info")],
+            [owner_button],
+        ]),
+        with_banner=True,
+    )
+
+    vouch_check = Screen(
+        text=(
+            "❓ <b>Уточнение ручения</b>\n\n"
+            "<b>Введите @юзернейм человека:</b>\n"
+            "👉 Например: @durov"
+        ),
+        keyboard=BACK_KEYBOARD,
+    )
+
+    complaint = Screen(
+        text=(
+            "⚠️ <b>Подача жалобы</b>\n\n"
+            "📝 <b>Опишите ситуацию подробно:</b>\n"
+            "• <b>Кто обманул</b> (@юзернейм)\n"
+            "• <b>На какую сумму</b>\n"
+            "• <b>Что обещали и что получили</b>\n"
+            "• <b>Ссылки на скриншоты</b>\n\n"
+            "📨 <b>Я передам @orgazm для рассмотрения.</b>"
+        ),
+        keyboard=BACK_KEYBOARD,
+    )
+
+    buy_vouch = Screen(
+        text=(
+            "💼 <b>Покупка ручения</b>\n\n"
+            "💰 <b>Введите сумму</b>, которую хотите внести:\n"
+            "👉 <b>Только цифры</b>, например: 1000"
+        ),
+        keyboard=BACK_KEYBOARD,
+    )
+
+    info = Screen(
+        text=(
+            "ℹ️ <b>О боте</b>\n\n"
+            "🤝 <b>Это единственный официальный проект ручений</b>\n"
+            "от <b>@orgazm</b>\n\n"
+            "❓ <b>Как уточнить ручение?</b>\n"
+            "1️⃣ <b>Нажмите кнопку «Уточнить ручение»</b>\n"
+            "2️⃣ <b>Введите @юзернейм человека</b>\n"
+            "3️⃣ <b>Введите сумму сделки</b>\n"
+            "4️⃣ <b>Введите валюту</b>\n"
+            "5️⃣ <b>Ожидайте ответа от @orgazm</b>\n\n"
+            "✅ <b>Если я РУЧНУСЬ</b> — человек надёжный, можете смело проводить сделку!\n\n"
+            "❌ <b>Если обманули:</b>\n"
+            "• <b>Напишите мне в ЛС @orgazm</b>\n"
+            "• <b>Приложите ВСЕ доказательства</b>\n"
+            "• <b>Я сниму ручение с мошенника</b>\n"
+            "• <b>ВОЗМЕЩУ вам полную сумму!</b>\n\n"
+            "‼️ <b>Остерегайтесь фейков!</b>\n"
+            "✅ <b>Официальный бот — @OrgazmDeals_Bot</b>"
+        ),
+        keyboard=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🔙 Назад в меню", callback_data="back_to_menu")],
+            [owner_button],
+        ]),
+    )
+
+    return {
+        "menu": menu,
+        "vouch_check": vouch_check,
+        "complaint": complaint,
+        "buy_vouch": buy_vouch,
+        "info": info,
+    }
+
+
+# ============ ПЕРЕКЛЮЧЕНИЕ ЭКРАНОВ ============
+async def _edit(bot: Bot, message: Message, screen: Screen, banner: BannerCache) -> bool:
+    """Пробует перерисовать сообщение на месте. False — если правка невозможна."""
+    chat_id, message_id = message.chat.id, message.message_id
+
+    if message.photo:
+        if len(screen.text) > CAPTION_LIMIT:
+            return False
+        # Фото меняется, только если в сообщении не баннер и баннер вообще есть
+        if not screen.with_banner or banner.is_banner(message) or not await banner.edit(
+            bot, chat_id, message_id, screen.text, parse_mode="HTML", reply_markup=screen.keyboard,
+        ):
+            await bot.edit_message_caption(
+                chat_id=chat_id, message_id=message_id, caption=screen.text,
+                reply_markup=screen.keyboard, parse_mode="HTML",
+            )
+        return True
+
+    if message.text is None or (screen.with_banner and banner.available()):
+        # Текстовое сообщение нельзя превратить в фото, баннер придётся отправить заново
+        return False
+
+    await bot.edit_message_text(
+        screen.text, chat_id=chat_id, message_id=message_id,
+        reply_markup=screen.keyboard, parse_mode="HTML",
+    )
+    return True
+
+
+async def show_screen(bot: Bot, message: Optional[Message], chat_id: int, screen: Screen,
+                      banner: BannerCache) -> None:
+    """Показывает экран, по возможности редактируя сообщение, на котором нажали кнопку."""
+    if message is not None:
+        try:
+            if await _edit(bot, message, screen, banner):
+                return
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return
+            logger.info("Не удалось отредактировать сообщение, отправляю новое: %s", e)
+        try:
+            await message.delete()
+        except TelegramBadRequest:
+            pass
+
+    if screen.with_banner and await banner.send(
+        bot, chat_id, screen.text, reply_markup=screen.keyboard, parse_mode="HTML"
+    ) is not None:
+        return
+    await bot.send_message(chat_id, screen.text, reply_markup=screen.keyboard, parse_mode="HTML")
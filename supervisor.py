@@ -0,0 +1,423 @@
+"""Многопроцессный режим: супервизор и N воркеров с bot.py.
+
+Супервизор сам получает обновления (polling или вебхук) и раздаёт их воркерам
+по консистентному хэшу user_id: все обновления одного пользователя попадают
+в один воркер, поэтому его FSM, анти-флуд и кэши остаются согласованными.
+Админ всегда обслуживается воркером 0. Только воркер 0 запускает рассылки,
+обслуживание базы и отправку очереди outbox. Упавший воркер перезапускается
+на том же месте кольца.
+
+Воркер подтверждает каждое обработанное обновление. Неподтверждённые
+супервизор держит в памяти и после перезапуска воркера отдаёт ему заново:
+обновление, которое упавший воркер успел обработать, но не подтвердить,
+может обработаться дважды. Потерять их можно, только если упадёт сам
+супервизор — offset в Telegram к этому моменту уже сдвинут.
+
+Воркер — отдельный процесс `python supervisor.py worker`, обновления приходят
+ему в stdin по одному JSON на строку. Локально всё проверяется прогоном
+записанных обновлений против фейкового Bot API:
+
+    python bench/updates.py mixed --users 500 > updates.jsonl
+    python supervisor.py replay updates.jsonl --workers 4 --fake-api 8081
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import time
+from bisect import bisect
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+
+def update_user_id(update: dict) -> Optional[int]:
+    """user_id отправителя из сырого обновления Telegram (или id чата, если отправителя нет)."""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return user.get("id")
+        chat = value.get("chat")
+        if chat:
+            return chat.get("id")
+    return None
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Консистентное хэширование: при смене числа воркеров переезжает ~1/N пользователей."""
+
+    def __init__(self, nodes: int, replicas: int = 64):
+        points = sorted((_hash(f"worker-{node}-{replica}"), node)
+                        for node in range(nodes) for replica in range(replicas))
+        self._keys = [key for key, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key: int) -> int:
+        index = bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._nodes[index]
+
+
+# ============ СУПЕРВИЗОР ============
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.lock = asyncio.Lock()
+        self.started_at = 0.0
+        self.restarts = 0
+        self.summary: Optional[dict] = None
+        self.ready = asyncio.Event()
+        # Отданные воркеру, но ещё не подтверждённые обновления: update_id -> строка для stdin
+        self.unacked: Dict[int, bytes] = {}
+        self.refeed: Optional[asyncio.Task] = None
+
+
+class Supervisor:
+    def __init__(self, workers: int, admin_id: Optional[int] = None, env: Optional[Dict[str, str]] = None,
+                 max_restart_delay: float = 60.0):
+        self.ring = HashRing(workers)
+        self.admin_id = admin_id
+        self.env = env or {}
+        self.max_restart_delay = max_restart_delay
+        self.workers = [_Worker(index) for index in range(workers)]
+        self.routed = [0] * workers
+        self._stopping = False
+        self._watchers: List[asyncio.Task] = []
+
+    def route(self, update: dict) -> int:
+        user_id = update_user_id(update)
+        if user_id is None:
+            return update.get("update_id", 0) % len(self.workers)
+        if user_id == self.admin_id:
+            return 0
+        return self.ring.node(user_id)
+
+    async def start(self) -> None:
+        for worker in self.workers:
+            await self._spawn(worker)
+            self._watchers.append(asyncio.create_task(self._watch(worker)))
+
+    async def _spawn(self, worker: _Worker) -> None:
+        env = {**os.environ, **self.env,
+               "BOT_WORKERS": str(len(self.workers)), "BOT_WORKER_INDEX": str(worker.index)}
+        worker.ready.clear()
+        worker.process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "supervisor.py"), "worker",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, env=env,
+        )
+        worker.started_at = time.monotonic()
+        logger.info("Воркер %s запущен, pid %s", worker.index, worker.process.pid)
+
+    async def _watch(self, worker: _Worker) -> None:
+        while True:
+            process = worker.process
+            async for line in process.stdout:
+                # В stdout воркер пишет только служебные строки, логи идут в stderr
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError("ожидался объект")
+                except ValueError:
+                    logger.warning("Воркер %s: непонятная строка в stdout: %r", worker.index, line[:200])
+                    continue
+                if "done" in message:
+                    worker.unacked.pop(message["done"], None)
+                elif message.get("ready"):
+                    if worker.unacked:
+                        worker.refeed = asyncio.create_task(self._refeed(worker))
+                    else:
+                        worker.ready.set()
+                else:
+                    worker.summary = message
+            code = await process.wait()
+            if self._stopping:
+                return
+            if time.monotonic() - worker.started_at > 60:
+                worker.restarts = 0
+            delay = min(2 ** worker.restarts, self.max_restart_delay)
+            worker.restarts += 1
+            logger.error("Воркер %s завершился с кодом %s, перезапуск через %s с", worker.index, code, delay)
+            worker.ready.clear()
+            await asyncio.sleep(delay)
+            if self._stopping:
+                return
+            await self._spawn(worker)
+
+    async def _refeed(self, worker: _Worker) -> None:
+        """Отдаёт перезапущенному воркеру то, что не подтвердил прошлый. Новые обновления ждут ready."""
+        lines = list(worker.unacked.values())
+        logger.warning("Воркер %s: повторно отдаю неподтверждённых обновлений: %s", worker.index, len(lines))
+        async with worker.lock:
+            try:
+                for line in lines:
+                    worker.process.stdin.write(line)
+                    await worker.process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # Упал снова: обновления остались неподтверждёнными, попробуем после перезапуска
+                return
+        worker.ready.set()
+
+    async def wait_ready(self) -> None:
+        await asyncio.gather(*(worker.ready.wait() for worker in self.workers))
+
+    async def feed(self, update: dict) -> None:
+        """Передаёт обновление воркеру. Пока воркер перезапускается, ждёт его."""
+        index = self.route(update)
+        worker = self.workers[index]
+        line = json.dumps(update, ensure_ascii=False).encode() + b"\n"
+        while True:
+            await worker.ready.wait()
+            async with worker.lock:
+                try:
+                    worker.process.stdin.write(line)
+                    await worker.process.stdin.drain()
+                    if "update_id" in update:
+                        worker.unacked[update["update_id"]] = line
+                    self.routed[index] += 1
+                    return
+                except (BrokenPipeError, ConnectionResetError):
+                    # Воркер упал, _watch его перезапустит
+                    worker.ready.clear()
+
+    async def stop(self, timeout: float = 30.0) -> List[Optional[dict]]:
+        """Закрывает stdin воркеров — они дорабатывают очередь и выходят. Возвращает их сводки."""
+        self._stopping = True
+        for worker in self.workers:
+            if worker.process and worker.process.stdin and not worker.process.stdin.is_closing():
+                worker.process.stdin.close()
+        try:
+            await asyncio.wait_for(asyncio.gather(*self._watchers, return_exceptions=True), timeout)
+        except asyncio.TimeoutError:
+            for worker in self.workers:
+                if worker.process and worker.process.returncode is None:
+                    logger.warning("Воркер %s не остановился за %s с, завершаю", worker.index, timeout)
+                    worker.process.kill()
+            await asyncio.gather(*self._watchers, return_exceptions=True)
+        return [worker.summary for worker in self.workers]
+
+
+async def _migrate(db_path: str) -> None:
+    # Схему доводит супервизор до запуска воркеров, чтобы они не делали это наперегонки
+    from db import Database
+    db = Database(db_path)
+    await db.connect()
+    await db.close()
+
+
+async def run_supervisor(bot, allowed_updates: List[str], workers: int, admin_id: int, db_path: str,
+                         webhook: Optional[dict] = None) -> None:
+    """Запускает воркеров и раздаёт им обновления из polling или, если задан webhook, с вебхука.
+
+    webhook — параметры run_webhook: url, path, secret, host, port, delete_on_shutdown.
+    """
+    await _migrate(db_path)
+    supervisor = Supervisor(workers, admin_id)
+    await supervisor.start()
+    try:
+        if webhook is not None:
+            await _serve_webhook(bot, supervisor, allowed_updates, **webhook)
+        else:
+            await _poll(bot, supervisor, allowed_updates)
+    finally:
+        await supervisor.stop()
+        await bot.session.close()
+
+
+async def _poll(bot, supervisor: Supervisor, allowed_updates: List[str]) -> None:
+    offset, backoff = None, 1.0
+    logger.info("Супервизор забирает обновления через polling, воркеров: %s", len(supervisor.workers))
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Ошибка getUpdates: %s, повтор через %s с", e, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+            continue
+        backoff = 1.0
+        for update in updates:
+            await supervisor.feed(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+            offset = update.update_id + 1
+
+
+async def _serve_webhook(bot, supervisor: Supervisor, allowed_updates: List[str], url: Optional[str],
+                         path: str, secret: Optional[str], host: str, port: int,
+                         delete_on_shutdown: bool = True) -> None:
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=401)
+        await supervisor.feed(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    webhook_url = url.rstrip("/") + path if url else None
+    if webhook_url:
+        await bot.set_webhook(webhook_url, secret_token=secret, allowed_updates=allowed_updates)
+    logger.info("Супервизор слушает вебхук %s:%s%s, воркеров: %s", host, port, path, len(supervisor.workers))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if webhook_url and delete_on_shutdown:
+            await bot.delete_webhook()
+        await runner.cleanup()
+
+
+# ============ ВОРКЕР ============
+async def run_worker() -> dict:
+    """Обрабатывает обновления из stdin, пока он не закроется. Возвращает сводку для супервизора."""
+    summary_out = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    # print() в обработчиках и запись в fd 1 из нативного кода не должны попадать в канал сводки
+    sys.stdout = sys.stderr
+    os.dup2(sys.stderr.fileno(), 1)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import bot as app
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=2 ** 22)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    await app.dp.emit_startup(bot=app.bot)
+    # Обновления супервизор шлёт только после этой строки
+    summary_out.write(json.dumps({"ready": True}) + "\n")
+    summary_out.flush()
+    chains: Dict[Optional[int], asyncio.Task] = {}
+    # Список пользователей нужен только сводке прогона (replay), в боевом режиме он рос бы без конца
+    users = set() if os.getenv("BOT_WORKER_TRACK_USERS") == "1" else None
+    processed = errors = 0
+
+    async def handle(previous: Optional[asyncio.Task], update: dict) -> None:
+        nonlocal processed, errors
+        # Обновления одного пользователя обрабатываются строго по очереди
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await app.dp.feed_raw_update(app.bot, update)
+        except Exception:
+            errors += 1
+            logger.exception("Ошибка обработки обновления %s", update.get("update_id"))
+        processed += 1
+        if "update_id" in update:
+            summary_out.write(json.dumps({"done": update["update_id"]}) + "\n")
+            summary_out.flush()
+
+    def forget(user_id, task: asyncio.Task) -> None:
+        if chains.get(user_id) is task:
+            del chains[user_id]
+
+    while line := await reader.readline():
+        update = json.loads(line)
+        user_id = update_user_id(update)
+        if users is not None:
+            users.add(user_id)
+        task = asyncio.create_task(handle(chains.get(user_id), update))
+        chains[user_id] = task
+        task.add_done_callback(lambda task, user_id=user_id: forget(user_id, task))
+
+    while chains:
+        await asyncio.wait(list(chains.values()))
+    await app.dp.emit_shutdown(bot=app.bot)
+    await app.bot.session.close()
+
+    summary = {"worker": app.WORKER_INDEX, "updates": processed, "errors": errors}
+    if users is not None:
+        summary["users"] = sorted(user for user in users if user is not None)
+    summary_out.write(json.dumps(summary) + "\n")
+    summary_out.flush()
+    return summary
+
+
+# ============ ЛОКАЛЬНЫЙ ПРОГОН ============
+async def replay(args) -> None:
+    env = {}
+    api = runner = None
+    if args.fake_api:
+        sys.path.insert(0, os.path.join(ROOT, "bench"))
+        from fake_api import FakeBotAPI, serve
+        api = FakeBotAPI(latency=args.latency)
+        runner = await serve(api, "127.0.0.1", args.fake_api)
+        env.update(BOT_TOKEN="42:REPLAY", TELEGRAM_API_URL=f"http://127.0.0.1:{args.fake_api}")
+    elif not os.getenv("TELEGRAM_API_URL"):
+        raise SystemExit("Укажи --fake-api PORT или TELEGRAM_API_URL, чтобы не слать записанные обновления в Telegram")
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="orgazm-replay-"), "replay.db")
+    env.update(DB_PATH=db_path, ADMIN_ID=str(args.admin_id), BOT_WORKER_TRACK_USERS="1")
+    os.environ.update(env)
+    await _migrate(db_path)
+
+    with open(args.path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+
+    supervisor = Supervisor(args.workers, args.admin_id, env)
+    await supervisor.start()
+    await supervisor.wait_ready()
+    started = time.perf_counter()
+    for update in updates:
+        await supervisor.feed(update)
+    summaries = await supervisor.stop(timeout=args.timeout)
+    elapsed = time.perf_counter() - started
+    if runner is not None:
+        await runner.cleanup()
+
+    print(f"Обновлений: {len(updates)} за {elapsed:.2f} с — {len(updates) / elapsed:.1f} в секунду, база: {db_path}")
+    owners: Dict[int, int] = {}
+    split = set()
+    for index, summary in enumerate(summaries):
+        if summary is None:
+            print(f"  воркер {index}: сводки нет (упал?), отправлено {supervisor.routed[index]}")
+            continue
+        print(f"  воркер {index}: обработано {summary['updates']} из {supervisor.routed[index]}, "
+              f"пользователей {len(summary['users'])}, ошибок {summary['errors']}")
+        for user_id in summary["users"]:
+            if owners.setdefault(user_id, index) != index:
+                split.add(user_id)
+    print("Каждый пользователь обслуживался одним воркером" if not split
+          else f"Пользователи на нескольких воркерах: {sorted(split)[:20]}")
+    if api is not None:
+        print(f"Вызовов Bot API: {sum(api.calls.values())} {dict(api.calls)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("worker", help="воркер: обновления из stdin (запускается супервизором)")
+    replay_parser = commands.add_parser("replay", help="прогнать записанные обновления через воркеров")
+    replay_parser.add_argument("path", help="JSONL-файл с обновлениями")
+    replay_parser.add_argument("--workers", type=int, default=4)
+    replay_parser.add_argument("--fake-api", type=int, metavar="PORT", help="поднять bench/fake_api.py на этом порту")
+    replay_parser.add_argument("--latency", type=float, default=0.0, help="задержка фейкового Bot API, с")
+    replay_parser.add_argument("--db", help="файл базы (по умолчанию временный)")
+    replay_parser.add_argument("--admin-id", type=int, default=1)
+    replay_parser.add_argument("--timeout", type=float, default=120.0, help="сколько ждать воркеров в конце, с")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "worker":
+        asyncio.run(run_worker())
+    else:
+        asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import unittest
+
+from answers import MAX_BULK_ANSWERS, parse_answers
+
+
+class ParseAnswersTest(unittest.TestCase):
+    def test_single_answer(self):
+        self.assertEqual(parse_answers("5 ✅ Ручаюсь"), [(5, "✅ Ручаюсь")])
+
+    def test_ranges_and_lists(self):
+        self.assertEqual([i for i, _ in parse_answers("5-7, 12 ok")], [5, 6, 7, 12])
+
+    def test_continuation_starting_with_digit_stays_in_answer(self):
+        body = "5 ✅ Ручаюсь, проверен лично.\n3 сделки прошли без проблем"
+        self.assertEqual(parse_answers(body), [(5, "✅ Ручаюсь, проверен лично.\n3 сделки прошли без проблем")])
+
+    def test_next_answer_needs_hash(self):
+        body = "5 ✅ Ручаюсь\n#6 ❌ Не ручаюсь\nскам\n#7-8 ок"
+        self.assertEqual(parse_answers(body), [
+            (5, "✅ Ручаюсь"), (6, "❌ Не ручаюсь\nскам"), (7, "ок"), (8, "ок"),
+        ])
+
+    def test_first_line_may_have_hash(self):
+        self.assertEqual(parse_answers("#5 ok"), [(5, "ok")])
+
+    def test_repeated_id_keeps_first_answer(self):
+        self.assertEqual(parse_answers("5 a\n#5 b"), [(5, "a")])
+
+    def test_first_line_without_id(self):
+        with self.assertRaises(ValueError):
+            parse_answers("Ручаюсь\n#5 ok")
+
+    def test_limit(self):
+        with self.assertRaises(ValueError):
+            parse_answers(f"1-{MAX_BULK_ANSWERS + 1} ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""Анти-флуд: лимиты на пользователя и класс обработчика.
+
+Класс задаётся флагом обработчика: @dp.message(..., flags={"throttle": "submit"}),
+без флага действует класс "default". Лимиты считаются скользящим окном
+в приближении двух соседних окон: на пару (пользователь, класс) хранятся
+три числа, а не список отметок времени. Записи лежат в OrderedDict по
+давности обращения и вытесняются, как только окно устарело или
+превышен max_entries.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+DEFAULT_CLASS = "default"
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[int, float]]:
+    """Разбирает строку вида "default=20/10,submit=3/600" в {класс: (лимит, секунды)}."""
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        count, _, period = value.partition("/")
+        limits[name.strip()] = (int(count), float(period))
+    return limits
+
+
+class _Window:
+    __slots__ = ("start", "current", "previous", "warned", "dropped")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.current = 0
+        self.previous = 0
+        self.warned = False
+        self.dropped = 0
+
+
+class Throttler:
+    def __init__(self, limits: Dict[str, Tuple[int, float]], exempt: Iterable[int] = (),
+                 max_entries: int = 100_000):
+        self.limits = limits
+        self.exempt = set(exempt)
+        self.max_entries = max_entries
+        self._windows: "OrderedDict[Tuple[int, str], _Window]" = OrderedDict()
+
+    def hit(self, user_id: int, name: str, now: Optional[float] = None) -> Optional[_Window]:
+        """Учитывает обращение. None — можно обрабатывать, иначе окно, в котором превышен лимит."""
+        limit = self.limits.get(name) or self.limits.get(DEFAULT_CLASS)
+        if limit is None or user_id in self.exempt:
+            return None
+        count, period = limit
+        now = time.monotonic() if now is None else now
+
+        key = (user_id, name)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _Window(now)
+        else:
+            self._windows.move_to_end(key)
+            passed = now - window.start
+            if passed >= period:
+                window.previous = window.current if passed < 2 * period else 0
+                window.current = 0
+                window.start = now - passed % period
+                window.warned = False
+        self._evict(now)
+
+        weight = 1 - (now - window.start) / period
+        if window.previous * weight + window.current >= count:
+            window.dropped += 1
+            return window
+        window.current += 1
+        return None
+
+    def _evict(self, now: float) -> None:
+        while self._windows:
+            (_, name), window = next(iter(self._windows.items()))
+            period = (self.limits.get(name) or self.limits[DEFAULT_CLASS])[1]
+            if len(self._windows) <= self.max_entries and now - window.start < 2 * period:
+                break
+            self._windows.popitem(last=False)
+
+    def retry_after(self, name: str, window: _Window, now: Optional[float] = None) -> int:
+        period = (self.limits.get(name) or self.limits[DEFAULT_CLASS])[1]
+        now = time.monotonic() if now is None else now
+        return max(1, int(window.start + period - now) + 1)
+
+    def throttled(self) -> List[Tuple[int, str, int]]:
+        """Пользователи, у которых сейчас отбрасываются обновления: (user_id, класс, отброшено)."""
+        rows = [(user_id, name, window.dropped) for (user_id, name), window in self._windows.items()
+                if window.dropped]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def clear(self, user_id: Optional[int] = None) -> int:
+        if user_id is None:
+            cleared = len(self._windows)
+            self._windows.clear()
+            return cleared
+        keys = [key for key in self._windows if key[0] == user_id]
+        for key in keys:
+            del self._windows[key]
+        return len(keys)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Внутренний middleware, чтобы видеть флаги выбранного обработчика.
+
+    Первое лишнее обновление в окне получает ответ «подожди», остальные
+    отбрасываются молча, не доходя до базы и админа.
+    """
+
+    def __init__(self, throttler: Throttler):
+        self.throttler = throttler
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        name = get_flag(data, "throttle", default=DEFAULT_CLASS)
+        window = self.throttler.hit(user.id, name)
+        if window is None:
+            return await handler(event, data)
+
+        if not window.warned and isinstance(event, (Message, CallbackQuery)):
+            window.warned = True
+            await event.answer(f"⏳ Слишком часто! Подожди {self.throttler.retry_after(name, window)} сек.")
+        return None
@@ -0,0 +1,48 @@
+"""Отправляет записанные обновления в локально запущенный вебхук.
+
+Файл — по одному JSON-объекту Update на строку:
+
+    python tools/post_updates.py updates.jsonl --url http://127.0.0.1:8080/webhook --secret SECRET
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import ClientSession
+
+
+async def post_updates(path: str, url: str, secret: str = None, concurrency: int = 1) -> None:
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def post(session: ClientSession, update: dict) -> None:
+        async with semaphore:
+            async with session.post(url, json=update, headers=headers) as response:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(post(session, update) for update in updates))
+    elapsed = time.perf_counter() - started
+
+    print(f"Отправлено обновлений: {len(updates)} за {elapsed:.2f} с")
+    print(f"Ответы сервера: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="JSONL-файл с обновлениями")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(post_updates(args.path, args.url, args.secret, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
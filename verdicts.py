@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from db import Database, normalize_username
+
+
+@dataclass(frozen=True)
+class Verdict:
+    request_id: int
+    text: str
+    date: str
+
+
+class VerdictCache:
+    """Последний ответ админа по каждому проверяемому человеку.
+
+    Популярных продавцов проверяют снова и снова, поэтому ответы держатся в LRU-кэше,
+    включая отрицательные («ответа ещё не было»). Записи живут ttl секунд,
+    чтобы ответы из других процессов тоже подхватывались.
+    """
+
+    def __init__(self, db: Database, size: int = 5_000, ttl: float = 300):
+        self.db = db
+        self.size = size
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, target: str) -> Optional[Verdict]:
+        key = normalize_username(target)
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl:
+            self._cache.move_to_end(key)
+            return cached[0]
+
+        request = await self.db.vouches.latest_verdict(key)
+        verdict = None
+        if request is not None:
+            verdict = Verdict(request.id, request.admin_response_text or "", request.answer_date or request.request_date)
+        self._store(key, verdict)
+        return verdict
+
+    def remember(self, target: str, request_id: int, text: str, date: str) -> None:
+        self._store(normalize_username(target), Verdict(request_id, text, date))
+
+    def _store(self, key: str, verdict: Optional[Verdict]) -> None:
+        self._cache[key] = (verdict, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.size:
+            self._cache.popitem(last=False)
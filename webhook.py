@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    url: Optional[str],
+    path: str = "/webhook",
+    secret: Optional[str] = None,
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    delete_on_shutdown: bool = True,
+    app: Optional[web.Application] = None,
+) -> None:
+    """Запускает aiohttp-сервер, принимающий обновления от Telegram.
+
+    Если url не задан, вебхук у Telegram не регистрируется — так удобно
+    проверять бота локально, отправляя записанные обновления POST-запросами.
+    За балансировщиком с несколькими экземплярами delete_on_shutdown нужно
+    выключить, иначе остановка одного экземпляра снимет вебхук у всех.
+    """
+    webhook_url = url.rstrip("/") + path if url else None
+
+    async def register_webhook(bot: Bot):
+        if webhook_url is None:
+            logger.info("WEBHOOK_URL не задан, вебхук у Telegram не регистрируется")
+            return
+        # Без проверки get_webhook_info: при том же URL могли смениться секрет или
+        # allowed_updates, а повторный set_webhook ничего не ломает
+        await bot.set_webhook(
+            webhook_url,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info("Вебхук зарегистрирован: %s", webhook_url)
+
+    async def unregister_webhook(bot: Bot):
+        if webhook_url is not None and delete_on_shutdown:
+            await bot.delete_webhook()
+            logger.info("Вебхук снят")
+
+    dp.startup.register(register_webhook)
+    dp.shutdown.register(unregister_webhook)
+
+    app = app or web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("Сервер вебхука слушает %s:%s%s", host, port, path)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,140 @@
+"""Очередь работы админа: ожидающие заявки от самой срочной к менее срочной.
+
+Срочность — сумма сделки в рублях (currency.to_rub) с поправкой на возраст.
+Ключ кучи не меняется со временем:
+
+    ключ = created_ts / (aging_hours * 3600) - log10(1 + сумма_в_рублях)
+
+Каждые aging_hours ожидания весят столько же, сколько сумма в 10 раз больше,
+поэтому старые заявки обгоняют новые сами собой, без пересчёта кучи, и ни одна
+не застрянет навсегда. Жалобы без суммы считаются сделкой на complaint_amount.
+"""
+import asyncio
+import heapq
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from currency import to_rub
+from db import AMOUNT_TABLES, CREATED_COLUMNS, REQUEST_TABLES, Database
+
+
+@dataclass
+class WorkItem:
+    table: str
+    id: int
+    amount_rub: float
+    created_ts: int
+    key: float
+
+
+class WorkQueue:
+    """Куча ожидающих заявок из всех таблиц.
+
+    Строится из базы при запуске, новые заявки добавляются через push(),
+    отвеченные убираются через discard() — из кучи лениво, при извлечении.
+    Перед каждым pop() дочитываются заявки с id больше уже виденного: так
+    в очередь попадают и заявки, созданные другими процессами.
+
+    pop() не теряет заявку: она выдаётся в аренду на lease секунд и, если
+    ответа так и не было, возвращается в кучу с прежним ключом.
+    """
+
+    def __init__(self, db: Database, aging_hours: float = 12, complaint_amount: float = 10_000,
+                 lease: float = 600):
+        self.db = db
+        self.aging = aging_hours * 3600
+        self.complaint_amount = complaint_amount
+        self.lease = lease
+
+        self._heap: List[Tuple[float, str, int]] = []
+        self._live: Dict[Tuple[str, int], WorkItem] = {}
+        self._leased: Dict[Tuple[str, int], Tuple[WorkItem, float]] = {}
+        self._seen: Dict[str, int] = {table: 0 for table in REQUEST_TABLES}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._live) + len(self._leased)
+
+    def _item(self, table: str, item_id: int, amount: Optional[float], currency: Optional[str],
+              created_ts: Optional[int]) -> WorkItem:
+        amount_rub = to_rub(amount, currency) if table in AMOUNT_TABLES else self.complaint_amount
+        created_ts = created_ts or int(time.time())
+        key = created_ts / self.aging - math.log10(1 + max(amount_rub, 0.0))
+        return WorkItem(table, item_id, amount_rub, created_ts, key)
+
+    def _add(self, item: WorkItem) -> None:
+        self._live[(item.table, item.id)] = item
+        heapq.heappush(self._heap, (item.key, item.table, item.id))
+
+    async def load(self) -> None:
+        """Перестраивает очередь из базы."""
+        self._heap, self._live, self._leased = [], {}, {}
+        self._seen = {table: 0 for table in REQUEST_TABLES}
+        await self._catch_up()
+        self._loaded = True
+
+    async def _catch_up(self) -> None:
+        def query(conn):
+            found = []
+            for table in REQUEST_TABLES:
+                amount = "amount, currency" if table in AMOUNT_TABLES else "NULL, NULL"
+                rows = conn.execute(
+                    f"SELECT id, {amount}, {CREATED_COLUMNS[table]} FROM {table} "
+                    f"WHERE id > ? AND status='pending'", (self._seen[table],)
+                ).fetchall()
+                last_id = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+                found.append((table, rows, last_id))
+            return found
+
+        for table, rows, last_id in await self.db.run(query):
+            for item_id, amount, currency, created_ts in rows:
+                if (table, item_id) not in self._live and (table, item_id) not in self._leased:
+                    self._add(self._item(table, item_id, amount, currency, created_ts))
+            self._seen[table] = max(self._seen[table], last_id or 0)
+        # Куча из одних устаревших записей — перестраиваем, чтобы не росла
+        if len(self._heap) > 2 * len(self._live) + 1_000:
+            self._heap = [(item.key, item.table, item.id) for item in self._live.values()]
+            heapq.heapify(self._heap)
+
+    def push(self, table: str, item_id: int, amount: Optional[float] = None, currency: Optional[str] = None,
+             created_ts: Optional[int] = None) -> None:
+        """Новая заявка этого процесса — в очередь сразу, не дожидаясь следующего pop().
+
+        До load() ничего не делает: в многопроцессном режиме очередь есть только у воркера админа.
+        """
+        if self._loaded and (table, item_id) not in self._live and (table, item_id) not in self._leased:
+            self._add(self._item(table, item_id, amount, currency, created_ts))
+
+    def discard(self, table: str, item_id: int) -> None:
+        """Заявка отвечена: из очереди и из аренды."""
+        self._live.pop((table, item_id), None)
+        self._leased.pop((table, item_id), None)
+
+    def snooze(self, table: str, item_id: int) -> None:
+        """Откладывает выданную заявку: она вернётся в кучу с прежним ключом через lease секунд."""
+        leased = self._leased.get((table, item_id))
+        if leased is not None:
+            self._leased[(table, item_id)] = (leased[0], time.monotonic() + self.lease)
+
+    async def pop(self) -> Optional[WorkItem]:
+        """Самая срочная заявка за O(log n) или None, если очередь пуста."""
+        async with self._lock:
+            await self._catch_up()
+            now = time.monotonic()
+            for key, (item, deadline) in list(self._leased.items()):
+                if deadline <= now:
+                    del self._leased[key]
+                    self._add(item)
+
+            while self._heap:
+                key, table, item_id = heapq.heappop(self._heap)
+                item = self._live.get((table, item_id))
+                if item is None or item.key != key:
+                    continue
+                del self._live[(table, item_id)]
+                self._leased[(table, item_id)] = (item, now + self.lease)
+                return item
+            return None